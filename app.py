@@ -10,13 +10,16 @@ import warnings
 import logging
 import asyncio
 from pathlib import Path
-from typing import Optional, List
+from typing import Callable, Optional, List, Tuple
 from concurrent.futures import ThreadPoolExecutor
 import hashlib
 import json
 from datetime import datetime
 import uuid
 
+import aiofiles
+import numpy as np
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -27,13 +30,13 @@ logger = logging.getLogger(__name__)
 # Suprimir advertencias de FP16 en CPU (es normal)
 warnings.filterwarnings("ignore", message="FP16 is not supported on CPU")
 
-import whisper
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect, Depends
+from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect, Depends, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import uvicorn
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta
@@ -41,10 +44,39 @@ from datetime import timedelta
 # Importaciones locales
 import models
 import auth
-from database import engine, get_db
+from database import engine, ensure_columns, ensure_indexes, fill_nulls, get_db, SessionLocal
+from cache import ResultCache, PrekeyIndex
+from jobs import (
+    JOB_COMPLETED, JOB_FAILED, Job, JobScheduler, QueueFullError, SchedulerUnavailableError, SingleFlight, current_job
+)
+from batches import Batch, BatchRunner
+from pipeline import Stage
+from microbatch import MicroBatcher
+from workers import InferencePool, transcribe_window_in_worker, transcribe_batch_in_worker, detect_language_in_worker
+from model_registry import ModelRegistry
+from backends import BACKENDS, set_backend
+from live import LiveInference, LiveTranscriber
+from pagination import InvalidCursorError, decode_cursor, encode_cursor
+from uploads import (
+    UploadStore, UploadNotFoundError, UploadOffsetError, UploadTooLargeError, UploadChecksumError
+)
+from pcm_store import PcmStore
+from blob_store import BlobNotFoundError, TranscriptBlobs, open_blob_store
+from search import (
+    SearchUnavailableError, advance_backfill, backfill_progress, ensure_search_index, index_transcript,
+    search_segments
+)
+from inference import (
+    SAMPLE_RATE, decode_audio, SegmentStitcher, detect_language, empty_result, finish_result, original_segments, plan_windows,
+    prepare_audio, transcribe_array, transcribe_batch, transcribe_prepared
+)
 
-# Crear tablas en la base de datos
+# Crear tablas en la base de datos (y añadir las columnas e índices nuevos a las ya existentes)
 models.Base.metadata.create_all(bind=engine)
+ensure_columns(models.Transcript.__table__)
+ensure_indexes(models.Transcript.__table__)
+# Los registros sin fecha no se podrían paginar: se les asigna la de la migración
+fill_nulls(models.Transcript.__table__.c.created_at, datetime.utcnow())
 
 # Modelos Pydantic para validación
 class UserCreate(BaseModel):
@@ -64,8 +96,15 @@ class BatchTranscriptionRequest(BaseModel):
     files: List[str]  # Lista de IDs de archivos
     language: Optional[str] = None
     task: str = "transcribe"
+    model: Optional[str] = None
+    vad: Optional[bool] = None
     output_formats: List[str] = ["txt"]
 
+class UploadCreateRequest(BaseModel):
+    filename: str
+    size: int
+    sha256: Optional[str] = None  # Si ya hay un archivo con ese contenido, no hace falta enviarlo
+
 class TranscriptionResult(BaseModel):
     id: str
     text: str
@@ -77,8 +116,22 @@ class TranscriptionResult(BaseModel):
 
 # Configuración
 MAX_FILE_SIZE = 500 * 1024 * 1024  # 500MB
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))  # 1MB por bloque
+HASH_CHUNK_SIZE = 1024 * 1024  # Bloques de 1MB para calcular hashes
+QUICK_KEY_BLOCK = 64 * 1024  # Tamaño de cada bloque muestreado por la clave rápida
 SUPPORTED_FORMATS = {".wav", ".mp3", ".m4a", ".ogg", ".flac", ".webm", ".mp4", ".wmv"}
 WHISPER_MODELS = ["tiny", "base", "small", "medium", "large"]
+CACHE_KEY_VERSION = 1  # Incrementar si cambia el formato de los resultados cacheados
+VAD_ENABLED = os.getenv("VAD_ENABLED", "0").lower() in ("1", "true", "yes")  # Recortar silencios antes de Whisper
+# Audios largos: ventanas que se transcriben en paralelo en el pool de procesos
+LONG_AUDIO_WINDOW_SECONDS = float(os.getenv("LONG_AUDIO_WINDOW_SECONDS", 300))  # 0 = no dividir
+LONG_AUDIO_OVERLAP_SECONDS = float(os.getenv("LONG_AUDIO_OVERLAP_SECONDS", 2))
+# Transcripción con resultados parciales: ventanas cortas para enviar texto cuanto antes
+STREAM_WINDOW_SECONDS = float(os.getenv("STREAM_WINDOW_SECONDS", 30))
+# Transcripción en directo por WebSocket (audio PCM enviado por el cliente)
+LIVE_MAX_SESSIONS = int(os.getenv("LIVE_MAX_SESSIONS", 2))
+LIVE_WINDOW_SECONDS = float(os.getenv("LIVE_WINDOW_SECONDS", 15))  # Audio sin confirmar que se vuelve a decodificar
+LIVE_STEP_SECONDS = float(os.getenv("LIVE_STEP_SECONDS", 1))  # Audio nuevo mínimo entre pasos de inferencia
 
 app = FastAPI(
     title="Transcripción de Audio a Texto - Versión Reforzada",
@@ -100,43 +153,430 @@ UPLOAD_DIR = Path("uploads")
 TRANSCRIPTS_DIR = Path("transcripts")
 CACHE_DIR = Path("cache")
 TEMP_DIR = Path("temp")
+PCM_DIR = Path("pcm")
 
-for dir_path in [UPLOAD_DIR, TRANSCRIPTS_DIR, CACHE_DIR, TEMP_DIR]:
+for dir_path in [UPLOAD_DIR, TRANSCRIPTS_DIR, CACHE_DIR, TEMP_DIR, PCM_DIR]:
     dir_path.mkdir(exist_ok=True)
 
-# Pool de hilos para procesamiento
-executor = ThreadPoolExecutor(max_workers=4)
+# Índice de claves rápidas (tamaño + bloques muestreados) -> SHA256 de archivos ya procesados.
+# Solo conserva las claves de archivos con algún resultado en el cache.
+prekey_index = PrekeyIndex(CACHE_DIR / "prekeys.idx")
+
+# Cache de resultados (presupuesto en bytes, política de expulsión, TTL y nivel en memoria)
+result_cache = ResultCache(
+    CACHE_DIR,
+    max_bytes=int(os.getenv("CACHE_MAX_BYTES", 1024 * 1024 * 1024)),  # 1GB
+    policy=os.getenv("CACHE_POLICY", "lru"),
+    ttl_seconds=float(os.getenv("CACHE_TTL_SECONDS", 0)),  # 0 = sin caducidad
+    hot_entries=int(os.getenv("CACHE_HOT_ENTRIES", 64)),
+    hot_max_bytes=int(os.getenv("CACHE_HOT_MAX_BYTES", 64 * 1024 * 1024)),  # 64MB
+    compress=os.getenv("CACHE_COMPRESS", "1").lower() in ("1", "true", "yes"),
+    on_remove=prekey_index.discard
+)
+prekey_index.prune(lambda cache_key: cache_key in result_cache)
+
+# Audio decodificado a PCM 16 kHz por hash de contenido (0 = no guardar)
+pcm_store = PcmStore(PCM_DIR, max_bytes=int(os.getenv("PCM_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024)))
+
+# Texto y segmentos de las transcripciones guardadas: blobs comprimidos fuera de la base de datos.
+# BLOB_STORE_URL es un directorio local o s3://bucket/prefijo (S3_ENDPOINT_URL para MinIO y similares)
+transcript_blobs = TranscriptBlobs(
+    open_blob_store(os.getenv("BLOB_STORE_URL", "blobs"), endpoint_url=os.getenv("S3_ENDPOINT_URL") or None),
+    chunk_segments=int(os.getenv("BLOB_CHUNK_SEGMENTS", 500))
+)
+
+# Índice de búsqueda de texto completo sobre los segmentos de las transcripciones (FTS5 en SQLite).
+# Las transcripciones guardadas antes de crearlo se indexan por lotes en segundo plano tras arrancar.
+ensure_search_index(engine)
+SEARCH_BACKFILL_BATCH = int(os.getenv("SEARCH_BACKFILL_BATCH", 200))
+search_backfill_status = {"status": "idle", "indexed": 0, "last_id": None, "until_id": None}
 
-# Cache de modelos
-model_cache = {}
+def backfill_search_batch() -> bool:
+    """
+    Indexa el siguiente lote de transcripciones pendientes. Devuelve False cuando no
+    queda ninguna. Bloqueante.
+    """
+    db = SessionLocal()
+    try:
+        progress = backfill_progress(db)
+        if progress is None:
+            return False
+        last_id, until_id = progress
+        search_backfill_status.update(last_id=last_id, until_id=until_id)
+        records = db.query(models.Transcript).filter(
+            models.Transcript.id > last_id, models.Transcript.id <= until_id
+        ).order_by(models.Transcript.id).limit(SEARCH_BACKFILL_BATCH).all()
+
+        # Leer los blobs antes de escribir: la transacción solo toma el bloqueo de escritura al final
+        contents = []
+        for record in records:
+            if record.blob_ref is None:
+                contents.append((record, {"text": record.text or "", "segments": []}))
+                continue
+            try:
+                contents.append((record, transcript_blobs.get(record.blob_ref)))
+            except BlobNotFoundError as e:
+                logger.warning(f"Transcripción {record.id} sin indexar: {e}")
+
+        for record, content in contents:
+            index_transcript(db, record.id, record.user_id, content["text"], content["segments"], record.duration)
+        new_last_id = records[-1].id if records else None
+        if not advance_backfill(db, last_id, new_last_id):
+            # Otro proceso del servidor indexó este lote a la vez
+            db.rollback()
+            return True
+        db.commit()
+        search_backfill_status["indexed"] += len(contents)
+        search_backfill_status["last_id"] = new_last_id
+        return new_last_id is not None
+    finally:
+        db.close()
 
-# Cargar modelo Whisper
+async def backfill_search_index():
+    """Indexa en segundo plano las transcripciones guardadas antes de crear el índice"""
+    search_backfill_status["status"] = "running"
+    try:
+        while await run_blocking(backfill_search_batch):
+            # Ceder entre lotes para no acaparar el pool de hilos ni la base de datos
+            await asyncio.sleep(0)
+    except Exception as e:
+        search_backfill_status["status"] = "error"
+        search_backfill_status["detail"] = str(e)
+        logger.error(f"Error indexando transcripciones para la búsqueda: {e}")
+        return
+    search_backfill_status["status"] = "done"
+    if search_backfill_status["indexed"]:
+        logger.info(f"Índice de búsqueda completado: {search_backfill_status['indexed']} transcripciones")
+
+# Archivos subidos (direccionados por SHA256) y subidas por partes en curso
+upload_store = UploadStore(
+    UPLOAD_DIR,
+    max_size=MAX_FILE_SIZE,
+    expire_seconds=float(os.getenv("UPLOAD_EXPIRE_SECONDS", 24 * 3600))
+)
+
+# Slots de inferencia: trabajos de transcripción que se ejecutan a la vez.
+# Cada slot usa TORCH_THREADS hilos de torch para no sobresuscribir la CPU.
+# Con INFERENCE_EXECUTOR=process cada slot es un proceso con su propio intérprete.
+CPU_COUNT = os.cpu_count() or 1
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread").lower()  # "thread" o "process"
+INFERENCE_SLOTS = int(os.getenv(
+    "INFERENCE_SLOTS", max(1, CPU_COUNT // 4) if INFERENCE_EXECUTOR == "process" else 1
+))
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", max(1, CPU_COUNT // INFERENCE_SLOTS)))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 32))  # Trabajos en espera antes de responder 429
+JOB_RETRY_AFTER = 10  # Segundos sugeridos al cliente cuando la cola está llena
+
+# Pipeline: cada trabajo pasa por decodificación, inferencia y exportación, cada etapa
+# con su concurrencia y su cola acotada, para que la decodificación y la escritura de
+# resultados de unos archivos se solapen con la inferencia de otros
+DECODE_CONCURRENCY = int(os.getenv("DECODE_CONCURRENCY", 2))
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", 2))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 2))  # Trabajos en espera por etapa
+decode_stage = Stage("decode", DECODE_CONCURRENCY, PIPELINE_QUEUE_SIZE)
+inference_stage = Stage("inference", INFERENCE_SLOTS, PIPELINE_QUEUE_SIZE)
+export_stage = Stage("export", EXPORT_CONCURRENCY, PIPELINE_QUEUE_SIZE)
+
+# Micro-lotes: los audios cortos de trabajos distintos que llegan a la vez se transcriben
+# juntos en una sola pasada del modelo (hasta MICROBATCH_SIZE por lote, esperando como
+# mucho MICROBATCH_MAX_WAIT_MS a que se llene). MICROBATCH_SIZE=1 lo desactiva.
+MICROBATCH_SIZE = int(os.getenv("MICROBATCH_SIZE", 8))
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("MICROBATCH_MAX_WAIT_MS", 50))
+MICROBATCH_MAX_SECONDS = min(30.0, float(os.getenv("MICROBATCH_MAX_SECONDS", 30)))  # Una ventana de Whisper
+MICROBATCH_ENABLED = MICROBATCH_SIZE > 1
+# Los audios de un micro-lote esperan en su propia etapa, sin ocupar los slots de inferencia
+batch_inference_stage = Stage(
+    "inference_batch", MICROBATCH_SIZE * INFERENCE_SLOTS if MICROBATCH_ENABLED else 1, PIPELINE_QUEUE_SIZE
+)
+# Trabajos en curso a la vez en el planificador: los suficientes para llenar todas las etapas
+JOB_CONCURRENCY = int(os.getenv(
+    "JOB_CONCURRENCY",
+    INFERENCE_SLOTS + DECODE_CONCURRENCY + EXPORT_CONCURRENCY
+    + (batch_inference_stage.concurrency if MICROBATCH_ENABLED else 0)
+))
+
+# Pool de hilos para inferencia (un hilo por slot)
+executor = ThreadPoolExecutor(max_workers=INFERENCE_SLOTS)
+scheduler = JobScheduler(slots=JOB_CONCURRENCY, max_queue=JOB_QUEUE_SIZE)
+# Transcripciones en curso por clave de cache: las peticiones idénticas esperan a la primera
+transcription_flights = SingleFlight()
+# Archivos de un mismo lote en el planificador a la vez
+BATCH_PARALLELISM = int(os.getenv("BATCH_PARALLELISM", JOB_CONCURRENCY))
+batch_runner = BatchRunner(scheduler, parallelism=BATCH_PARALLELISM)
+
+# Registro de modelos: se cargan bajo demanda y se descargan por LRU o inactividad
+MODEL_MEMORY_BUDGET = int(os.getenv("MODEL_MEMORY_BUDGET_MB", 4096)) * 1024 * 1024
+MODEL_IDLE_SECONDS = float(os.getenv("MODEL_IDLE_SECONDS", 900))  # 0 = no descargar por inactividad
+
+# Modelo Whisper por defecto. Se carga en segundo plano al arrancar (ver warm_up_models),
+# así el servidor acepta conexiones sin esperar a torch ni a los pesos del modelo.
 MODEL_SIZE = os.getenv("WHISPER_MODEL", "base")
-logger.info(f"Cargando modelo Whisper: {MODEL_SIZE}...")
-
-try:
-    model = whisper.load_model(MODEL_SIZE)
-    logger.info("Modelo cargado exitosamente!")
-except Exception as e:
-    logger.error(f"Error al cargar el modelo: {e}")
-    logger.info("Intentando con modelo 'tiny' como alternativa...")
+# Motor de inferencia: torch (float32), torch-int8 (cuantizado) o ctranslate2 (faster-whisper)
+WHISPER_BACKEND = os.getenv("WHISPER_BACKEND", "torch").lower()
+inference_backend = set_backend(WHISPER_BACKEND, TORCH_THREADS)
+
+def load_whisper_model(name: str):
+    """Carga un modelo Whisper con el motor configurado (importa whisper/torch solo cuando hace falta)"""
+    return inference_backend.load(name)
+
+# El modelo por defecto queda fijado; el resto se carga en la primera petición que lo use
+model_registry = ModelRegistry(
+    load_whisper_model,
+    max_bytes=MODEL_MEMORY_BUDGET,
+    idle_seconds=MODEL_IDLE_SECONDS,
+    pinned={MODEL_SIZE},
+    size_of=inference_backend.model_bytes
+)
+
+# Sesiones en directo: hilos y registro de modelos propios (una instancia más de cada
+# modelo en uso), para que sus pasos no esperen detrás de un archivo largo
+live_inference = LiveInference(
+    ModelRegistry(
+        load_whisper_model,
+        max_bytes=MODEL_MEMORY_BUDGET,
+        idle_seconds=MODEL_IDLE_SECONDS,
+        size_of=inference_backend.model_bytes
+    ),
+    max_workers=LIVE_MAX_SESSIONS
+)
+
+# Pool de procesos de inferencia (solo con INFERENCE_EXECUTOR=process, se crea tras cargar el modelo)
+inference_pool = None
+
+# Tarea de calentamiento: carga del modelo por defecto y arranque del pool de inferencia
+warmup_task: Optional[asyncio.Task] = None
+
+def load_default_model():
+    """Carga el modelo por defecto (con 'tiny' como alternativa) y prepara la inferencia. Bloqueante."""
+    global MODEL_SIZE, inference_pool
+
+    # Limitar los hilos intra-op de torch para que los slots no compitan por la CPU
+    import torch
+    torch.set_num_threads(TORCH_THREADS)
+
+    logger.info(f"Cargando modelo Whisper: {MODEL_SIZE} (motor {WHISPER_BACKEND})...")
     try:
-        model = whisper.load_model("tiny")
-        MODEL_SIZE = "tiny"
-        logger.info("Modelo 'tiny' cargado exitosamente!")
-    except Exception as e2:
-        logger.critical(f"Error crítico: No se pudo cargar ningún modelo. {e2}")
-        raise
+        model = load_whisper_model(MODEL_SIZE)
+        logger.info("Modelo cargado exitosamente!")
+    except Exception as e:
+        logger.error(f"Error al cargar el modelo: {e}")
+        logger.info("Intentando con modelo 'tiny' como alternativa...")
+        try:
+            model = load_whisper_model("tiny")
+            MODEL_SIZE = "tiny"
+            model_registry.pinned = {MODEL_SIZE}
+            logger.info("Modelo 'tiny' cargado exitosamente!")
+        except Exception as e2:
+            logger.critical(f"Error crítico: No se pudo cargar ningún modelo. {e2}")
+            raise
+
+    model_registry.add(MODEL_SIZE, model)
+
+    if INFERENCE_EXECUTOR == "process":
+        inference_pool = InferencePool(
+            model,
+            model_name=MODEL_SIZE,
+            backend=inference_backend,
+            processes=INFERENCE_SLOTS,
+            torch_threads=TORCH_THREADS,
+            model_memory_budget=MODEL_MEMORY_BUDGET,
+            model_idle_seconds=MODEL_IDLE_SECONDS,
+            start_method=os.getenv("INFERENCE_START_METHOD") or None
+        )
+        inference_pool.start()
+
+async def wait_until_ready():
+    """Espera a que termine el calentamiento; si falló, la transcripción no está disponible"""
+    global warmup_task
+    if warmup_task is None:
+        warmup_task = asyncio.ensure_future(run_blocking(load_default_model))
+    try:
+        await asyncio.shield(warmup_task)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"El modelo no está disponible: {e}")
+
+def is_ready() -> bool:
+    return warmup_task is not None and warmup_task.done() and warmup_task.exception() is None
+
+# En Windows ffmpeg puede fallar con rutas que contienen espacios; como alternativa
+# se usa la ruta corta (formato 8.3). Desactivado por defecto fuera de Windows.
+WINDOWS_SHORT_PATHS = os.getenv(
+    "WINDOWS_SHORT_PATHS", "1" if os.name == "nt" else "0"
+).lower() in ("1", "true", "yes")
 
 # Funciones de utilidad
+def get_short_path_name(long_name: str) -> str:
+    """Convierte una ruta larga a formato 8.3 de Windows"""
+    import ctypes
+    from ctypes import wintypes
+
+    _GetShortPathNameW = ctypes.windll.kernel32.GetShortPathNameW
+    _GetShortPathNameW.argtypes = [wintypes.LPCWSTR, wintypes.LPWSTR, wintypes.DWORD]
+    _GetShortPathNameW.restype = wintypes.DWORD
+
+    output_buf_size = 0
+    while True:
+        output_buf = ctypes.create_unicode_buffer(output_buf_size)
+        needed = _GetShortPathNameW(long_name, output_buf, output_buf_size)
+        if needed == 0:
+            raise OSError(f"GetShortPathNameW falló para {long_name}")
+        if output_buf_size >= needed:
+            return output_buf.value
+        output_buf_size = needed
+
+def resolve_whisper_path(file_path: Path) -> str:
+    """Devuelve la ruta absoluta que se entrega a Whisper, sin copiar el archivo"""
+    abs_path = str(file_path.resolve())
+    if WINDOWS_SHORT_PATHS and os.name == "nt" and " " in abs_path:
+        try:
+            short_path = get_short_path_name(abs_path)
+            logger.info(f"Usando ruta corta de Windows: {short_path}")
+            return short_path
+        except Exception as e:
+            logger.warning(f"No se pudo obtener ruta corta, usando ruta normal: {e}")
+    return abs_path
+
 def get_file_hash(file_path: Path) -> str:
-    """Calcula el hash SHA256 de un archivo para cache"""
+    """Calcula el hash SHA256 de un archivo para cache (bloqueante, usar fuera del event loop)"""
     hash_sha256 = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_sha256.update(chunk)
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(file_path, "rb", buffering=0) as f:
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            hash_sha256.update(view[:read])
     return hash_sha256.hexdigest()
 
+def get_quick_key(file_path: Path) -> str:
+    """
+    Clave rápida de un archivo: tamaño más tres bloques muestreados (inicio, mitad y final).
+
+    No sustituye al SHA256 (puede colisionar), pero si nunca se ha visto permite
+    descartar un acierto de cache sin leer el archivo completo.
+    """
+    size = file_path.stat().st_size
+    hasher = hashlib.blake2b(str(size).encode("ascii"), digest_size=16)
+    with open(file_path, "rb") as f:
+        for offset in (0, max(0, size // 2 - QUICK_KEY_BLOCK // 2), max(0, size - QUICK_KEY_BLOCK)):
+            f.seek(offset)
+            hasher.update(f.read(QUICK_KEY_BLOCK))
+    return hasher.hexdigest()
+
+async def run_blocking(func, *args):
+    """Ejecuta una función bloqueante de E/S en el pool por defecto, sin bloquear el event loop"""
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+async def save_upload_stream(upload: UploadFile, dest_path: Path, max_size: int = MAX_FILE_SIZE) -> Tuple[int, str]:
+    """
+    Guarda un archivo subido en disco por bloques.
+
+    Valida el tamaño máximo y calcula el hash SHA256 en la misma pasada, de modo
+    que la memoria usada por subida es de un bloque (UPLOAD_CHUNK_SIZE) sin importar
+    el tamaño del archivo.
+
+    Returns:
+        Tupla (tamaño en bytes, hash SHA256 hexadecimal)
+    """
+    hash_sha256 = hashlib.sha256()
+    total_size = 0
+    try:
+        async with aiofiles.open(dest_path, "wb") as out_file:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                total_size += len(chunk)
+                if total_size > max_size:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Archivo demasiado grande. Máximo permitido: {max_size / (1024*1024):.0f}MB"
+                    )
+                hash_sha256.update(chunk)
+                await out_file.write(chunk)
+    except BaseException:
+        # No dejar archivos parciales en disco
+        try:
+            dest_path.unlink()
+        except OSError:
+            pass
+        raise
+    return total_size, hash_sha256.hexdigest()
+
+def resolve_model_name(model_name: Optional[str]) -> str:
+    """Valida el modelo pedido; sin modelo se usa el modelo por defecto"""
+    if not model_name:
+        return MODEL_SIZE
+    if model_name not in WHISPER_MODELS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Modelo no soportado: {model_name}. Modelos disponibles: {', '.join(WHISPER_MODELS)}"
+        )
+    return model_name
+
+def build_transcribe_options(language: Optional[str], task: str) -> dict:
+    """Opciones que se pasan a model.transcribe"""
+    transcribe_options = {
+        "task": task,
+        "verbose": False,
+        "fp16": False
+    }
+
+    if language:
+        transcribe_options["language"] = language
+
+    return transcribe_options
+
+def build_cache_options(transcribe_options: dict, vad: bool, stream: bool) -> dict:
+    """
+    Opciones de la clave de cache: las de decodificación más las que cambian el resultado.
+
+    El VAD cambia el audio que ve el modelo, y la división en ventanas cambia los
+    segmentos, porque cada ventana se decodifica por separado. Con stream las ventanas
+    son de STREAM_WINDOW_SECONDS. Sin stream son de LONG_AUDIO_WINDOW_SECONDS en el pool
+    de procesos, y en hilos se transcribe el archivo entero (0).
+
+    Los audios de hasta MICROBATCH_MAX_SECONDS se decodifican en micro-lotes, que no
+    siguen el mismo camino que model.transcribe (una sola pasada a temperatura 0 y otro
+    tratamiento de las marcas de tiempo), así que el texto puede diferir. La duración
+    no se conoce antes de decodificar, pero para un mismo audio el camino solo depende
+    de ese umbral (0 si los micro-lotes están desactivados): con él en la clave, cambiar
+    MICROBATCH_SIZE o MICROBATCH_MAX_SECONDS no sirve resultados del otro camino.
+    """
+    if stream:
+        window_seconds = STREAM_WINDOW_SECONDS
+    elif INFERENCE_EXECUTOR == "process":
+        window_seconds = LONG_AUDIO_WINDOW_SECONDS
+    else:
+        window_seconds = 0
+    return {
+        **transcribe_options,
+        "vad": vad,
+        "window_seconds": window_seconds,
+        "microbatch_max_seconds": MICROBATCH_MAX_SECONDS if MICROBATCH_ENABLED else 0,
+    }
+
+def get_cache_key(file_hash: str, model_size: str, transcribe_options: dict) -> str:
+    """
+    Calcula la clave de cache de un resultado.
+
+    Combina el hash del audio con el modelo, el motor de inferencia y las opciones
+    que afectan al resultado (tarea, idioma y opciones de decodificación), de modo
+    que el mismo audio pedido con otros parámetros no devuelva un resultado incorrecto.
+    """
+    # "verbose" solo afecta a la salida por consola, no al resultado
+    decode_options = {k: v for k, v in transcribe_options.items() if k != "verbose"}
+    key_data = {
+        "version": CACHE_KEY_VERSION,
+        "audio": file_hash,
+        "model": model_size,
+        "backend": WHISPER_BACKEND,
+        "options": decode_options,
+    }
+    key_json = json.dumps(key_data, sort_keys=True, ensure_ascii=True)
+    return hashlib.sha256(key_json.encode("utf-8")).hexdigest()
+
 def format_timestamp(seconds: float) -> str:
     """Formatea segundos a timestamp SRT (HH:MM:SS,mmm)"""
     hours = int(seconds // 3600)
@@ -179,228 +619,492 @@ def create_vtt_content(segments: List[dict]) -> str:
 
     return "\n".join(vtt_lines)
 
-async def process_transcription(
+async def load_pcm(
+    whisper_path: str,
+    file_hash: Optional[str],
+    hash_future: Optional[asyncio.Future] = None
+) -> Tuple[np.ndarray, Optional[Path]]:
+    """
+    Devuelve el PCM 16 kHz del archivo y la ruta de su artefacto en pcm_store, fijado
+    hasta que se llame a pcm_store.release().
+
+    Si el audio ya se decodificó antes se abre con mmap sin lanzar ffmpeg; si no,
+    se decodifica (mientras tanto termina el hash en segundo plano, si lo hay) y se
+    guarda para la próxima vez.
+    """
+    if file_hash is not None:
+        pcm_path = pcm_store.lookup(file_hash)
+        if pcm_path is not None:
+            logger.info(f"Reutilizando audio decodificado: {pcm_path.name}")
+            return pcm_store.load(pcm_path), pcm_path
+
+    audio = await run_blocking(decode_audio, whisper_path)
+    if file_hash is None and hash_future is not None:
+        file_hash = await hash_future
+    if file_hash is None:
+        return audio, None
+    pcm_path = await run_blocking(pcm_store.put, file_hash, audio)
+    if pcm_path is None:
+        return audio, None
+    # Usar el mapeo en lugar de la copia en memoria, que se libera
+    return pcm_store.load(pcm_path), pcm_path
+
+def store_cached_result(
     file_path: Path,
-    language: Optional[str] = None,
-    task: str = "transcribe",
-    websocket: Optional[WebSocket] = None
+    quick_key: Optional[str],
+    file_hash: str,
+    cache_key: str,
+    transcription: dict
+):
+    """Registra la clave rápida del archivo y guarda el resultado en cache. Bloqueante."""
+    if quick_key is None:
+        quick_key = get_quick_key(file_path)
+    prekey_index.add(quick_key, file_hash, cache_key)
+    result_cache.put(cache_key, transcription)
+
+# Recibe los segmentos nuevos (tiempos del audio original) y la fracción del audio ya transcrita
+SegmentsCallback = Callable[[List[dict], float], None]
+
+def run_transcription(
+    audio: np.ndarray,
+    model_name: str,
+    transcribe_options: dict,
+    vad: bool,
+    on_segments: Optional[SegmentsCallback] = None
 ) -> dict:
-    """Procesa la transcripción de un archivo de audio"""
-    try:
-        # Calcular hash para cache
-        file_hash = get_file_hash(file_path)
-        cache_file = CACHE_DIR / f"{file_hash}.json"
+    """
+    Transcribe un archivo completo con el modelo del registro (modo hilos).
 
-        # Verificar cache
-        if cache_file.exists():
-            logger.info(f"Usando resultado cacheado para {file_path.name}")
-            with open(cache_file, "r", encoding="utf-8") as f:
-                return json.load(f)
+    Con on_segments el audio se transcribe por ventanas de STREAM_WINDOW_SECONDS y
+    el callback recibe los segmentos de cada ventana en cuanto se decodifican.
+    """
+    # El VAD no necesita el modelo: se hace fuera de su lock
+    prepared = prepare_audio(audio, vad=vad)
+    if not prepared.has_speech:
+        return empty_result(prepared, transcribe_options)
+
+    with model_registry.acquire(model_name) as loaded:
+        with loaded.lock:
+            if on_segments is None:
+                return transcribe_prepared(loaded.model, prepared, transcribe_options)
+
+            windows = plan_windows(prepared.audio, STREAM_WINDOW_SECONDS, LONG_AUDIO_OVERLAP_SECONDS)
+            if len(windows) > 1 and not transcribe_options.get("language"):
+                transcribe_options = {
+                    **transcribe_options, "language": detect_language(loaded.model, prepared.audio)
+                }
+            stitcher = SegmentStitcher(SAMPLE_RATE)
+            for window in windows:
+                result = transcribe_array(loaded.model, prepared.audio[window.start:window.end], transcribe_options)
+                new_segments = stitcher.add(window, result)
+                on_segments(original_segments(new_segments, prepared), window.own_end / len(prepared.audio))
+
+    return finish_result(stitcher.result(), prepared)
+
+async def run_windowed_inference(
+    audio: np.ndarray,
+    pcm_path: Optional[Path],
+    model_name: str,
+    transcribe_options: dict,
+    vad: bool,
+    on_segments: Optional[SegmentsCallback] = None
+) -> dict:
+    """
+    Transcribe un archivo en el pool de procesos.
 
-        # Enviar progreso inicial
-        if websocket:
-            await websocket.send_json({"status": "processing", "progress": 10, "message": "Iniciando transcripción..."})
+    Los audios más largos que LONG_AUDIO_WINDOW_SECONDS (STREAM_WINDOW_SECONDS si se
+    piden resultados parciales) se dividen en ventanas cortadas en silencios que se
+    reparten entre los procesos, y los segmentos se vuelven a unir con tiempos e ids
+    continuos. Las ventanas se entregan a on_segments en orden según van terminando.
+    """
+    loop = asyncio.get_running_loop()
+    prepared = await run_blocking(prepare_audio, audio, vad)
+    if not prepared.has_speech:
+        return empty_result(prepared, transcribe_options)
+
+    window_seconds = STREAM_WINDOW_SECONDS if on_segments is not None else LONG_AUDIO_WINDOW_SECONDS
+    windows = plan_windows(prepared.audio, window_seconds, LONG_AUDIO_OVERLAP_SECONDS)
+    # Los trabajadores leen el PCM desde disco mapeado en memoria en lugar de recibirlo serializado:
+    # el artefacto de pcm_store si el audio no se recortó, o un temporal con el audio recortado
+    temp_pcm_path = None
+    if pcm_path is None or prepared.audio is not audio:
+        temp_pcm_path = pcm_path = TEMP_DIR / f"pcm_{uuid.uuid4().hex}.npy"
+        await run_blocking(np.save, pcm_path, prepared.audio)
+    stitcher = SegmentStitcher(SAMPLE_RATE)
+    futures = []
+    try:
+        # Todas las ventanas deben usar el mismo idioma: se detecta una vez al principio
+        if len(windows) > 1 and not transcribe_options.get("language"):
+            language = await loop.run_in_executor(
+                inference_pool.executor, detect_language_in_worker, str(pcm_path), model_name
+            )
+            transcribe_options = {**transcribe_options, "language": language}
+            logger.info(f"Idioma detectado: {language}")
+
+        if len(windows) > 1:
+            logger.info(f"Audio de {prepared.duration:.0f}s dividido en {len(windows)} ventanas")
+        futures = [
+            loop.run_in_executor(
+                inference_pool.executor,
+                transcribe_window_in_worker,
+                str(pcm_path),
+                window.start,
+                window.end,
+                model_name,
+                transcribe_options
+            )
+            for window in windows
+        ]
+        for window, future in zip(windows, futures):
+            new_segments = stitcher.add(window, await future)
+            if on_segments is not None:
+                on_segments(original_segments(new_segments, prepared), window.own_end / len(prepared.audio))
+    finally:
+        for future in futures:
+            future.cancel()
+        await asyncio.gather(*futures, return_exceptions=True)
+        if temp_pcm_path is not None:
+            remove_temp_file(temp_pcm_path)
+
+    return finish_result(stitcher.result(), prepared)
+
+def run_batch_transcription(audios: List[np.ndarray], model_name: str, transcribe_options: dict) -> List[dict]:
+    """Transcribe un micro-lote con el modelo del registro (modo hilos)"""
+    with model_registry.acquire(model_name) as loaded:
+        with loaded.lock:
+            return transcribe_batch(loaded.model, audios, transcribe_options)
+
+async def run_micro_batch(key: tuple, audios: List[np.ndarray]) -> List[dict]:
+    """Ejecuta un micro-lote en el executor de hilos o en el pool de procesos"""
+    model_name, options_items = key
+    transcribe_options = dict(options_items)
+    loop = asyncio.get_running_loop()
+    if inference_pool is not None:
+        return await loop.run_in_executor(
+            inference_pool.executor, transcribe_batch_in_worker, audios, model_name, transcribe_options
+        )
+    return await loop.run_in_executor(
+        executor, run_batch_transcription, audios, model_name, transcribe_options
+    )
 
-        # Configurar opciones de transcripción
-        transcribe_options = {
-            "task": task,
-            "verbose": False,
-            "fp16": False
-        }
+micro_batcher = MicroBatcher(
+    run_micro_batch,
+    max_batch=MICROBATCH_SIZE,
+    max_wait=MICROBATCH_MAX_WAIT_MS / 1000,
+    max_concurrent=INFERENCE_SLOTS
+)
 
-        if language:
-            transcribe_options["language"] = language
+async def run_batched_inference(
+    audio: np.ndarray,
+    model_name: str,
+    transcribe_options: dict,
+    vad: bool,
+    on_segments: Optional[SegmentsCallback] = None
+) -> dict:
+    """
+    Transcribe un audio corto dentro de un micro-lote.
 
-        # Callback de progreso
-        def progress_callback(progress):
-            if websocket:
-                asyncio.create_task(
-                    websocket.send_json({
-                        "status": "processing",
-                        "progress": 10 + int(progress * 80),
-                        "message": f"Transcribiendo... {int(progress * 100)}%"
-                    })
-                )
+    Solo se agrupan audios con el mismo modelo y las mismas opciones; el idioma, si
+    no se indica, se detecta para cada audio del lote por separado.
+    """
+    prepared = await run_blocking(prepare_audio, audio, vad)
+    if not prepared.has_speech:
+        return empty_result(prepared, transcribe_options)
+
+    key = (model_name, tuple(sorted(transcribe_options.items())))
+    result = finish_result(await micro_batcher.submit(key, np.ascontiguousarray(prepared.audio)), prepared)
+    if on_segments is not None:
+        on_segments(result["segments"], 1.0)
+    return result
+
+async def run_inference(
+    audio: np.ndarray,
+    pcm_path: Optional[Path],
+    model_name: str,
+    transcribe_options: dict,
+    vad: bool,
+    on_segments: Optional[SegmentsCallback] = None
+) -> dict:
+    """Ejecuta la transcripción en el executor de hilos o en el pool de procesos"""
+    if inference_pool is not None:
+        return await run_windowed_inference(
+            audio, pcm_path, model_name, transcribe_options, vad, on_segments
+        )
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, run_transcription, audio, model_name, transcribe_options, vad, on_segments
+    )
 
-        # Verificar que el archivo existe antes de transcribir
-        if not file_path.exists():
-            raise Exception(f"Archivo temporal no encontrado: {file_path}")
+async def process_transcription(
+    file_path: Path,
+    language: Optional[str] = None,
+    task: str = "transcribe",
+    file_hash: Optional[str] = None,
+    model_name: Optional[str] = None,
+    vad: Optional[bool] = None,
+    stream: bool = False
+) -> dict:
+    """
+    Procesa la transcripción de un archivo de audio.
 
-        logger.info(f"Iniciando transcripción de {file_path}")
+    El progreso se publica como eventos del trabajo en curso (ver Job.subscribe); con
+    stream=True se publican además los segmentos a medida que se decodifican.
+    """
+    model_name = model_name or MODEL_SIZE
+    vad = VAD_ENABLED if vad is None else vad
+    job = current_job()
 
-        # Convertir a ruta absoluta y asegurar que es una cadena
-        abs_file_path = str(file_path.resolve())
-        
-        # Verificar nuevamente con la ruta absoluta
-        if not os.path.exists(abs_file_path):
-            raise Exception(f"Archivo no encontrado en ruta absoluta: {abs_file_path}")
-        
-        # Verificar que el archivo es accesible
-        try:
-            with open(abs_file_path, 'rb') as test_file:
-                test_file.read(1)
-        except Exception as e:
-            raise Exception(f"Archivo no es accesible: {abs_file_path}, error: {e}")
-        
-        logger.info(f"Ruta absoluta verificada y accesible: {abs_file_path}")
-
-        # Función auxiliar para ejecutar la transcripción en el executor
-        def run_transcription():
-            # Crear una copia del archivo en una ruta más simple (sin espacios problemáticos)
-            import shutil
-            import subprocess
-            
-            # Obtener la extensión del archivo original
-            original_path = Path(abs_file_path)
-            file_ext = original_path.suffix if original_path.suffix else '.wav'
-            
-            # En Windows, usar una ruta absolutamente simple sin espacios
-            # Usar el directorio temp del proyecto en lugar del sistema
-            temp_dir = str(TEMP_DIR.resolve())
-            simple_filename = f"w_{uuid.uuid4().hex[:8]}{file_ext}"
-            simple_path = os.path.join(temp_dir, simple_filename)
-            
-            # En Windows, obtener ruta corta (8.3 format) si es posible
-            if os.name == 'nt':  # Windows
-                try:
-                    # Intentar obtener el nombre corto de Windows (sin espacios)
-                    import ctypes
-                    from ctypes import wintypes
-                    
-                    _GetShortPathNameW = ctypes.windll.kernel32.GetShortPathNameW
-                    _GetShortPathNameW.argtypes = [wintypes.LPCWSTR, wintypes.LPWSTR, wintypes.DWORD]
-                    _GetShortPathNameW.restype = wintypes.DWORD
-                    
-                    def get_short_path_name(long_name):
-                        """Convierte una ruta larga a formato 8.3 de Windows"""
-                        output_buf_size = 0
-                        while True:
-                            output_buf = ctypes.create_unicode_buffer(output_buf_size)
-                            needed = _GetShortPathNameW(long_name, output_buf, output_buf_size)
-                            if output_buf_size >= needed:
-                                return output_buf.value
-                            else:
-                                output_buf_size = needed
-                    
-                    # Asegurarse de que el directorio temp existe antes de obtener ruta corta
-                    if not os.path.exists(temp_dir):
-                        os.makedirs(temp_dir, exist_ok=True)
-                    
-                    # Obtener ruta corta del directorio temp
-                    try:
-                        short_temp_dir = get_short_path_name(temp_dir)
-                        simple_path = os.path.join(short_temp_dir, simple_filename)
-                        logger.info(f"Usando ruta corta de Windows: {simple_path}")
-                    except Exception as e:
-                        logger.warning(f"No se pudo obtener ruta corta, usando ruta normal: {e}")
-                        
-                except Exception as e:
-                    logger.warning(f"No se pudo usar API de Windows para rutas cortas: {e}")
-            
-            try:
-                # Copiar el archivo a la ubicación simple
-                logger.info(f"Copiando archivo de: {abs_file_path}")
-                logger.info(f"Copiando archivo a: {simple_path}")
-                
-                # Asegurar que el directorio existe
-                os.makedirs(os.path.dirname(simple_path), exist_ok=True)
-                
-                shutil.copy2(str(abs_file_path), simple_path)
-                
-                # Verificar que la copia existe y es accesible
-                if not os.path.exists(simple_path):
-                    raise Exception(f"No se pudo crear copia del archivo: {simple_path}")
-                
-                # Verificar tamaño del archivo copiado
-                original_size = os.path.getsize(abs_file_path)
-                copied_size = os.path.getsize(simple_path)
-                logger.info(f"Archivo copiado: {copied_size} bytes (original: {original_size} bytes)")
-                
-                if copied_size != original_size:
-                    raise Exception(f"El archivo copiado tiene tamaño diferente: {copied_size} vs {original_size}")
-                
-                logger.info(f"Archivo copiado exitosamente, iniciando transcripción...")
-                
-                # Esperar un poco para asegurar que el archivo está completamente escrito
-                import time
-                time.sleep(0.1)
-                
-                # Suprimir advertencias durante la transcripción
-                with warnings.catch_warnings():
-                    warnings.filterwarnings("ignore")
-                    # Usar la ruta simple para Whisper
-                    # Convertir a string absoluto para evitar cualquier problema
-                    whisper_path = os.path.abspath(simple_path)
-                    logger.info(f"Ruta absoluta para Whisper: {whisper_path}")
-                    result = model.transcribe(whisper_path, **transcribe_options)
-                
-                logger.info(f"Transcripción completada exitosamente")
-                return result
-            except Exception as e:
-                logger.error(f"Error durante la transcripción: {e}")
-                logger.error(f"Ruta del archivo copiado: {simple_path}")
-                logger.error(f"Archivo copiado existe: {os.path.exists(simple_path)}")
-                raise
-            finally:
-                # Limpiar el archivo temporal copiado
-                try:
-                    if os.path.exists(simple_path):
-                        os.unlink(simple_path)
-                        logger.info(f"Archivo temporal copiado eliminado: {simple_path}")
-                except Exception as e:
-                    logger.warning(f"No se pudo eliminar archivo temporal copiado: {e}")
-
-        # Ejecutar transcripción en el executor
-        result = await asyncio.get_event_loop().run_in_executor(
-            executor,
-            run_transcription
-        )
+    def notify(event: dict):
+        if job is not None:
+            job.publish(event)
 
-        logger.info(f"Transcripción completada para {file_path}")
-
-        # Enviar progreso final
-        if websocket:
-            await websocket.send_json({"status": "processing", "progress": 90, "message": "Finalizando..."})
-
-        # Extraer información
-        transcription = {
-            "id": str(uuid.uuid4()),
-            "text": result["text"].strip(),
-            "language": result.get("language", "unknown"),
-            "segments": [
-                {
-                    "id": seg["id"],
-                    "start": seg["start"],
-                    "end": seg["end"],
-                    "text": seg["text"].strip()
-                }
-                for seg in result.get("segments", [])
-            ],
-            "filename": file_path.name,
-            "duration": result.get("duration", 0),
-            "created_at": datetime.now().isoformat()
-        }
+    try:
+        # Configurar opciones de transcripción
+        transcribe_options = build_transcribe_options(language, task)
+        cache_options = build_cache_options(transcribe_options, vad, stream)
+
+        # Calcular hash para cache (si no viene ya calculado desde la subida).
+        # Si la clave rápida nunca se ha visto, el archivo no puede estar en cache:
+        # el SHA256 completo se calcula en segundo plano mientras se transcribe.
+        quick_key = None
+        hash_future = None
+        if file_hash is None:
+            quick_key = await run_blocking(get_quick_key, file_path)
+            if prekey_index.get(quick_key) is not None:
+                file_hash = await run_blocking(get_file_hash, file_path)
+            else:
+                hash_future = asyncio.ensure_future(run_blocking(get_file_hash, file_path))
 
-        # Guardar en cache
-        with open(cache_file, "w", encoding="utf-8") as f:
-            json.dump(transcription, f, ensure_ascii=False, indent=2)
+        # Verificar cache
+        transcription = None
+        if file_hash is not None:
+            cache_key = get_cache_key(file_hash, model_name, cache_options)
+            transcription = result_cache.get(cache_key)
+        else:
+            result_cache.record_miss()
+        if transcription is not None:
+            logger.info(f"Usando resultado cacheado para {file_path.name}")
+            # El mismo audio puede venir de otro usuario con otro nombre de archivo
+            transcription["filename"] = file_path.name
+            return transcription
+
+        async def transcribe() -> dict:
+            nonlocal file_hash, cache_key
+            # Enviar progreso inicial
+            notify({"status": "processing", "progress": 10, "message": "Iniciando transcripción..."})
+
+            # Segmentos parciales: se llama desde el hilo de inferencia o desde el event loop,
+            # así que se publican a través del loop con call_soon_threadsafe
+            def on_segments(segments: List[dict], progress: float):
+                if job is None:
+                    return
+                job.publish_threadsafe({
+                    "status": "segments",
+                    "progress": 10 + int(progress * 80),
+                    "message": f"Transcribiendo... {int(progress * 100)}%",
+                    "segments": [
+                        {"id": seg["id"], "start": seg["start"], "end": seg["end"], "text": seg["text"].strip()}
+                        for seg in segments
+                    ]
+                })
+
+            # Verificar que el archivo existe antes de transcribir
+            if not file_path.exists():
+                raise Exception(f"Archivo temporal no encontrado: {file_path}")
 
-        # Enviar resultado final
-        if websocket:
-            await websocket.send_json({"status": "completed", "progress": 100, "result": transcription})
+            # Esperar a que el modelo por defecto esté cargado
+            await wait_until_ready()
 
-        return transcription
+            # Decodificar una sola vez: el PCM se reutiliza en reintentos, traducciones o con otros modelos
+            whisper_path = resolve_whisper_path(file_path)
+            logger.info(f"Iniciando transcripción de {whisper_path}")
+            audio, pcm_path = await decode_stage.run(lambda: load_pcm(whisper_path, file_hash, hash_future))
 
+            # Con stream se transcribe por ventanas aunque nadie siga el trabajo: así el
+            # resultado es el mismo que indica su clave de cache
+            segments_callback = on_segments if stream else None
+            try:
+                if MICROBATCH_ENABLED and len(audio) <= MICROBATCH_MAX_SECONDS * SAMPLE_RATE:
+                    result = await batch_inference_stage.run(lambda: run_batched_inference(
+                        audio, model_name, transcribe_options, vad, segments_callback
+                    ))
+                else:
+                    result = await inference_stage.run(lambda: run_inference(
+                        audio, pcm_path, model_name, transcribe_options, vad, segments_callback
+                    ))
+            finally:
+                # El artefacto ya no se lee: se puede expulsar
+                if pcm_path is not None:
+                    pcm_store.release(pcm_path)
+
+            logger.info(f"Transcripción completada para {file_path}")
+
+            # Enviar progreso final
+            notify({"status": "processing", "progress": 90, "message": "Finalizando..."})
+
+            # Extraer información
+            transcription = {
+                "id": str(uuid.uuid4()),
+                "text": result["text"].strip(),
+                "language": result.get("language") or "unknown",
+                "segments": [
+                    {
+                        "id": seg["id"],
+                        "start": seg["start"],
+                        "end": seg["end"],
+                        "text": seg["text"].strip()
+                    }
+                    for seg in result.get("segments", [])
+                ],
+                "filename": file_path.name,
+                "model": model_name,
+                "backend": WHISPER_BACKEND,
+                "duration": result["duration"],
+                "created_at": datetime.now().isoformat()
+            }
+
+            # Guardar en cache
+            if hash_future is not None:
+                file_hash = await hash_future
+                cache_key = get_cache_key(file_hash, model_name, cache_options)
+            await export_stage.run(lambda: run_blocking(
+                store_cached_result, file_path, quick_key, file_hash, cache_key, transcription
+            ))
+
+            return transcription
+
+        # Peticiones idénticas simultáneas (mismo audio, modelo y opciones) comparten una sola
+        # transcripción. Los archivos de /transcribe y los file_id subidos traen su hash; solo
+        # un archivo sin hash conocido (hash calculado en segundo plano) no se agrupa
+        if file_hash is None:
+            return await transcribe()
+        transcription = await transcription_flights.run(cache_key, transcribe)
+        # La transcripción pudo lanzarla otra petición con otro nombre de archivo
+        return {**transcription, "filename": file_path.name}
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Verificando existencia del archivo antes del error: {file_path.exists()}")
         logger.error(f"Ruta del archivo: {file_path}")
         logger.error(f"Ruta absoluta: {file_path.resolve()}")
         error_msg = f"Error al transcribir {file_path.name}: {str(e)}"
         logger.error(error_msg)
-        if websocket:
-            await websocket.send_json({"status": "error", "message": error_msg})
         raise HTTPException(status_code=500, detail=error_msg)
 
+def write_output_files(result: dict, base_name: str, output_formats: List[str]) -> dict:
+    """Genera los archivos de salida (txt, srt, vtt, json) y devuelve sus rutas"""
+    output_files = {}
+
+    for fmt in output_formats:
+        if fmt == "txt":
+            transcript_file = TRANSCRIPTS_DIR / f"{base_name}.txt"
+            with open(transcript_file, "w", encoding="utf-8") as f:
+                f.write(result["text"])
+            output_files["txt"] = str(transcript_file)
+
+        elif fmt == "srt":
+            srt_file = TRANSCRIPTS_DIR / f"{base_name}.srt"
+            srt_content = create_srt_content(result["segments"])
+            with open(srt_file, "w", encoding="utf-8") as f:
+                f.write(srt_content)
+            output_files["srt"] = str(srt_file)
+
+        elif fmt == "vtt":
+            vtt_file = TRANSCRIPTS_DIR / f"{base_name}.vtt"
+            vtt_content = create_vtt_content(result["segments"])
+            with open(vtt_file, "w", encoding="utf-8") as f:
+                f.write(vtt_content)
+            output_files["vtt"] = str(vtt_file)
+
+        elif fmt == "json":
+            json_file = TRANSCRIPTS_DIR / f"{base_name}.json"
+            with open(json_file, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            output_files["json"] = str(json_file)
+
+    return output_files
+
+def save_transcript_record(result: dict, filename: str, user_id: int) -> int:
+    """Guarda el texto y los segmentos en el almacén de blobs y el registro en la base de datos; devuelve su id"""
+    blob_ref = transcript_blobs.put(result["text"], result["segments"])
+    db = SessionLocal()
+    try:
+        db_transcript = models.Transcript(
+            filename=filename,
+            blob_ref=blob_ref,
+            segment_count=len(result["segments"]),
+            language=result["language"],
+            duration=result["duration"],
+            user_id=user_id,
+            file_path=result["output_files"].get("txt", "")  # Guardamos la ruta del TXT como referencia
+        )
+        db.add(db_transcript)
+        db.flush()
+        transcript_id = db_transcript.id
+        # El índice de búsqueda se actualiza en la misma transacción que el registro
+        index_transcript(db, transcript_id, user_id, result["text"], result["segments"], result["duration"])
+        db.commit()
+        return transcript_id
+    finally:
+        db.close()
+
+def export_result(result: dict, original_filename: str, output_formats: List[str], user_id: int):
+    """Genera los archivos de salida y guarda el registro en base de datos. Bloqueante."""
+    base_name = Path(original_filename).stem
+    result["output_files"] = write_output_files(result, base_name, output_formats)
+    # Añadir al resultado el id del registro en base de datos
+    result["db_id"] = save_transcript_record(result, original_filename, user_id)
+
+def remove_temp_file(temp_path: Path):
+    """Elimina un archivo temporal sin propagar errores"""
+    try:
+        if temp_path.exists():
+            temp_path.unlink()
+            logger.info(f"Archivo temporal eliminado: {temp_path}")
+    except (OSError, PermissionError) as e:
+        logger.warning(f"No se pudo eliminar archivo temporal {temp_path}: {e}")
+
+async def transcription_job(
+    temp_path: Path,
+    original_filename: str,
+    file_hash: str,
+    language: Optional[str],
+    task: str,
+    output_formats: List[str],
+    user_id: int,
+    model_name: Optional[str] = None,
+    vad: Optional[bool] = None,
+    stream: bool = False
+) -> dict:
+    """Trabajo completo de /transcribe: transcripción, archivos de salida y registro en base de datos"""
+    try:
+        result = await process_transcription(
+            temp_path,
+            language=language,
+            task=task,
+            file_hash=file_hash,
+            model_name=model_name,
+            vad=vad,
+            stream=stream
+        )
+
+        await export_stage.run(lambda: run_blocking(
+            export_result, result, original_filename, output_formats, user_id
+        ))
+        return result
+    finally:
+        remove_temp_file(temp_path)
+
+def submit_job(func, metadata: Optional[dict] = None) -> Job:
+    """Encola un trabajo en el planificador traduciendo la falta de capacidad a errores HTTP"""
+    try:
+        return scheduler.submit(func, metadata)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(JOB_RETRY_AFTER)})
+    except SchedulerUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(JOB_RETRY_AFTER)})
+
 # Endpoints de la API
 @app.get("/api")
 async def api_info():
@@ -418,11 +1122,36 @@ async def health():
     """Health check"""
     return {
         "status": "ok",
-        "model_loaded": model is not None,
+        "ready": is_ready(),
+        "model_loaded": model_registry.is_loaded(MODEL_SIZE),
         "model_size": MODEL_SIZE,
+        "search_index": search_backfill_status,
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness: el proceso responde (no depende del modelo)"""
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def readiness():
+    """
+    Readiness: el modelo por defecto está cargado y se aceptan transcripciones.
+
+    La indexación para la búsqueda no bloquea la disponibilidad: se informa en
+    search_index (status "running" mientras quedan transcripciones por indexar).
+    """
+    if is_ready():
+        return {"status": "ready", "model_size": MODEL_SIZE, "search_index": search_backfill_status}
+
+    if warmup_task is not None and warmup_task.done():
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error", "detail": str(warmup_task.exception())}
+        )
+    return JSONResponse(status_code=503, content={"status": "loading", "model_size": MODEL_SIZE})
+
 @app.post("/register", response_model=Token)
 def register(user: UserCreate, db: Session = Depends(get_db)):
     db_user = db.query(models.User).filter(models.User.email == user.email).first()
@@ -438,7 +1167,7 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
 
 @app.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == form_data.username).first()
+    user = await run_blocking(db.query(models.User).filter(models.User.email == form_data.username).first)
     if not user or not auth.verify_password(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -451,15 +1180,144 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
+def validate_upload_filename(filename: Optional[str]) -> str:
+    """Comprueba que el nombre tenga una extensión soportada y la devuelve"""
+    if not filename:
+        raise HTTPException(status_code=400, detail="No se proporcionó un archivo")
+    file_ext = Path(filename).suffix.lower()
+    if file_ext not in SUPPORTED_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Formato no soportado. Formatos permitidos: {', '.join(SUPPORTED_FORMATS)}"
+        )
+    return file_ext
+
+def upload_state_response(state: dict, status_code: int = 200) -> JSONResponse:
+    """Estado de una subida por partes, con las cabeceras de offset estilo tus"""
+    return JSONResponse(
+        status_code=status_code,
+        content={
+            "upload_id": state["upload_id"],
+            "filename": state["filename"],
+            "offset": state["offset"],
+            "size": state["size"],
+            "complete": False,
+        },
+        headers={"Upload-Offset": str(state["offset"]), "Upload-Length": str(state["size"])}
+    )
+
+def get_upload_state(upload_id: str) -> dict:
+    try:
+        return upload_store.get(upload_id)
+    except UploadNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.post("/upload")
+async def upload_file(file: UploadFile = File(...)):
+    """
+    Sube un archivo de audio en una sola petición para transcribirlo después
+    (por lotes o por WebSocket). Si el contenido ya estaba subido se reutiliza.
+
+    Returns:
+        file_id para /batch/transcribe y /ws/transcribe
+    """
+    file_ext = validate_upload_filename(file.filename)
+    temp_path = upload_store.partial_dir / f"direct_{uuid.uuid4().hex}{file_ext}"
+    file_size, file_hash = await save_upload_stream(file, temp_path)
+    file_id, deduplicated = await run_blocking(upload_store.commit, temp_path, file_hash, file_ext)
+    return {
+        "file_id": file_id,
+        "filename": file.filename,
+        "size": file_size,
+        "sha256": file_hash,
+        "deduplicated": deduplicated
+    }
+
+@app.post("/uploads")
+async def create_upload(request: UploadCreateRequest):
+    """
+    Inicia una subida por partes. Los bloques se envían con PATCH /uploads/{upload_id}
+    y, tras un corte, se consulta el offset con GET /uploads/{upload_id} para continuar.
+    """
+    file_ext = validate_upload_filename(request.filename)
+    if request.sha256:
+        # El file_id es el propio SHA256 más la extensión, y con él ya se puede usar el
+        # archivo: pedir el contenido otra vez no protegería nada y haría lenta la resubida
+        file_id = upload_store.find(request.sha256.lower(), file_ext)
+        if file_id is not None:
+            return {"file_id": file_id, "filename": request.filename, "complete": True, "deduplicated": True}
+    try:
+        state = upload_store.create(request.filename, request.size, request.sha256)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return upload_state_response(state, status_code=201)
+
+@app.api_route("/uploads/{upload_id}", methods=["GET", "HEAD"])
+async def get_upload(upload_id: str):
+    """Offset actual de una subida por partes (bytes ya recibidos)"""
+    return upload_state_response(get_upload_state(upload_id))
+
+@app.patch("/uploads/{upload_id}")
+async def append_upload(upload_id: str, request: Request, upload_offset: int = Header(...)):
+    """
+    Añade un bloque (cuerpo binario de la petición) a partir de la cabecera Upload-Offset.
+
+    Responde 409 con el offset correcto si no coincide. Al recibir el último byte la
+    subida se verifica y se devuelve el file_id.
+    """
+    try:
+        offset = await upload_store.append(upload_id, upload_offset, request.stream())
+    except UploadNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UploadOffsetError as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Upload-Offset": str(e.expected)})
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    state = get_upload_state(upload_id)
+    if offset < state["size"]:
+        return upload_state_response(state)
+
+    try:
+        file_id, deduplicated = await upload_store.finish(upload_id)
+    except UploadNotFoundError as e:
+        # Otra petición con el último bloque ya la completó
+        raise HTTPException(status_code=404, detail=str(e))
+    except UploadChecksumError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    logger.info(f"Subida {upload_id} completada: {file_id}")
+    return JSONResponse(
+        content={
+            "file_id": file_id,
+            "filename": state["filename"],
+            "offset": offset,
+            "size": state["size"],
+            "complete": True,
+            "deduplicated": deduplicated
+        },
+        headers={"Upload-Offset": str(offset)}
+    )
+
+@app.delete("/uploads/{upload_id}")
+async def delete_upload(upload_id: str):
+    """Cancela una subida por partes"""
+    get_upload_state(upload_id)
+    upload_store.abort(upload_id)
+    return {"upload_id": upload_id, "deleted": True}
+
 @app.post("/transcribe")
 async def transcribe_audio(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     language: Optional[str] = None,
     task: str = "transcribe",
     output_formats: List[str] = ["txt"],
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    model: Optional[str] = None,
+    vad: Optional[bool] = None,
+    wait: bool = True,
+    stream: bool = False,
+    current_user: models.User = Depends(auth.get_current_user)
 ):
     """
     Transcribe un archivo de audio a texto
@@ -469,6 +1327,11 @@ async def transcribe_audio(
         language: Código de idioma (opcional)
         task: "transcribe" o "translate"
         output_formats: Formatos de salida ["txt", "srt", "vtt", "json"]
+        model: Modelo Whisper a usar (opcional, por defecto WHISPER_MODEL)
+        vad: Eliminar los tramos sin voz antes de transcribir (opcional, por defecto VAD_ENABLED)
+        wait: Si es False, responde 202 con el id del trabajo para consultarlo en /jobs/{job_id}
+        stream: Publicar los segmentos según se decodifican (se reciben suscribiéndose al
+            trabajo en /ws/transcribe con {"job_id": ...})
 
     Returns:
         JSON con la transcripción y metadatos
@@ -485,13 +1348,7 @@ async def transcribe_audio(
             detail=f"Formato no soportado. Formatos permitidos: {', '.join(SUPPORTED_FORMATS)}"
         )
 
-    # Validar tamaño del archivo
-    file_content = await file.read()
-    if len(file_content) > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Archivo demasiado grande. Máximo permitido: {MAX_FILE_SIZE / (1024*1024):.0f}MB"
-        )
+    model_name = resolve_model_name(model)
 
     # Crear archivo temporal en nuestro directorio temp
     temp_path = None
@@ -511,146 +1368,235 @@ async def transcribe_audio(
         safe_filename = f"{safe_stem}{file_ext}"
         
         # Crear nombre único para el archivo temporal
-        import uuid
         temp_filename = f"whisper_{uuid.uuid4().hex}_{safe_filename}"
         temp_path = TEMP_DIR / temp_filename
 
         # Asegurar que el directorio existe
         TEMP_DIR.mkdir(exist_ok=True)
 
-        # Escribir contenido del archivo
-        with open(temp_path, "wb") as tmp_file:
-            tmp_file.write(file_content)
-            tmp_file.flush()
-            # Forzar escritura al disco
-            if hasattr(tmp_file, 'fileno'):
-                try:
-                    os.fsync(tmp_file.fileno())
-                except:
-                    pass
-
-        # Verificar que el archivo se creó correctamente
-        if not temp_path.exists():
-            raise HTTPException(status_code=500, detail="Error al crear archivo temporal")
+        # Escribir el archivo por bloques validando tamaño y calculando el hash
+        file_size, file_hash = await save_upload_stream(file, temp_path)
         
         # Obtener ruta absoluta pero mantener como Path
         temp_path = temp_path.resolve()
-        logger.info(f"Archivo temporal creado: {temp_path}")
-
-        # Pequeña pausa para asegurar que el archivo esté completamente escrito
-        await asyncio.sleep(0.2)
-        
-        # Verificar nuevamente que existe antes de procesar
-        if not temp_path.exists():
-            raise HTTPException(status_code=500, detail="Archivo temporal desapareció antes de procesar")
-        
-        # Verificar que podemos leer el archivo
-        try:
-            with open(temp_path, 'rb') as test:
-                test.read(1)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Archivo temporal no es accesible: {e}")
+        logger.info(f"Archivo temporal creado: {temp_path} ({file_size} bytes)")
+
+        job_path = temp_path
+
+        def run_job():
+            return transcription_job(
+                job_path,
+                original_filename=file.filename,
+                file_hash=file_hash,
+                language=language,
+                task=task,
+                output_formats=output_formats,
+                user_id=current_user.id,
+                model_name=model_name,
+                vad=vad,
+                stream=stream
+            )
 
-        # Procesar transcripción (pasar como Path, no como string)
-        result = await process_transcription(
-            temp_path,
-            language=language,
-            task=task
+        # Los resultados ya cacheados, o que ya se están transcribiendo para otra petición
+        # que se puede esperar, no ocupan un slot del planificador
+        cache_options = build_cache_options(
+            build_transcribe_options(language, task), VAD_ENABLED if vad is None else vad, stream
         )
+        cache_key = get_cache_key(file_hash, model_name, cache_options)
+        if cache_key in result_cache or (wait and cache_key in transcription_flights):
+            temp_path = None  # El trabajo se encarga de limpiar el archivo temporal
+            return JSONResponse(content=await run_job())
 
-        # Generar archivos de salida adicionales
-        output_files = {}
-        base_name = Path(file.filename).stem
-
-        for fmt in output_formats:
-            if fmt == "txt":
-                transcript_file = TRANSCRIPTS_DIR / f"{base_name}.txt"
-                with open(transcript_file, "w", encoding="utf-8") as f:
-                    f.write(result["text"])
-                output_files["txt"] = str(transcript_file)
-
-            elif fmt == "srt":
-                srt_file = TRANSCRIPTS_DIR / f"{base_name}.srt"
-                srt_content = create_srt_content(result["segments"])
-                with open(srt_file, "w", encoding="utf-8") as f:
-                    f.write(srt_content)
-                output_files["srt"] = str(srt_file)
-
-            elif fmt == "vtt":
-                vtt_file = TRANSCRIPTS_DIR / f"{base_name}.vtt"
-                vtt_content = create_vtt_content(result["segments"])
-                with open(vtt_file, "w", encoding="utf-8") as f:
-                    f.write(vtt_content)
-                output_files["vtt"] = str(vtt_file)
-
-            elif fmt == "json":
-                json_file = TRANSCRIPTS_DIR / f"{base_name}.json"
-                with open(json_file, "w", encoding="utf-8") as f:
-                    json.dump(result, f, ensure_ascii=False, indent=2)
-                output_files["json"] = str(json_file)
-
-        result["output_files"] = output_files
-        
-        # Guardar en base de datos
-        db_transcript = models.Transcript(
-            filename=file.filename,
-            text=result["text"],
-            language=result["language"],
-            duration=result["duration"],
-            user_id=current_user.id,
-            file_path=output_files.get("txt", "") # Guardamos la ruta del TXT como referencia
-        )
-        db.add(db_transcript)
-        db.commit()
-        db.refresh(db_transcript)
-        
-        # Añadir ID de base de datos al resultado
-        result["db_id"] = db_transcript.id
-        
+        job = submit_job(run_job, {"filename": file.filename, "model": model_name})
+        temp_path = None  # El trabajo se encarga de limpiar el archivo temporal
+
+        if not wait:
+            return JSONResponse(status_code=202, content=job.to_dict())
+
+        result = await job.wait()
         return JSONResponse(content=result)
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error en transcripción: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        # Limpiar archivo temporal (solo después de que la transcripción termine)
-        # No eliminar aquí, dejar que se elimine después de procesar
-        # El archivo se eliminará en un background task después de un delay
-        if temp_path and temp_path.exists():
-            async def cleanup_file():
-                await asyncio.sleep(5)  # Esperar 5 segundos después de completar
-                try:
-                    if temp_path.exists():
-                        temp_path.unlink()
-                        logger.info(f"Archivo temporal eliminado: {temp_path}")
-                except (OSError, PermissionError) as e:
-                    logger.warning(f"No se pudo eliminar archivo temporal {temp_path}: {e}")
-            
-            # Programar limpieza en background
-            background_tasks.add_task(cleanup_file)
+        # Si no se llegó a encolar el trabajo, limpiar aquí el archivo temporal
+        if temp_path is not None:
+            remove_temp_file(temp_path)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Estado de un trabajo de transcripción (y su resultado cuando termina)"""
+    job = scheduler.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job.to_dict()
+
+@app.get("/jobs")
+async def jobs_stats():
+    """Ocupación de la cola de trabajos y de cada etapa del pipeline"""
+    return {
+        **scheduler.stats(),
+        "stages": {
+            stage.name: stage.stats()
+            for stage in (decode_stage, inference_stage, batch_inference_stage, export_stage)
+        },
+        "microbatch": micro_batcher.stats() if MICROBATCH_ENABLED else None,
+        "coalescing": transcription_flights.stats()
+    }
+
+async def forward_job_events(websocket: WebSocket, job: Job):
+    """Reenvía al WebSocket los eventos de un trabajo y, al terminar, su resultado o error"""
+    async for event in job.subscribe():
+        await websocket.send_json(event)
+    try:
+        result = await job.wait()
+    except HTTPException as e:
+        await websocket.send_json({"status": "error", "job_id": job.id, "message": e.detail})
+    except Exception as e:
+        await websocket.send_json({"status": "error", "job_id": job.id, "message": str(e)})
+    else:
+        await websocket.send_json({"status": "completed", "job_id": job.id, "progress": 100, "result": result})
+
+live_sessions = 0
+
+async def live_session(websocket: WebSocket, config: dict):
+    """
+    Sesión de transcripción en directo: el cliente envía mensajes binarios con audio
+    PCM mono a 16 kHz y {"event": "stop"} al terminar.
+
+    La inferencia no pasa por la cola de trabajos (la sesión dura lo que dure el
+    audio): usa los hilos y la instancia del modelo de live_inference, y el número
+    de sesiones simultáneas se limita con LIVE_MAX_SESSIONS.
+    """
+    global live_sessions
+    if live_sessions >= LIVE_MAX_SESSIONS:
+        await websocket.send_json({"status": "error", "message": "Demasiadas sesiones en directo"})
+        return
+
+    # Ocupar el hueco antes del primer await: otra sesión podría pasar la comprobación mientras tanto
+    live_sessions += 1
+    try:
+        await run_live_session(websocket, config)
+    finally:
+        live_sessions -= 1
+
+async def run_live_session(websocket: WebSocket, config: dict):
+    """Cuerpo de live_session, con el hueco de la sesión ya ocupado"""
+    try:
+        model_name = resolve_model_name(config.get("model"))
+        await wait_until_ready()
+        transcriber = LiveTranscriber(
+            config.get("format", "pcm_s16le"),
+            max_window_seconds=LIVE_WINDOW_SECONDS,
+            min_step_seconds=LIVE_STEP_SECONDS
+        )
+        # La primera sesión carga su instancia del modelo antes de empezar a recibir audio
+        await live_inference.load(model_name)
+    except HTTPException as e:
+        await websocket.send_json({"status": "error", "message": e.detail})
+        return
+    except ValueError as e:
+        await websocket.send_json({"status": "error", "message": str(e)})
+        return
+
+    transcribe_options = build_transcribe_options(config.get("language"), config.get("task", "transcribe"))
+    audio_ready = asyncio.Event()
+
+    async def receive_audio():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes") is not None:
+                transcriber.feed(message["bytes"])
+                if transcriber.ready:
+                    audio_ready.set()
+            elif message.get("text") and json.loads(message["text"]).get("event") == "stop":
+                return
+
+    async def decode(final: bool = False):
+        committed, provisional = await live_inference.step(transcriber, model_name, transcribe_options, final)
+        if committed:
+            await websocket.send_json({"status": "final", "segments": committed})
+        if not final:
+            await websocket.send_json({"status": "provisional", "segments": provisional})
+
+    receiver = asyncio.create_task(receive_audio())
+    try:
+        await websocket.send_json({"status": "live", "message": "Sesión en directo iniciada"})
+        # Decodificar cada vez que llega audio suficiente; si la inferencia va más
+        # lenta que el audio, el siguiente paso simplemente abarca más audio
+        while not receiver.done():
+            waiter = asyncio.create_task(audio_ready.wait())
+            await asyncio.wait({receiver, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            if audio_ready.is_set():
+                audio_ready.clear()
+                await decode()
+        await receiver
+        await decode(final=True)
+        await websocket.send_json({"status": "completed", "progress": 100, "result": transcriber.result()})
+    finally:
+        receiver.cancel()
 
 @app.websocket("/ws/transcribe")
 async def websocket_transcribe(websocket: WebSocket):
-    """WebSocket para transcripción en tiempo real"""
+    """
+    WebSocket para transcripción en tiempo real
+
+    El cliente envía {"file_id": ...} para transcribir un archivo subido,
+    {"job_id": ...} para seguir un trabajo ya encolado o {"mode": "live"} para
+    enviar audio en directo (ver live_session). Mientras se transcribe recibe
+    mensajes "processing" y "segments" (con los segmentos ya decodificados) y al
+    final "completed" con el resultado o "error".
+    """
     await websocket.accept()
     try:
-        # Recibir configuración inicial
-        config = await websocket.receive_json()
-        logger.info(f"Conexión WebSocket iniciada con config: {config}")
+        # Una misma conexión atiende peticiones sucesivas
+        while True:
+            config = await websocket.receive_json()
+            logger.info(f"Petición WebSocket con config: {config}")
+
+            # Audio en directo
+            if config.get("mode") == "live":
+                await live_session(websocket, config)
+
+            # Seguir un trabajo existente
+            elif "job_id" in config:
+                job = scheduler.get(config["job_id"])
+                if job is None:
+                    await websocket.send_json({"status": "error", "message": "Trabajo no encontrado"})
+                    continue
+                await forward_job_events(websocket, job)
+
+            # Procesar archivo si se proporciona
+            elif "file_id" in config:
+                file_path = upload_store.path_of(str(config["file_id"]))
+                if file_path is None:
+                    await websocket.send_json({"status": "error", "message": "Archivo no encontrado"})
+                    continue
 
-        # Procesar archivo si se proporciona
-        if "file_id" in config:
-            file_path = UPLOAD_DIR / config["file_id"]
-            if not file_path.exists():
-                await websocket.send_json({"status": "error", "message": "Archivo no encontrado"})
-                return
-
-            await process_transcription(
-                file_path,
-                language=config.get("language"),
-                task=config.get("task", "transcribe"),
-                websocket=websocket
-            )
+                try:
+                    model_name = resolve_model_name(config.get("model"))
+                    job = submit_job(lambda: process_transcription(
+                        file_path,
+                        language=config.get("language"),
+                        task=config.get("task", "transcribe"),
+                        # El file_id es el SHA256 del contenido: no hace falta volver a calcularlo
+                        file_hash=upload_store.sha256_of(config["file_id"]),
+                        model_name=model_name,
+                        vad=config.get("vad"),
+                        stream=config.get("stream", True)
+                    ))
+                except HTTPException as e:
+                    await websocket.send_json({"status": "error", "message": e.detail})
+                    continue
+
+                await websocket.send_json({"status": "queued", "job_id": job.id, "message": "En cola..."})
+                await forward_job_events(websocket, job)
 
     except WebSocketDisconnect:
         logger.info("Cliente WebSocket desconectado")
@@ -658,52 +1604,275 @@ async def websocket_transcribe(websocket: WebSocket):
         logger.error(f"Error en WebSocket: {e}")
         await websocket.send_json({"status": "error", "message": str(e)})
 
+BATCH_STREAM_FORMATS = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+async def file_not_found(file_id: str):
+    raise HTTPException(status_code=404, detail=f"Archivo no encontrado: {file_id}")
+
+def validate_stream_format(stream_format: str):
+    if stream_format not in BATCH_STREAM_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Formato de stream no soportado. Formatos: {', '.join(BATCH_STREAM_FORMATS)}"
+        )
+
+def stream_batch(batch: Batch, stream_format: str, after: int = 0) -> StreamingResponse:
+    """
+    Respuesta que envía el resultado de cada archivo según termina y un resumen al final.
+
+    Cada resultado lleva su posición (`seq`, el `id` del evento en SSE); para
+    retomar tras una desconexión se pide el stream del lote con after=<última posición>
+    (o la cabecera Last-Event-ID en SSE).
+    """
+    validate_stream_format(stream_format)
+
+    def encode(event: str, data: dict, event_id: Optional[int] = None) -> str:
+        payload = json.dumps(data, ensure_ascii=False)
+        if stream_format == "ndjson":
+            return payload + "\n"
+        header = f"id: {event_id}\n" if event_id is not None else ""
+        return f"{header}event: {event}\ndata: {payload}\n\n"
+
+    async def events():
+        yield encode("batch", batch.summary())
+        async for seq, item in batch.completions(after):
+            yield encode("result", {"seq": seq, **item.to_dict()}, seq)
+        yield encode("done", batch.summary())
+
+    return StreamingResponse(events(), media_type=BATCH_STREAM_FORMATS[stream_format])
+
 @app.post("/batch/transcribe")
-async def batch_transcribe(request: BatchTranscriptionRequest):
+async def batch_transcribe(
+    request: BatchTranscriptionRequest,
+    stream: Optional[str] = None,
+    wait: bool = True
+):
     """
     Transcribe múltiples archivos de audio por lotes
 
+    Los archivos se transcriben en paralelo (hasta BATCH_PARALLELISM a la vez) a
+    través de la cola de trabajos.
+
     Args:
         request: Configuración del lote con lista de archivos
+        stream: "ndjson" o "sse" para recibir cada resultado en cuanto termina
+        wait: Si es False, responde 202 con el id del lote para consultarlo en /batch/{batch_id}
 
     Returns:
         Resultados de todas las transcripciones
     """
-    results = []
-    errors = []
-
-    for file_id in request.files:
-        try:
-            file_path = UPLOAD_DIR / file_id
-            if not file_path.exists():
-                errors.append({"file_id": file_id, "error": "Archivo no encontrado"})
-                continue
+    model_name = resolve_model_name(request.model)
+    if stream is not None:
+        validate_stream_format(stream)
+
+    def make_job(file_id: str):
+        file_path = upload_store.path_of(file_id)
+        if file_path is None:
+            return lambda: file_not_found(file_id)
+        return lambda: process_transcription(
+            file_path,
+            language=request.language,
+            task=request.task,
+            file_hash=upload_store.sha256_of(file_id),
+            model_name=model_name,
+            vad=request.vad
+        )
 
-            result = await process_transcription(
-                file_path,
-                language=request.language,
-                task=request.task
-            )
-            results.append(result)
+    batch = batch_runner.create(
+        [(file_id, make_job(file_id)) for file_id in request.files],
+        {"model": model_name}
+    )
 
-        except Exception as e:
-            errors.append({"file_id": file_id, "error": str(e)})
+    if stream is not None:
+        return stream_batch(batch, stream)
+    if not wait:
+        return JSONResponse(status_code=202, content=batch.to_dict(include_results=False))
 
+    await asyncio.shield(batch.task)
+    results = [item.result for item in batch.items if item.status == JOB_COMPLETED]
+    errors = [{"file_id": item.file_id, "error": item.error} for item in batch.items if item.status == JOB_FAILED]
     return {
+        "batch_id": batch.id,
         "results": results,
         "errors": errors,
         "total_processed": len(results),
         "total_errors": len(errors)
     }
 
+@app.get("/batch/{batch_id}")
+async def get_batch(batch_id: str, include_results: bool = True):
+    """Estado de un lote y de cada uno de sus archivos"""
+    batch = batch_runner.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Lote no encontrado")
+    return batch.to_dict(include_results)
+
+@app.get("/batch/{batch_id}/stream")
+async def resume_batch_stream(
+    batch_id: str,
+    format: str = "ndjson",
+    after: int = 0,
+    last_event_id: Optional[int] = Header(None)
+):
+    """Resultados de un lote en streaming a partir de la posición `after` (o de Last-Event-ID)"""
+    batch = batch_runner.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Lote no encontrado")
+    return stream_batch(batch, format, max(after, last_event_id or 0))
+
+# Campos que se pueden pedir en el listado; por defecto solo metadatos
+TRANSCRIPT_FIELDS = {"id", "filename", "language", "duration", "created_at", "segment_count", "file_path", "text"}
+TRANSCRIPT_DEFAULT_FIELDS = ["id", "filename", "language", "duration", "created_at", "segment_count"]
+TRANSCRIPTS_PAGE_SIZE = 50
+TRANSCRIPTS_MAX_PAGE_SIZE = 200
+
+def parse_transcript_fields(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return TRANSCRIPT_DEFAULT_FIELDS
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in TRANSCRIPT_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Campos no soportados: {', '.join(unknown)}. Campos: {', '.join(sorted(TRANSCRIPT_FIELDS))}"
+        )
+    return selected
+
+def load_transcript_texts(rows: list) -> List[str]:
+    """Texto completo de cada fila (del almacén de blobs o, en registros antiguos, de la base de datos). Bloqueante."""
+    return [
+        transcript_blobs.get_text(row.blob_ref) if row.blob_ref else (row.text or "")
+        for row in rows
+    ]
+
 @app.get("/transcripts")
 async def list_transcripts(
+    limit: int = TRANSCRIPTS_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Lista las transcripciones del usuario actual, de la más reciente a la más antigua.
+
+    Args:
+        limit: Transcripciones por página (máximo TRANSCRIPTS_MAX_PAGE_SIZE)
+        cursor: next_cursor de la página anterior
+        fields: Campos a devolver separados por comas (por defecto solo metadatos; "text"
+            añade el texto completo)
+
+    La paginación es por cursor sobre (created_at, id) con el índice
+    (user_id, created_at, id): cada página cuesta lo mismo sea cual sea su posición.
+    """
+    selected = parse_transcript_fields(fields)
+    limit = max(1, min(limit, TRANSCRIPTS_MAX_PAGE_SIZE))
+
+    Transcript = models.Transcript
+    # Solo se leen las columnas pedidas (más las necesarias para el cursor y el texto)
+    column_names = {"id", "created_at"} | (set(selected) - {"text"})
+    if "text" in selected:
+        column_names |= {"text", "blob_ref"}
+    query = db.query(*[getattr(Transcript, name) for name in sorted(column_names)]).filter(
+        Transcript.user_id == current_user.id
+    )
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        query = query.filter(or_(
+            Transcript.created_at < cursor_created_at,
+            and_(Transcript.created_at == cursor_created_at, Transcript.id < cursor_id)
+        ))
+    # La consulta (y la espera por una conexión del pool) va fuera del event loop
+    rows = await run_blocking(query.order_by(Transcript.created_at.desc(), Transcript.id.desc()).limit(limit + 1).all)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    texts = await run_blocking(load_transcript_texts, rows) if "text" in selected else None
+    transcripts = []
+    for index, row in enumerate(rows):
+        item = {}
+        for field in selected:
+            if field == "text":
+                item["text"] = texts[index]
+            elif field == "created_at":
+                item["created_at"] = row.created_at.isoformat() if row.created_at else None
+            else:
+                item[field] = getattr(row, field)
+        transcripts.append(item)
+
+    return {"transcripts": transcripts, "next_cursor": next_cursor, "limit": limit}
+
+TRANSCRIPT_SEARCH_MAX_RESULTS = 100
+
+@app.get("/transcripts/search")
+async def search_transcripts(
+    q: str,
+    limit: int = 20,
+    offset: int = 0,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Busca palabras en las transcripciones del usuario actual.
+
+    Devuelve los segmentos que contienen todas las palabras, de más a menos
+    relevante, con su id, sus tiempos y un fragmento con las coincidencias marcadas.
+    Una palabra terminada en * busca por prefijo.
+    """
+    limit = max(1, min(limit, TRANSCRIPT_SEARCH_MAX_RESULTS))
+    try:
+        results = await run_blocking(search_segments, db, current_user.id, q, limit, max(0, offset))
+    except SearchUnavailableError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return {"query": q, "results": results, "limit": limit, "offset": max(0, offset)}
+
+def load_transcript_content(record: models.Transcript, start: Optional[float], end: Optional[float]) -> dict:
+    """Texto y segmentos de un registro desde el almacén de blobs. Bloqueante."""
+    if record.blob_ref is None:
+        # Registro anterior al almacén de blobs: solo tiene el texto
+        return {"text": record.text or "", "segments": []}
+    segments = transcript_blobs.get_segments(record.blob_ref, start, end)
+    if start is not None or end is not None:
+        return {"text": " ".join(seg["text"] for seg in segments), "segments": segments}
+    return {"text": transcript_blobs.get_text(record.blob_ref), "segments": segments}
+
+@app.get("/transcripts/{transcript_id}/content")
+async def get_transcript_content(
+    transcript_id: int,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Lista las transcripciones del usuario actual"""
-    transcripts = db.query(models.Transcript).filter(models.Transcript.user_id == current_user.id).all()
-    return {"transcripts": transcripts}
+    """
+    Texto y segmentos de una transcripción guardada del usuario actual.
+
+    Con start/end (segundos) solo se devuelven los segmentos que se solapan con ese
+    tramo, leyendo únicamente los bloques del almacén que lo contienen.
+    """
+    record = await run_blocking(db.query(models.Transcript).filter(
+        models.Transcript.id == transcript_id, models.Transcript.user_id == current_user.id
+    ).first)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Transcripción no encontrada")
+    try:
+        content = await run_blocking(load_transcript_content, record, start, end)
+    except BlobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {
+        "id": record.id,
+        "filename": record.filename,
+        "language": record.language,
+        "duration": record.duration,
+        "created_at": record.created_at.isoformat() if record.created_at else None,
+        **content,
+    }
 
 @app.get("/transcripts/{filename}")
 async def get_transcript(filename: str):
@@ -722,12 +1891,21 @@ async def get_transcript(filename: str):
         "size": transcript_file.stat().st_size
     }
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Estadísticas del cache de resultados (aciertos, fallos, expulsiones, tamaño) y del audio decodificado"""
+    return {**result_cache.stats(), "pcm": pcm_store.stats()}
+
 @app.get("/models")
 async def list_models():
     """Lista los modelos Whisper disponibles"""
     return {
         "current_model": MODEL_SIZE,
         "available_models": WHISPER_MODELS,
+        "backend": WHISPER_BACKEND,
+        "available_backends": list(BACKENDS),
+        "loaded_models": model_registry.stats(),
+        "live_models": live_inference.registry.stats(),
         "recommendations": {
             "tiny": "Más rápido, menor precisión",
             "base": "Balance velocidad/precisión",
@@ -737,6 +1915,37 @@ async def list_models():
         }
     }
 
+async def periodic_maintenance():
+    """
+    Descarga los modelos sin uso, borra subidas caducadas y temporales y guarda los
+    aciertos del cache periódicamente
+    """
+    while True:
+        await asyncio.sleep(60)
+        if MODEL_IDLE_SECONDS:
+            await run_blocking(model_registry.unload_idle)
+            await run_blocking(live_inference.registry.unload_idle)
+        await run_blocking(upload_store.cleanup_expired)
+        await run_blocking(pcm_store.cleanup_temp)
+        await run_blocking(result_cache.save_hits)
+
+@app.on_event("startup")
+async def start_scheduler():
+    global warmup_task
+    # La carga del modelo no bloquea el arranque: /health/ready indica cuándo termina
+    warmup_task = asyncio.ensure_future(run_blocking(load_default_model))
+    await scheduler.start()
+    asyncio.create_task(periodic_maintenance())
+    asyncio.create_task(backfill_search_index())
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await scheduler.stop()
+    result_cache.save_hits()
+    if inference_pool is not None:
+        inference_pool.shutdown()
+    live_inference.shutdown()
+
 # Servir archivos estáticos (frontend)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
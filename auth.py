@@ -4,8 +4,7 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from database import get_db
+from database import SessionLocal
 import models
 
 # Configuración de seguridad
@@ -54,7 +53,13 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_current_user(token: str = Depends(oauth2_scheme)):
+    """
+    Usuario del token. Es síncrona a propósito: FastAPI la ejecuta en su pool de hilos,
+    así que esperar una conexión del pool no bloquea el event loop. La sesión se cierra
+    al terminar la consulta (el usuario se devuelve desacoplado), de modo que la
+    conexión no queda retenida mientras se sube el archivo o se espera en la cola.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -68,7 +73,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except JWTError:
         raise credentials_exception
     
-    user = db.query(models.User).filter(models.User.email == email).first()
+    with SessionLocal() as db:
+        user = db.query(models.User).filter(models.User.email == email).first()
     if user is None:
         raise credentials_exception
     return user
@@ -0,0 +1,302 @@
+"""
+Motores de inferencia
+Cada motor sabe cargar un modelo Whisper y ejecutar sobre él la transcripción, la
+detección de idioma y los micro-lotes. El motor se elige por despliegue con
+WHISPER_BACKEND:
+
+- torch: openai-whisper en PyTorch, float32 (por defecto)
+- torch-int8: el mismo checkpoint con las capas lineales cuantizadas a int8
+  (cuantización dinámica de torch); sin dependencias extra
+- ctranslate2: faster-whisper sobre CTranslate2 (dependencia opcional
+  `pip install faster-whisper`), con WHISPER_COMPUTE_TYPE como tipo de cálculo
+"""
+
+import logging
+import os
+import warnings
+from itertools import chain
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from model_registry import estimate_model_bytes
+from vad import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Umbrales de model.transcribe: por encima (o por debajo) se repite con más temperatura
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+# Segundos por token de tiempo de Whisper
+TIMESTAMP_PRECISION = 0.02
+
+
+def segments_from_tokens(tokenizer, tokens: List[int], duration: float) -> List[dict]:
+    """
+    Convierte los tokens de una ventana decodificada en segmentos.
+
+    Cada segmento va delimitado por dos tokens de tiempo (<|0.00|> texto <|2.40|>);
+    el texto que queda sin token de cierre termina al final del audio.
+    """
+    segments = []
+    start = 0.0
+    text_tokens: List[int] = []
+
+    def close(end: float):
+        text = tokenizer.decode(text_tokens)
+        if text.strip():
+            seg_start = min(start, duration)
+            seg_end = max(seg_start, min(end, duration))
+            segments.append({"id": len(segments), "start": seg_start, "end": seg_end, "text": text})
+
+    for token in tokens:
+        if token >= tokenizer.timestamp_begin:
+            time = (token - tokenizer.timestamp_begin) * TIMESTAMP_PRECISION
+            if text_tokens:
+                close(time)
+                text_tokens = []
+            # Tras cerrar un segmento, el siguiente empieza en el último token de tiempo
+            start = time
+        elif token < tokenizer.eot:
+            text_tokens.append(token)
+    if text_tokens:
+        close(duration)
+    return segments
+
+
+def normalize_result(result: dict) -> dict:
+    """Se queda solo con los campos del resultado que usa la API"""
+    return {
+        "text": result["text"],
+        "language": result.get("language"),
+        "segments": [
+            {"id": seg["id"], "start": seg["start"], "end": seg["end"], "text": seg["text"]}
+            for seg in result.get("segments", [])
+        ],
+    }
+
+
+class WhisperBackend:
+    """openai-whisper en PyTorch con pesos float32"""
+
+    name = "torch"
+    # Los pesos se pueden mover a memoria compartida para el pool de procesos
+    shares_memory = True
+
+    def __init__(self, cpu_threads: int = 0):
+        self.cpu_threads = cpu_threads
+
+    def load(self, model_name: str):
+        import whisper
+        return whisper.load_model(model_name)
+
+    def model_bytes(self, model) -> int:
+        return estimate_model_bytes(model)
+
+    def share_memory(self, model):
+        """Mueve los tensores densos del modelo a memoria compartida"""
+        # model.share_memory() falla con el buffer disperso alignment_heads de Whisper
+        for tensor in chain(model.parameters(), model.buffers()):
+            if not tensor.is_sparse:
+                tensor.share_memory_()
+
+    def transcribe(self, model, audio: np.ndarray, transcribe_options: dict) -> dict:
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore")
+            return normalize_result(model.transcribe(audio, **transcribe_options))
+
+    def detect_language(self, model, audio: np.ndarray) -> str:
+        import whisper
+
+        mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), model.dims.n_mels).to(model.device)
+        _, probs = model.detect_language(mel)
+        return max(probs, key=probs.get)
+
+    def transcribe_batch(self, model, audios: List[np.ndarray], transcribe_options: dict) -> List[dict]:
+        """
+        Transcribe varios audios de hasta 30 segundos en una sola pasada del modelo.
+
+        Los espectrogramas se apilan y se decodifican juntos con whisper.decode (greedy,
+        temperatura 0). Los resultados que model.transcribe repetiría con más temperatura
+        (repetitivos o poco probables) se vuelven a transcribir uno a uno.
+        """
+        import torch
+        import whisper
+        from whisper.tokenizer import get_tokenizer
+
+        mel = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), model.dims.n_mels) for audio in audios
+        ]).to(model.device)
+        decode_options = whisper.DecodingOptions(
+            task=transcribe_options.get("task", "transcribe"),
+            language=transcribe_options.get("language"),
+            temperature=0.0,
+            fp16=transcribe_options.get("fp16", False),
+        )
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore")
+            decoded = whisper.decode(model, mel, decode_options)
+
+        tokenizer = get_tokenizer(
+            model.is_multilingual, num_languages=model.num_languages, task=decode_options.task
+        )
+        results = []
+        for audio, result in zip(audios, decoded):
+            silence = result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD
+            if not silence and (
+                result.compression_ratio > COMPRESSION_RATIO_THRESHOLD or result.avg_logprob < LOGPROB_THRESHOLD
+            ):
+                results.append(self.transcribe(model, audio, transcribe_options))
+                continue
+            segments = [] if silence else segments_from_tokens(tokenizer, result.tokens, len(audio) / SAMPLE_RATE)
+            results.append({
+                "text": "".join(seg["text"] for seg in segments),
+                "language": result.language,
+                "segments": segments,
+            })
+        return results
+
+
+class QuantizedWhisperBackend(WhisperBackend):
+    """
+    openai-whisper con cuantización dinámica int8 de las capas lineales.
+
+    Los pesos de las capas lineales (la mayor parte del modelo) pasan a int8 y las
+    activaciones se cuantizan al vuelo en cada llamada, lo que reduce a un cuarto su
+    memoria y acelera la inferencia en CPU. Las convoluciones y los embeddings
+    siguen en float32.
+
+    Los pesos int8 empaquetados no son parámetros ni buffers, así que share_memory()
+    no los alcanzaría y cada proceso recibiría una copia serializada: con
+    INFERENCE_EXECUTOR=process cada trabajador carga su propio modelo cuantizado.
+    """
+
+    name = "torch-int8"
+    shares_memory = False
+
+    def load(self, model_name: str):
+        import torch
+        import whisper
+        from torch import nn
+
+        # La cuantización dinámica solo tiene kernels de CPU
+        model = whisper.load_model(model_name, device="cpu")
+        # Whisper usa su propia subclase de nn.Linear, que torch no sabe cuantizar:
+        # se sustituyen por nn.Linear normales con los mismos pesos (equivalentes en float32)
+        for parent in list(model.modules()):
+            for child_name, child in list(parent.named_children()):
+                if isinstance(child, nn.Linear) and type(child) is not nn.Linear:
+                    linear = nn.Linear(child.in_features, child.out_features, bias=child.bias is not None)
+                    linear.weight = child.weight
+                    linear.bias = child.bias
+                    setattr(parent, child_name, linear)
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", category=DeprecationWarning)
+            return torch.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+    def model_bytes(self, model) -> int:
+        # Los pesos cuantizados no son parámetros: se cuentan aparte (1 byte por peso)
+        total = estimate_model_bytes(model)
+        for module in model.modules():
+            if hasattr(module, "_packed_params") and callable(getattr(module, "weight", None)):
+                total += module.weight().numel()
+                bias = module.bias()
+                if bias is not None:
+                    total += bias.numel() * bias.element_size()
+        return total
+
+
+class CTranslate2Backend:
+    """
+    faster-whisper sobre CTranslate2.
+
+    Convierte (la primera vez) y ejecuta el checkpoint con su propio motor, con
+    pesos int8 por defecto. Los modelos no se pueden compartir entre procesos: con
+    INFERENCE_EXECUTOR=process cada proceso carga el suyo.
+    """
+
+    name = "ctranslate2"
+    shares_memory = False
+
+    def __init__(self, cpu_threads: int = 0, compute_type: Optional[str] = None):
+        self.cpu_threads = cpu_threads
+        self.compute_type = compute_type or os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+
+    def load(self, model_name: str):
+        try:
+            from faster_whisper import WhisperModel
+            from faster_whisper.utils import download_model
+        except ImportError:
+            raise RuntimeError("WHISPER_BACKEND=ctranslate2 requiere instalar faster-whisper: pip install faster-whisper")
+
+        model_path = download_model(model_name)
+        model = WhisperModel(
+            model_path, device="cpu", compute_type=self.compute_type, cpu_threads=self.cpu_threads
+        )
+        model.size_bytes = sum(
+            os.path.getsize(os.path.join(model_path, f)) for f in os.listdir(model_path)
+        )
+        return model
+
+    def model_bytes(self, model) -> int:
+        return getattr(model, "size_bytes", 0)
+
+    def share_memory(self, model):
+        raise RuntimeError("Los modelos de CTranslate2 no se pueden compartir entre procesos")
+
+    def transcribe(self, model, audio: np.ndarray, transcribe_options: dict) -> dict:
+        options = {k: v for k, v in transcribe_options.items() if k not in ("verbose", "fp16")}
+        # Greedy como openai-whisper (faster-whisper usa beam search por defecto)
+        options.setdefault("beam_size", 1)
+        segments, info = model.transcribe(audio, **options)
+        segments = [
+            {"id": i, "start": seg.start, "end": seg.end, "text": seg.text}
+            for i, seg in enumerate(segments)
+        ]
+        return {
+            "text": "".join(seg["text"] for seg in segments),
+            "language": info.language,
+            "segments": segments,
+        }
+
+    def detect_language(self, model, audio: np.ndarray) -> str:
+        # El idioma se detecta al llamar a transcribe; los segmentos se generan de forma perezosa
+        _, info = model.transcribe(audio[:30 * SAMPLE_RATE], beam_size=1)
+        return info.language
+
+    def transcribe_batch(self, model, audios: List[np.ndarray], transcribe_options: dict) -> List[dict]:
+        return [self.transcribe(model, audio, transcribe_options) for audio in audios]
+
+
+BACKENDS: Dict[str, type] = {
+    WhisperBackend.name: WhisperBackend,
+    QuantizedWhisperBackend.name: QuantizedWhisperBackend,
+    CTranslate2Backend.name: CTranslate2Backend,
+}
+
+# Motor activo en este proceso (el servidor y cada proceso de inferencia lo fijan al arrancar)
+_active_backend: Optional[Any] = None
+
+
+def create_backend(name: str, cpu_threads: int = 0):
+    """Crea el motor `name`; ValueError si no existe"""
+    backend_class = BACKENDS.get(name)
+    if backend_class is None:
+        raise ValueError(f"Motor de inferencia no soportado: {name}. Motores: {', '.join(BACKENDS)}")
+    return backend_class(cpu_threads=cpu_threads)
+
+
+def set_backend(name: str, cpu_threads: int = 0):
+    """Fija el motor que usan las funciones de inference en este proceso"""
+    global _active_backend
+    _active_backend = create_backend(name, cpu_threads)
+    return _active_backend
+
+
+def get_backend():
+    """Motor activo (torch si no se fijó ninguno)"""
+    global _active_backend
+    if _active_backend is None:
+        _active_backend = create_backend(WhisperBackend.name)
+    return _active_backend
@@ -0,0 +1,180 @@
+"""
+Lotes de transcripción
+Reparte los archivos de un lote entre los slots del planificador con un paralelismo
+acotado y permite seguir (o retomar) los resultados según va terminando cada archivo.
+"""
+
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+from jobs import JOB_COMPLETED, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JobScheduler, QueueFullError
+
+logger = logging.getLogger(__name__)
+
+# Espera antes de reintentar el envío de un archivo cuando la cola de trabajos está llena
+SUBMIT_RETRY_SECONDS = 1.0
+
+
+class BatchItem:
+    """Un archivo de un lote"""
+
+    def __init__(self, file_id: str, func: Callable[[], Awaitable[Any]]):
+        self.file_id = file_id
+        self.func = func
+        self.status = JOB_QUEUED
+        self.job_id: Optional[str] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+
+    def to_dict(self, include_result: bool = True) -> dict:
+        data = {"file_id": self.file_id, "status": self.status, "job_id": self.job_id}
+        if self.error is not None:
+            data["error"] = self.error
+        if include_result and self.status == JOB_COMPLETED:
+            data["result"] = self.result
+        return data
+
+
+class Batch:
+    """
+    Un lote de archivos.
+
+    Los archivos terminados (con éxito o con error) se registran en orden de
+    finalización; completions(after) devuelve los posteriores a la posición `after`,
+    de modo que un cliente que se desconecta puede retomar donde lo dejó.
+    """
+
+    def __init__(self, items: List[BatchItem], metadata: Optional[dict] = None):
+        self.id = uuid.uuid4().hex
+        self.items = items
+        self.metadata = metadata or {}
+        self.created_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+        self._finished: List[int] = []  # Índices de los archivos en orden de finalización
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return len(self._finished) == len(self.items)
+
+    def _item_finished(self, index: int):
+        self._finished.append(index)
+        if self.done:
+            self.finished_at = datetime.now()
+        # Despertar a los que esperan y preparar el evento para la siguiente finalización
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def completions(self, after: int = 0) -> AsyncIterator[Tuple[int, BatchItem]]:
+        """Devuelve (posición, archivo) de cada archivo terminado a partir de `after`"""
+        position = max(0, after)
+        while True:
+            while position < len(self._finished):
+                position += 1
+                yield position, self.items[self._finished[position - 1]]
+            if self.done:
+                return
+            await self._changed.wait()
+
+    def summary(self) -> dict:
+        completed = sum(1 for item in self.items if item.status == JOB_COMPLETED)
+        failed = sum(1 for item in self.items if item.status == JOB_FAILED)
+        return {
+            "batch_id": self.id,
+            "status": JOB_COMPLETED if self.done else (JOB_RUNNING if self._started else JOB_QUEUED),
+            "total": len(self.items),
+            "total_processed": completed,
+            "total_errors": failed,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            **self.metadata,
+        }
+
+    @property
+    def _started(self) -> bool:
+        return any(item.status != JOB_QUEUED for item in self.items)
+
+    def to_dict(self, include_results: bool = True) -> dict:
+        return {
+            **self.summary(),
+            "items": [item.to_dict(include_results) for item in self.items],
+        }
+
+
+class BatchRunner:
+    """
+    Ejecuta lotes enviando sus archivos al planificador de trabajos.
+
+    Cada lote tiene como mucho `parallelism` archivos en el planificador a la vez,
+    para que un lote grande no llene la cola y deje sin servicio al resto de
+    peticiones. Los lotes terminados se conservan (hasta `max_history`) para poder
+    consultarlos.
+    """
+
+    def __init__(self, scheduler: JobScheduler, parallelism: int = 1, max_history: int = 100):
+        self.scheduler = scheduler
+        self.parallelism = max(1, parallelism)
+        self.max_history = max_history
+        self._batches: "OrderedDict[str, Batch]" = OrderedDict()
+
+    def create(
+        self,
+        files: List[Tuple[str, Callable[[], Awaitable[Any]]]],
+        metadata: Optional[dict] = None
+    ) -> Batch:
+        """Crea un lote con pares (file_id, función del trabajo) y empieza a ejecutarlo"""
+        batch = Batch([BatchItem(file_id, func) for file_id, func in files], metadata)
+        batch.task = asyncio.ensure_future(self._run(batch))
+        self._batches[batch.id] = batch
+        self._trim_history()
+        return batch
+
+    def get(self, batch_id: str) -> Optional[Batch]:
+        return self._batches.get(batch_id)
+
+    async def _run(self, batch: Batch):
+        semaphore = asyncio.Semaphore(self.parallelism)
+        await asyncio.gather(*[
+            self._run_item(batch, index, semaphore) for index in range(len(batch.items))
+        ])
+        logger.info(f"Lote {batch.id} terminado: {len(batch.items)} archivos")
+
+    async def _run_item(self, batch: Batch, index: int, semaphore: asyncio.Semaphore):
+        item = batch.items[index]
+        async with semaphore:
+            try:
+                while True:
+                    try:
+                        job = self.scheduler.submit(item.func, {"batch_id": batch.id, "file_id": item.file_id})
+                        break
+                    except QueueFullError:
+                        await asyncio.sleep(SUBMIT_RETRY_SECONDS)
+                item.job_id = job.id
+                item.status = JOB_RUNNING
+                item.result = await job.wait()
+                item.status = JOB_COMPLETED
+            except asyncio.CancelledError:
+                item.status = JOB_FAILED
+                item.error = "Lote cancelado"
+                raise
+            except Exception as e:
+                item.status = JOB_FAILED
+                item.error = getattr(e, "detail", None) or str(e)
+            finally:
+                item.func = None
+                batch._item_finished(index)
+
+    def _trim_history(self):
+        # Descartar los lotes terminados más antiguos
+        if len(self._batches) <= self.max_history:
+            return
+        for batch_id in list(self._batches):
+            if len(self._batches) <= self.max_history:
+                break
+            if self._batches[batch_id].done:
+                del self._batches[batch_id]
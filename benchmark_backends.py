@@ -0,0 +1,157 @@
+"""
+Comparación de motores de inferencia
+Transcribe los mismos audios con cada motor (WHISPER_BACKEND) y muestra la
+velocidad, la memoria del modelo y la tasa de error por palabras (WER).
+
+Uso:
+    python benchmark_backends.py audios/nota.mp3 audios/reunion.wav --model base
+    python benchmark_backends.py audios/*.wav --backends torch,torch-int8 --language es
+
+La referencia para el WER es, para cada audio, un .txt con el mismo nombre junto
+al audio (o en --references); si no existe, se usa la transcripción del primer motor.
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from backends import BACKENDS, create_backend
+from inference import decode_audio
+from vad import SAMPLE_RATE
+
+
+def normalize_words(text: str) -> List[str]:
+    """Palabras en minúsculas y sin puntuación, para comparar transcripciones"""
+    return re.findall(r"\w+", text.lower())
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """Distancia de edición entre palabras dividida por las palabras de la referencia"""
+    ref = normalize_words(reference)
+    hyp = normalize_words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word)
+            )
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def load_reference(audio_path: Path, references_dir: Optional[Path]) -> Optional[str]:
+    candidates = [audio_path.with_suffix(".txt")]
+    if references_dir is not None:
+        candidates.insert(0, references_dir / f"{audio_path.stem}.txt")
+    for path in candidates:
+        if path.exists():
+            return path.read_text(encoding="utf-8")
+    return None
+
+
+def benchmark_backend(name: str, model_name: str, audios: Dict[str, np.ndarray], options: dict, threads: int) -> dict:
+    """Carga el modelo con un motor y transcribe todos los audios"""
+    backend = create_backend(name, cpu_threads=threads)
+    start = time.perf_counter()
+    model = backend.load(model_name)
+    load_seconds = time.perf_counter() - start
+
+    # Una pasada corta de calentamiento para no medir la inicialización perezosa
+    first_audio = next(iter(audios.values()))
+    backend.transcribe(model, first_audio[:SAMPLE_RATE], options)
+
+    texts = {}
+    inference_seconds = 0.0
+    for audio_name, audio in audios.items():
+        start = time.perf_counter()
+        result = backend.transcribe(model, audio, options)
+        inference_seconds += time.perf_counter() - start
+        texts[audio_name] = result["text"]
+
+    audio_seconds = sum(len(audio) for audio in audios.values()) / SAMPLE_RATE
+    return {
+        "backend": name,
+        "load_seconds": load_seconds,
+        "model_mb": backend.model_bytes(model) / (1024 * 1024),
+        "inference_seconds": inference_seconds,
+        # Segundos de cálculo por segundo de audio: menos es mejor
+        "real_time_factor": inference_seconds / audio_seconds if audio_seconds else 0.0,
+        "texts": texts,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compara velocidad y precisión de los motores de inferencia")
+    parser.add_argument("audios", nargs="+", type=Path, help="Archivos de audio a transcribir")
+    parser.add_argument("--model", default="base", help="Modelo Whisper (por defecto: base)")
+    parser.add_argument(
+        "--backends", default=",".join(BACKENDS),
+        help=f"Motores separados por comas (por defecto: {','.join(BACKENDS)})"
+    )
+    parser.add_argument("--language", default=None, help="Idioma de los audios (por defecto: detección automática)")
+    parser.add_argument("--threads", type=int, default=0, help="Hilos de CPU por motor (0 = automático)")
+    parser.add_argument("--references", type=Path, default=None, help="Directorio con las transcripciones de referencia")
+    parser.add_argument("--json", type=Path, default=None, help="Guardar los resultados completos en un JSON")
+    args = parser.parse_args(argv)
+
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    options = {"task": "transcribe", "verbose": False, "fp16": False}
+    if args.language:
+        options["language"] = args.language
+
+    print(f"Decodificando {len(args.audios)} audios...")
+    audios = {str(path): decode_audio(str(path)) for path in args.audios}
+    references = {name: load_reference(Path(name), args.references) for name in audios}
+
+    results = []
+    for name in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        print(f"Motor {name}...")
+        try:
+            results.append(benchmark_backend(name, args.model, audios, options, args.threads))
+        except Exception as e:
+            print(f"   ✗ {name}: {e}")
+    if not results:
+        return 1
+
+    baseline = results[0]
+    for result in results:
+        wers = [
+            word_error_rate(references[audio_name] or baseline["texts"][audio_name], text)
+            for audio_name, text in result["texts"].items()
+        ]
+        result["wer"] = sum(wers) / len(wers)
+
+    if not all(references.values()):
+        print(f"\nSin transcripción de referencia para algunos audios: el WER se mide contra {baseline['backend']}")
+    print()
+    print(f"{'Motor':<14}{'Carga (s)':>11}{'Modelo (MB)':>13}{'Inferencia (s)':>16}{'RTF':>8}{'x vs 1º':>9}{'WER':>8}")
+    for result in results:
+        speedup = baseline["inference_seconds"] / result["inference_seconds"] if result["inference_seconds"] else 0.0
+        print(
+            f"{result['backend']:<14}{result['load_seconds']:>11.1f}{result['model_mb']:>13.0f}"
+            f"{result['inference_seconds']:>16.1f}{result['real_time_factor']:>8.3f}"
+            f"{speedup:>9.2f}{result['wer'] * 100:>7.1f}%"
+        )
+
+    if args.json:
+        args.json.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nResultados guardados en {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+Almacén de blobs de transcripciones
+El texto y los segmentos de cada transcripción se guardan fuera de la base de datos
+como blobs comprimidos y direccionados por contenido; la fila de la base de datos solo
+guarda los metadatos y la referencia. El almacén tiene la interfaz de un bucket S3
+(put/get/head/delete por clave) y por defecto es un directorio local.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import uuid
+import zlib
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from cache import encode_result, read_segments
+
+logger = logging.getLogger(__name__)
+
+
+class BlobNotFoundError(Exception):
+    """El blob no existe en el almacén"""
+
+
+class LocalBlobStore:
+    """
+    Bucket en un directorio local: cada clave es un archivo bajo `directory`.
+
+    Las escrituras van a un temporal que se renombra, así que un lector nunca ve un
+    blob a medias.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        parts = key.split("/")
+        if not key or any(part in ("", ".", "..") for part in parts):
+            raise ValueError(f"Clave de blob no válida: {key}")
+        return self.directory.joinpath(*parts)
+
+    def put_object(self, key: str, data: bytes):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.parent / f".{path.name}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get_object(self, key: str) -> bytes:
+        try:
+            return self._path(key).read_bytes()
+        except FileNotFoundError:
+            raise BlobNotFoundError(f"Blob no encontrado: {key}")
+
+    def head_object(self, key: str) -> Optional[dict]:
+        """Tamaño del blob, o None si no existe"""
+        try:
+            return {"size": self._path(key).stat().st_size}
+        except FileNotFoundError:
+            return None
+
+    def delete_object(self, key: str):
+        self._path(key).unlink(missing_ok=True)
+
+    def list_objects(self, prefix: str = "") -> Iterator[str]:
+        for path in self.directory.rglob("*"):
+            if path.is_file() and not path.name.startswith("."):
+                key = path.relative_to(self.directory).as_posix()
+                if key.startswith(prefix):
+                    yield key
+
+
+class S3BlobStore:
+    """
+    Bucket S3 (o compatible, como MinIO con endpoint_url). Requiere boto3, que es
+    una dependencia opcional: `pip install boto3`.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("Un almacén de blobs s3:// requiere instalar boto3: pip install boto3")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def put_object(self, key: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data)
+
+    def get_object(self, key: str) -> bytes:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)["Body"].read()
+        except self.client.exceptions.NoSuchKey:
+            raise BlobNotFoundError(f"Blob no encontrado: {key}")
+
+    def head_object(self, key: str) -> Optional[dict]:
+        from botocore.exceptions import ClientError
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return {"size": response["ContentLength"]}
+
+    def delete_object(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    def list_objects(self, prefix: str = "") -> Iterator[str]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+            for item in page.get("Contents", []):
+                yield item["Key"][len(self.prefix):]
+
+
+def open_blob_store(url: str, endpoint_url: Optional[str] = None):
+    """Almacén para una URL: s3://bucket/prefijo o la ruta de un directorio local"""
+    if url.startswith("s3://"):
+        bucket, _, prefix = url[len("s3://"):].partition("/")
+        return S3BlobStore(bucket, prefix, endpoint_url=endpoint_url)
+    if url.startswith("file://"):
+        url = url[len("file://"):]
+    return LocalBlobStore(Path(url))
+
+
+class TranscriptBlobs:
+    """
+    Transcripciones como blobs direccionados por contenido.
+
+    Una transcripción es un manifiesto (JSON comprimido) que apunta a un blob con el
+    texto completo y a los bloques de hasta `chunk_segments` segmentos, cada uno en el
+    formato columnar del cache. La referencia que se guarda en la base de datos es el
+    hash del manifiesto. Los bloques guardan sus tiempos en el manifiesto, de modo
+    que se puede leer un tramo de una transcripción larga sin descargarla entera, y
+    un contenido repetido (el mismo audio transcrito por varios usuarios) se guarda
+    una sola vez.
+    """
+
+    MANIFEST_VERSION = 1
+
+    def __init__(self, store, chunk_segments: int = 500):
+        self.store = store
+        self.chunk_segments = max(1, chunk_segments)
+
+    def _put(self, prefix: str, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        key = f"{prefix}/{digest[:2]}/{digest}"
+        if self.store.head_object(key) is None:
+            self.store.put_object(key, data)
+        return digest
+
+    def _get(self, prefix: str, digest: str) -> bytes:
+        return self.store.get_object(f"{prefix}/{digest[:2]}/{digest}")
+
+    def put(self, text: str, segments: List[dict]) -> str:
+        """Guarda el texto y los segmentos y devuelve la referencia de la transcripción"""
+        text_ref = self._put("text", zlib.compress(text.encode("utf-8"), 6))
+        chunks = []
+        for first in range(0, len(segments), self.chunk_segments):
+            chunk = segments[first:first + self.chunk_segments]
+            chunks.append({
+                "ref": self._put("segments", encode_result({"segments": chunk})),
+                "first": first,
+                "count": len(chunk),
+                "start": chunk[0]["start"],
+                "end": chunk[-1]["end"],
+            })
+        manifest = {
+            "version": self.MANIFEST_VERSION,
+            "text": text_ref,
+            "segments": len(segments),
+            "chunks": chunks,
+        }
+        manifest_bytes = json.dumps(manifest, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        return self._put("transcripts", zlib.compress(manifest_bytes, 6))
+
+    def manifest(self, ref: str) -> dict:
+        return json.loads(zlib.decompress(self._get("transcripts", ref)))
+
+    def get_text(self, ref: str) -> str:
+        return zlib.decompress(self._get("text", self.manifest(ref)["text"])).decode("utf-8")
+
+    def get_segments(self, ref: str, start: Optional[float] = None, end: Optional[float] = None) -> List[dict]:
+        """Segmentos de la transcripción; con start/end, solo los que se solapan con ese tramo"""
+        segments = []
+        for chunk in self.manifest(ref)["chunks"]:
+            if start is not None and chunk["end"] <= start:
+                continue
+            if end is not None and chunk["start"] > end:
+                break
+            # Solo se construyen los segmentos del tramo, no el bloque entero
+            segments.extend(read_segments(self._get("segments", chunk["ref"])).overlapping(start, end))
+        return segments
+
+    def get(self, ref: str) -> dict:
+        return {"text": self.get_text(ref), "segments": self.get_segments(ref)}
@@ -0,0 +1,608 @@
+"""
+Cache de resultados de transcripción
+Almacén en disco con presupuesto de bytes, expulsión LRU/LFU, TTL y un nivel
+en memoria para los resultados más recientes.
+"""
+
+import heapq
+import json
+import logging
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_POLICIES = ("lru", "lfu")
+
+# Formato binario de una entrada:
+#   cabecera: magic(4s) flags(B) relleno(3x) meta_len(I) n_segments(I) payload_len(I)
+#   payload (comprimido con zlib si FLAG_ZLIB):
+#       meta JSON (sin texto ni segmentos)
+#       ids int32[n] | starts float64[n] | ends float64[n]
+#       offsets uint32[n + 2] en caracteres sobre el blob de texto (texto completo + texto de cada segmento)
+#       blob de texto UTF-8
+# Los arrays numéricos se guardan en little-endian.
+CACHE_MAGIC = b"WTC1"
+FLAG_ZLIB = 0x01
+_HEADER = struct.Struct("<4sB3xIII")
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def _le_bytes(values: array) -> bytes:
+    if not _LITTLE_ENDIAN:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _le_view(buffer: memoryview, typecode: str) -> Sequence:
+    """Vista sin copia de un array little-endian (copia solo en máquinas big-endian)"""
+    if _LITTLE_ENDIAN:
+        return buffer.cast(typecode)
+    values = array(typecode, buffer.tobytes())
+    values.byteswap()
+    return values
+
+
+def encode_result(value: dict, compress: bool = True) -> bytes:
+    """Serializa un resultado de transcripción al formato binario columnar"""
+    segments = value.get("segments") or []
+    meta = {k: v for k, v in value.items() if k not in ("text", "segments")}
+    meta_bytes = json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    texts = [value.get("text", "")]
+    texts.extend(seg["text"] for seg in segments)
+    offsets = array("I", [0])
+    for text in texts:
+        offsets.append(offsets[-1] + len(text))
+
+    payload = b"".join([
+        meta_bytes,
+        _le_bytes(array("i", (seg["id"] for seg in segments))),
+        _le_bytes(array("d", (seg["start"] for seg in segments))),
+        _le_bytes(array("d", (seg["end"] for seg in segments))),
+        _le_bytes(offsets),
+        "".join(texts).encode("utf-8"),
+    ])
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload, 1)
+        flags |= FLAG_ZLIB
+
+    return _HEADER.pack(CACHE_MAGIC, flags, len(meta_bytes), len(segments), len(payload)) + payload
+
+
+class SegmentTable(Sequence):
+    """
+    Acceso perezoso a los segmentos de un resultado en formato binario.
+
+    Los tiempos y desplazamientos son vistas sobre el buffer original; cada
+    segmento se construye solo cuando se accede a él.
+    """
+
+    def __init__(self, payload: memoryview, meta_len: int, n_segments: int):
+        pos = meta_len
+        self._ids = _le_view(payload[pos:pos + 4 * n_segments], "i")
+        pos += 4 * n_segments
+        self._starts = _le_view(payload[pos:pos + 8 * n_segments], "d")
+        pos += 8 * n_segments
+        self._ends = _le_view(payload[pos:pos + 8 * n_segments], "d")
+        pos += 8 * n_segments
+        self._offsets = _le_view(payload[pos:pos + 4 * (n_segments + 2)], "I")
+        pos += 4 * (n_segments + 2)
+        self._text_bytes = payload[pos:]
+        self._text = None
+        self._length = n_segments
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("índice de segmento fuera de rango")
+        return {
+            "id": self._ids[index],
+            "start": self._starts[index],
+            "end": self._ends[index],
+            "text": self._text_at(index + 1),
+        }
+
+    def _blob(self) -> str:
+        # El blob se decodifica una sola vez; los offsets están en caracteres
+        if self._text is None:
+            self._text = str(self._text_bytes, "utf-8")
+        return self._text
+
+    def _text_at(self, position: int) -> str:
+        return self._blob()[self._offsets[position]:self._offsets[position + 1]]
+
+    @property
+    def full_text(self) -> str:
+        """Texto completo de la transcripción"""
+        return self._text_at(0)
+
+    def overlapping(self, start: Optional[float] = None, end: Optional[float] = None) -> List[dict]:
+        """
+        Segmentos que se solapan con el tramo [start, end] (segundos). Los inicios están
+        ordenados: se busca el último candidato por bisección sobre la vista de tiempos
+        y solo se construyen los segmentos del tramo.
+        """
+        if start is None and end is None:
+            return self.to_list()
+        stop = self._length if end is None else bisect_right(self._starts, end)
+        return [
+            self[i] for i in range(stop)
+            if start is None or self._ends[i] > start
+        ]
+
+    def to_list(self) -> List[dict]:
+        """Materializa todos los segmentos como lista de diccionarios"""
+        blob = self._blob()
+        offsets = self._offsets.tolist()
+        return [
+            {"id": seg_id, "start": start, "end": end, "text": blob[offsets[i + 1]:offsets[i + 2]]}
+            for i, (seg_id, start, end) in enumerate(zip(self._ids.tolist(), self._starts.tolist(), self._ends.tolist()))
+        ]
+
+
+def _parse(data) -> tuple:
+    """Devuelve (meta, SegmentTable) a partir de los bytes de una entrada"""
+    buffer = memoryview(data)
+    if len(buffer) < _HEADER.size:
+        raise ValueError("entrada de cache truncada")
+    magic, flags, meta_len, n_segments, payload_len = _HEADER.unpack_from(buffer)
+    if magic != CACHE_MAGIC:
+        raise ValueError("formato de cache desconocido")
+
+    payload = buffer[_HEADER.size:_HEADER.size + payload_len]
+    if flags & FLAG_ZLIB:
+        payload = memoryview(zlib.decompress(payload))
+    meta = json.loads(bytes(payload[:meta_len]))
+    return meta, SegmentTable(payload, meta_len, n_segments)
+
+
+def read_segments(data) -> SegmentTable:
+    """Acceso perezoso a los segmentos de una entrada binaria, sin materializar el resultado"""
+    return _parse(data)[1]
+
+
+def decode_result(data) -> dict:
+    """Deserializa una entrada binaria a un resultado de transcripción"""
+    meta, table = _parse(data)
+    return {**meta, "text": table.full_text, "segments": table.to_list()}
+
+
+class _CacheEntry:
+    """Metadatos de una entrada del cache en disco"""
+
+    __slots__ = ("size", "created", "last_access", "hits")
+
+    def __init__(self, size: int, created: float, last_access: float, hits: int = 0):
+        self.size = size
+        self.created = created
+        self.last_access = last_access
+        self.hits = hits
+
+
+class ResultCache:
+    """
+    Cache acotado de resultados de transcripción.
+
+    Las entradas se guardan en disco como un archivo por clave. El total de bytes
+    se mantiene por debajo de max_bytes expulsando entradas según la política
+    ("lru" o "lfu"). Las entradas más antiguas que ttl_seconds se consideran
+    caducadas. Los resultados usados recientemente se mantienen además en memoria
+    (hasta hot_entries y hot_max_bytes, contando el tamaño de su entrada en disco)
+    para evitar abrir y decodificar el archivo en cada acierto.
+
+    Los aciertos de cada entrada (el orden de "lfu") se guardan con save_hits() en
+    HITS_FILE y se recuperan al arrancar.
+
+    El orden de expulsión se mantiene al día en cada acceso, sin ordenar todas las
+    entradas en cada put: para "lru" el propio índice es un OrderedDict en orden de
+    uso, y para "lfu" un heap de (aciertos, último acceso, clave) en el que las
+    posiciones que quedan obsoletas tras un acierto se descartan al sacarlas.
+
+    Los resultados devueltos son copias superficiales: el llamador puede añadir
+    o reemplazar claves de primer nivel, pero no debe modificar los segmentos.
+    """
+
+    FILE_SUFFIX = ".wtc"
+    HITS_FILE = "hits.idx"
+    # Entradas JSON del formato anterior: "<clave SHA256>.json". La limpieza se hace una
+    # sola vez y deja LEGACY_MARKER para no recorrer el directorio en cada arranque
+    LEGACY_PATTERN = re.compile(r"[0-9a-f]{64}\.json")
+    LEGACY_MARKER = ".legacy_json_removed"
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_bytes: int = 1024 * 1024 * 1024,
+        policy: str = "lru",
+        ttl_seconds: Optional[float] = None,
+        hot_entries: int = 64,
+        hot_max_bytes: int = 64 * 1024 * 1024,
+        compress: bool = True,
+        on_remove: Optional[Callable[[str], None]] = None
+    ):
+        if policy not in CACHE_POLICIES:
+            raise ValueError(f"Política de cache no soportada: {policy}. Opciones: {', '.join(CACHE_POLICIES)}")
+
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.ttl_seconds = ttl_seconds or None
+        self.hot_entries = hot_entries
+        self.hot_max_bytes = hot_max_bytes
+        self.compress = compress
+        # Se llama con la clave de cada entrada expulsada, caducada o borrada
+        self.on_remove = on_remove
+
+        self._lock = threading.RLock()
+        # Índice en orden de uso: la entrada usada hace más tiempo va primero
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        # Solo con "lfu": (aciertos, último acceso, clave), con posiciones obsoletas
+        self._lfu_heap: List[Tuple[int, float, str]] = []
+        # Clave -> (resultado, tamaño de la entrada en disco)
+        self._hot: "OrderedDict[str, Tuple[dict, int]]" = OrderedDict()
+        self._hot_bytes = 0
+        self._total_bytes = 0
+        self._hits_dirty = False
+        self._stats = {
+            "hits": 0,
+            "hot_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._load_index()
+
+    # Índice
+    def _load_index(self):
+        """Reconstruye el índice a partir de los archivos existentes en disco"""
+        self._remove_legacy_entries()
+
+        entries = []
+        for path in self.cache_dir.glob(f"*{self.FILE_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            # mtime guarda la creación y atime el último acierto, así TTL y orden LRU sobreviven a reinicios
+            entries.append((path.stem, _CacheEntry(stat.st_size, stat.st_mtime, stat.st_atime)))
+            self._total_bytes += stat.st_size
+        entries.sort(key=lambda item: item[1].last_access)
+        self._entries.update(entries)
+
+        try:
+            with open(self.cache_dir / self.HITS_FILE, "r", encoding="ascii") as f:
+                for line in f:
+                    key, _, hits = line.partition(" ")
+                    entry = self._entries.get(key)
+                    if entry is not None:
+                        entry.hits = int(hits)
+        except (OSError, ValueError):
+            pass
+
+        if self.policy == "lfu":
+            self._rebuild_lfu_heap()
+        logger.info(f"Cache cargado: {len(self._entries)} entradas, {self._total_bytes} bytes")
+        with self._lock:
+            self._evict_if_needed()
+
+    def _remove_legacy_entries(self):
+        """Borra una vez las entradas del formato anterior, inalcanzables con las claves actuales"""
+        marker = self.cache_dir / self.LEGACY_MARKER
+        if marker.exists():
+            return
+        for path in self.cache_dir.glob("*.json"):
+            if self.LEGACY_PATTERN.fullmatch(path.name):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+        marker.touch()
+
+    def _path_for(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{self.FILE_SUFFIX}"
+
+    # API pública
+    def get(self, key: str) -> Optional[dict]:
+        """Devuelve el resultado cacheado para la clave o None si no existe o caducó"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+
+            now = time.time()
+            if self.ttl_seconds and now - entry.created > self.ttl_seconds:
+                self._remove(key)
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+
+            entry.last_access = now
+            entry.hits += 1
+            self._touch(key, entry)
+            self._hits_dirty = True
+            created = entry.created
+
+            hot = self._hot.get(key)
+            if hot is not None:
+                value = hot[0]
+                self._hot.move_to_end(key)
+                self._stats["hits"] += 1
+                self._stats["hot_hits"] += 1
+                return dict(value)
+
+        path = self._path_for(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            value = decode_result(data)
+            os.utime(path, (now, created))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Entrada de cache ilegible {key}: {e}")
+            with self._lock:
+                self._remove(key)
+                self._stats["misses"] += 1
+            return None
+
+        with self._lock:
+            self._stats["hits"] += 1
+            if key in self._entries:
+                self._remember(key, value, len(data))
+        return dict(value)
+
+    def put(self, key: str, value: dict):
+        """Guarda un resultado en el cache, expulsando entradas si se supera el presupuesto"""
+        data = encode_result(value, compress=self.compress)
+        path = self._path_for(key)
+        tmp_path = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None:
+                self._total_bytes -= previous.size
+            entry = _CacheEntry(len(data), now, now)
+            self._entries[key] = entry
+            self._touch(key, entry)
+            self._total_bytes += len(data)
+            self._remember(key, dict(value), len(data))
+            self._evict_if_needed()
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def record_miss(self):
+        """Cuenta un fallo decidido sin consultar el cache (p. ej. por una clave rápida desconocida)"""
+        with self._lock:
+            self._stats["misses"] += 1
+
+    def clear(self):
+        """Elimina todas las entradas del cache"""
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+            self._lfu_heap = []
+
+    def save_hits(self):
+        """Guarda en disco los aciertos de cada entrada, si cambiaron desde la última vez. Bloqueante."""
+        with self._lock:
+            if not self._hits_dirty:
+                return
+            lines = [f"{key} {entry.hits}\n" for key, entry in self._entries.items() if entry.hits]
+            self._hits_dirty = False
+        path = self.cache_dir / self.HITS_FILE
+        tmp_path = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", encoding="ascii") as f:
+            f.writelines(lines)
+        os.replace(tmp_path, path)
+
+    def stats(self) -> dict:
+        """Contadores de uso del cache"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_ratio": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "hot_entries": len(self._hot),
+                "hot_bytes": self._hot_bytes,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "policy": self.policy,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+    # Internos (llamar con el lock tomado)
+    def _touch(self, key: str, entry: _CacheEntry):
+        """Actualiza la posición de una entrada en el orden de expulsión tras un acceso"""
+        self._entries.move_to_end(key)
+        if self.policy == "lfu":
+            heapq.heappush(self._lfu_heap, (entry.hits, entry.last_access, key))
+            # Cada acierto deja una posición obsoleta: se rehace si el heap dobla al índice
+            if len(self._lfu_heap) > 2 * len(self._entries) + 64:
+                self._rebuild_lfu_heap()
+
+    def _rebuild_lfu_heap(self):
+        self._lfu_heap = [(entry.hits, entry.last_access, key) for key, entry in self._entries.items()]
+        heapq.heapify(self._lfu_heap)
+
+    def _next_victim(self) -> str:
+        """Clave de la próxima entrada a expulsar según la política"""
+        if self.policy == "lfu":
+            while self._lfu_heap:
+                hits, last_access, key = heapq.heappop(self._lfu_heap)
+                entry = self._entries.get(key)
+                if entry is not None and entry.hits == hits and entry.last_access == last_access:
+                    return key
+            # No debería ocurrir: cada entrada tiene su posición vigente en el heap
+            self._rebuild_lfu_heap()
+            return self._next_victim()
+        return next(iter(self._entries))
+
+    def _remember(self, key: str, value: dict, size: int):
+        self._forget(key)
+        if self.hot_entries <= 0 or (self.hot_max_bytes and size > self.hot_max_bytes):
+            return
+        self._hot[key] = (value, size)
+        self._hot_bytes += size
+        while len(self._hot) > self.hot_entries or (self.hot_max_bytes and self._hot_bytes > self.hot_max_bytes):
+            _, (_, evicted_size) = self._hot.popitem(last=False)
+            self._hot_bytes -= evicted_size
+
+    def _forget(self, key: str):
+        hot = self._hot.pop(key, None)
+        if hot is not None:
+            self._hot_bytes -= hot[1]
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        self._forget(key)
+        if entry is not None:
+            self._total_bytes -= entry.size
+            if self.on_remove is not None:
+                self.on_remove(key)
+        try:
+            self._path_for(key).unlink()
+        except OSError:
+            pass
+
+    def _evict_if_needed(self):
+        if self.max_bytes <= 0 or self._total_bytes <= self.max_bytes:
+            return
+
+        while self._entries and self._total_bytes > self.max_bytes:
+            self._remove(self._next_victim())
+            self._stats["evictions"] += 1
+
+
+class PrekeyIndex:
+    """
+    Índice persistente de claves rápidas -> SHA256.
+
+    La clave rápida (tamaño y bloques muestreados) se calcula sin leer el archivo
+    completo. Si no está en el índice, el archivo nunca se ha procesado y se puede
+    evitar el SHA256 antes de transcribir.
+
+    Cada clave rápida se guarda junto a las claves de cache de los resultados de ese
+    audio, y se conserva mientras alguno siga en el cache: el cache avisa de cada
+    entrada que elimina (discard) y, al arrancar, prune() quita las que ya no están.
+    El archivo es un registro al que se añaden líneas "<clave_rápida> <sha256>
+    <clave_de_cache>"; cuando acumula el doble de líneas que entradas vivas se
+    reescribe solo con las vivas.
+    """
+
+    COMPACT_MIN_LINES = 1024
+
+    def __init__(self, index_path: Path):
+        self.index_path = Path(index_path)
+        self._lock = threading.Lock()
+        self._keys: Dict[str, str] = {}
+        # Claves de cache vivas de cada clave rápida, y la clave rápida de cada clave de cache
+        self._cache_keys: Dict[str, Set[str]] = {}
+        self._quick_key_of: Dict[str, str] = {}
+        self._lines = 0
+
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(self.index_path, "r", encoding="ascii") as f:
+                for line in f:
+                    self._lines += 1
+                    parts = line.split()
+                    # Las líneas sin clave de cache son del formato anterior: se descartan
+                    if len(parts) == 3:
+                        self._link(*parts)
+        except FileNotFoundError:
+            pass
+
+    def get(self, quick_key: str) -> Optional[str]:
+        """SHA256 registrado para la clave rápida, o None si nunca se ha visto"""
+        with self._lock:
+            return self._keys.get(quick_key)
+
+    def add(self, quick_key: str, file_hash: str, cache_key: str):
+        """Registra la correspondencia clave rápida -> SHA256 de un resultado guardado en cache"""
+        with self._lock:
+            if self._quick_key_of.get(cache_key) == quick_key and self._keys.get(quick_key) == file_hash:
+                return
+            self._link(quick_key, file_hash, cache_key)
+            with open(self.index_path, "a", encoding="ascii") as f:
+                f.write(f"{quick_key} {file_hash} {cache_key}\n")
+            self._lines += 1
+            self._compact_if_needed()
+
+    def discard(self, cache_key: str):
+        """Olvida una entrada que ya no está en el cache (y la clave rápida si era la última)"""
+        with self._lock:
+            self._unlink(cache_key)
+            self._compact_if_needed()
+
+    def prune(self, is_cached: Callable[[str], bool]):
+        """Quita las entradas que ya no están en el cache y compacta el archivo"""
+        with self._lock:
+            for cache_key in [key for key in self._quick_key_of if not is_cached(key)]:
+                self._unlink(cache_key)
+            if self._lines != len(self._quick_key_of):
+                self._compact()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._keys)
+
+    # Internos (llamar con el lock tomado)
+    def _link(self, quick_key: str, file_hash: str, cache_key: str):
+        if self._keys.get(quick_key) != file_hash:
+            # La clave rápida ahora corresponde a otro audio: sus resultados anteriores ya no cuentan
+            for old_key in self._cache_keys.pop(quick_key, ()):
+                self._quick_key_of.pop(old_key, None)
+        self._unlink(cache_key)
+        self._keys[quick_key] = file_hash
+        self._cache_keys.setdefault(quick_key, set()).add(cache_key)
+        self._quick_key_of[cache_key] = quick_key
+
+    def _unlink(self, cache_key: str):
+        quick_key = self._quick_key_of.pop(cache_key, None)
+        if quick_key is None:
+            return
+        cache_keys = self._cache_keys.get(quick_key)
+        if cache_keys is not None:
+            cache_keys.discard(cache_key)
+            if not cache_keys:
+                del self._cache_keys[quick_key]
+                self._keys.pop(quick_key, None)
+
+    def _compact_if_needed(self):
+        if self._lines > max(self.COMPACT_MIN_LINES, 2 * len(self._quick_key_of)):
+            self._compact()
+
+    def _compact(self):
+        tmp_path = self.index_path.with_name(f".{self.index_path.name}.tmp")
+        with open(tmp_path, "w", encoding="ascii") as f:
+            for cache_key, quick_key in self._quick_key_of.items():
+                f.write(f"{quick_key} {self._keys[quick_key]} {cache_key}\n")
+        os.replace(tmp_path, self.index_path)
+        self._lines = len(self._quick_key_of)
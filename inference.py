@@ -0,0 +1,204 @@
+"""
+Inferencia Whisper sobre audio decodificado
+Decodificación, detección de voz opcional y normalización del resultado. Se usa
+tanto desde los hilos del servidor como desde los procesos de inferencia; el
+modelo se ejecuta con el motor activo del proceso (ver backends.py).
+"""
+
+import logging
+from typing import List, Optional
+
+import numpy as np
+
+from backends import get_backend
+from vad import SAMPLE_RATE, TimelineSpan, concat_spans, detect_speech, frame_energy_db, remap_segments
+
+logger = logging.getLogger(__name__)
+
+
+class PreparedAudio:
+    """Audio decodificado (16 kHz mono) listo para pasar al modelo"""
+
+    def __init__(self, audio: np.ndarray, duration: float, timeline: Optional[List[TimelineSpan]] = None):
+        self.audio = audio
+        self.duration = duration
+        # Correspondencia de tiempos cuando el audio se recortó con VAD
+        self.timeline = timeline
+
+    @property
+    def has_speech(self) -> bool:
+        return len(self.audio) > 0
+
+
+def decode_audio(audio_path: str) -> np.ndarray:
+    """Decodifica un archivo a PCM float32 16 kHz mono (usa ffmpeg a través de whisper)"""
+    import whisper
+    return whisper.load_audio(audio_path, sr=SAMPLE_RATE)
+
+
+def prepare_audio(audio: np.ndarray, vad: bool = False) -> PreparedAudio:
+    """Prepara el PCM decodificado y, si se pide, elimina los tramos sin voz"""
+    duration = len(audio) / SAMPLE_RATE
+    if not vad:
+        return PreparedAudio(audio, duration)
+
+    spans = detect_speech(audio)
+    if not spans:
+        logger.info("VAD: no se detectó voz")
+        return PreparedAudio(np.zeros(0, dtype=np.float32), duration, timeline=[])
+
+    speech, timeline = concat_spans(audio, spans)
+    logger.info(
+        f"VAD: {len(spans)} tramos con voz, {len(speech) / SAMPLE_RATE:.1f}s de {duration:.1f}s"
+    )
+    return PreparedAudio(speech, duration, timeline)
+
+
+class AudioWindow:
+    """
+    Ventana de un audio largo, en muestras.
+
+    [start, end) es el audio que se transcribe (incluye solapamiento con las
+    ventanas vecinas) y [own_start, own_end) la parte de la que esta ventana es
+    responsable al unir los resultados.
+    """
+
+    def __init__(self, start: int, end: int, own_start: int, own_end: int):
+        self.start = start
+        self.end = end
+        self.own_start = own_start
+        self.own_end = own_end
+
+
+def plan_windows(
+    audio: np.ndarray,
+    window_seconds: float,
+    overlap_seconds: float = 2.0,
+    search_seconds: float = 10.0,
+    sample_rate: int = SAMPLE_RATE
+) -> List[AudioWindow]:
+    """
+    Divide el audio en ventanas de como máximo window_seconds cortando en silencios.
+
+    Cada corte se coloca en la trama de menor energía dentro de los search_seconds
+    anteriores al corte nominal, para no partir palabras.
+    """
+    total = len(audio)
+    window = int(window_seconds * sample_rate)
+    if window <= 0 or total <= window:
+        return [AudioWindow(0, total, 0, total)]
+
+    frame = int(sample_rate * 0.03)
+    energy = frame_energy_db(audio, frame)
+    search = int(search_seconds * sample_rate)
+    overlap = int(overlap_seconds * sample_rate)
+
+    cuts = [0]
+    while total - cuts[-1] > window:
+        nominal = cuts[-1] + window
+        first_frame = max(cuts[-1] + window // 2, nominal - search) // frame
+        last_frame = nominal // frame
+        candidates = energy[first_frame:last_frame]
+        cut = (first_frame + int(np.argmin(candidates))) * frame if len(candidates) else nominal
+        cuts.append(cut)
+    cuts.append(total)
+
+    return [
+        AudioWindow(max(0, own_start - overlap), min(total, own_end + overlap), own_start, own_end)
+        for own_start, own_end in zip(cuts[:-1], cuts[1:])
+    ]
+
+
+class SegmentStitcher:
+    """
+    Une los resultados de las ventanas, en orden, en una sola lista de segmentos.
+
+    Los tiempos pasan a ser relativos al audio completo; de la zona solapada se
+    conserva cada segmento solo en la ventana responsable de su punto medio, y los
+    ids se renumeran para que sean continuos.
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.segments: List[dict] = []
+        self.language: Optional[str] = None
+
+    def add(self, window: AudioWindow, result: dict) -> List[dict]:
+        """Añade el resultado de la siguiente ventana y devuelve los segmentos nuevos"""
+        offset = window.start / self.sample_rate
+        own_start = window.own_start / self.sample_rate
+        own_end = window.own_end / self.sample_rate
+        first = len(self.segments)
+        for seg in result["segments"]:
+            start = seg["start"] + offset
+            end = seg["end"] + offset
+            if not own_start <= (start + end) / 2 < own_end:
+                continue
+            if self.segments and start < self.segments[-1]["end"]:
+                start = self.segments[-1]["end"]
+            self.segments.append({"id": len(self.segments), "start": start, "end": max(start, end), "text": seg["text"]})
+        self.language = self.language or result.get("language")
+        return self.segments[first:]
+
+    def result(self) -> dict:
+        return {
+            "text": "".join(seg["text"] for seg in self.segments),
+            "language": self.language,
+            "segments": self.segments,
+        }
+
+
+def stitch_windows(
+    windows: List[AudioWindow],
+    results: List[dict],
+    sample_rate: int = SAMPLE_RATE
+) -> dict:
+    """Une los resultados de todas las ventanas en un único resultado"""
+    stitcher = SegmentStitcher(sample_rate)
+    for window, result in zip(windows, results):
+        stitcher.add(window, result)
+    return stitcher.result()
+
+
+def detect_language(model, audio: np.ndarray) -> str:
+    """Detecta el idioma con los primeros 30 segundos del audio"""
+    return get_backend().detect_language(model, audio)
+
+
+def transcribe_array(model, audio: np.ndarray, transcribe_options: dict) -> dict:
+    """Ejecuta el modelo sobre un array PCM; los tiempos son relativos al inicio del array"""
+    return get_backend().transcribe(model, audio, transcribe_options)
+
+
+def transcribe_batch(model, audios: List[np.ndarray], transcribe_options: dict) -> List[dict]:
+    """Transcribe varios audios de hasta 30 segundos en una sola pasada del modelo"""
+    return get_backend().transcribe_batch(model, audios, transcribe_options)
+
+
+def empty_result(prepared: PreparedAudio, transcribe_options: dict) -> dict:
+    """Resultado de un audio sin voz"""
+    return {
+        "text": "",
+        "language": transcribe_options.get("language"),
+        "segments": [],
+        "duration": prepared.duration,
+    }
+
+
+def original_segments(segments: List[dict], prepared: PreparedAudio) -> List[dict]:
+    """Lleva los tiempos de los segmentos a la línea de tiempo original (si hubo VAD)"""
+    if prepared.timeline:
+        return remap_segments(segments, prepared.timeline)
+    return segments
+
+
+def finish_result(result: dict, prepared: PreparedAudio) -> dict:
+    """Lleva los tiempos a la línea de tiempo original y añade la duración"""
+    return {**result, "segments": original_segments(result["segments"], prepared), "duration": prepared.duration}
+
+
+def transcribe_prepared(model, prepared: PreparedAudio, transcribe_options: dict) -> dict:
+    """Ejecuta el modelo sobre el audio preparado y devuelve solo los campos que usa la API"""
+    if not prepared.has_speech:
+        return empty_result(prepared, transcribe_options)
+    return finish_result(transcribe_array(model, prepared.audio, transcribe_options), prepared)
@@ -0,0 +1,301 @@
+"""
+Planificador de trabajos de transcripción
+Cola acotada con un número fijo de slots de inferencia, consulta de estado por trabajo,
+publicación de eventos de progreso a los clientes suscritos y agrupación de trabajos
+idénticos en curso.
+"""
+
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """La cola de trabajos alcanzó su límite"""
+
+
+class SchedulerUnavailableError(Exception):
+    """El planificador no está aceptando trabajos (no iniciado o deteniéndose)"""
+
+
+# Trabajo que se está ejecutando en la tarea actual (lo fija el trabajador del planificador)
+_current_job: ContextVar[Optional["Job"]] = ContextVar("current_job", default=None)
+
+
+def current_job() -> Optional["Job"]:
+    """Trabajo en ejecución en la tarea actual, o None fuera del planificador"""
+    return _current_job.get()
+
+
+class Job:
+    """Un trabajo enviado al planificador"""
+
+    def __init__(self, func: Callable[[], Awaitable[Any]], metadata: Optional[dict] = None):
+        self.id = uuid.uuid4().hex
+        self.func = func
+        self.metadata = metadata or {}
+        self.status = JOB_QUEUED
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self._loop = asyncio.get_running_loop()
+        self.future: asyncio.Future = self._loop.create_future()
+        # Eventos publicados mientras el trabajo no ha terminado, para los suscriptores que llegan tarde
+        self.events: List[dict] = []
+        self._subscribers: List[asyncio.Queue] = []
+
+    @property
+    def done(self) -> bool:
+        return self.status in (JOB_COMPLETED, JOB_FAILED)
+
+    async def wait(self) -> Any:
+        """Espera a que termine el trabajo y devuelve su resultado (o relanza su error)"""
+        return await asyncio.shield(self.future)
+
+    def publish(self, event: dict):
+        """Publica un evento de progreso (llamar desde el event loop)"""
+        if self.done:
+            return
+        self.events.append(event)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def publish_threadsafe(self, event: dict):
+        """Publica un evento desde un hilo del executor"""
+        self._loop.call_soon_threadsafe(self.publish, event)
+
+    async def subscribe(self) -> AsyncIterator[dict]:
+        """Devuelve los eventos ya publicados y los nuevos hasta que el trabajo termine"""
+        if self.done:
+            return
+        queue: asyncio.Queue = asyncio.Queue()
+        for event in self.events:
+            queue.put_nowait(event)
+        self._subscribers.append(queue)
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            self._subscribers.remove(queue)
+
+    def _close_events(self):
+        # Fin del flujo de eventos: el resultado final se consulta con wait()
+        self.events = []
+        for queue in self._subscribers:
+            queue.put_nowait(None)
+
+    def to_dict(self, include_result: bool = True) -> dict:
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            **self.metadata,
+        }
+        if self.error is not None:
+            data["error"] = self.error
+        if include_result and self.status == JOB_COMPLETED:
+            data["result"] = self.result
+        return data
+
+
+class JobScheduler:
+    """
+    Ejecuta trabajos con concurrencia acotada.
+
+    Hay `slots` trabajadores que toman trabajos de una cola de como máximo
+    `max_queue` trabajos en espera. Cuando la cola está llena, submit() lanza
+    QueueFullError en lugar de aceptar más trabajo, de modo que ante ráfagas la
+    latencia crece de forma predecible. Los trabajos terminados se conservan
+    (hasta `max_history`) para poder consultar su estado.
+    """
+
+    def __init__(self, slots: int = 1, max_queue: int = 32, max_history: int = 500):
+        self.slots = max(1, slots)
+        self.max_queue = max(1, max_queue)
+        self.max_history = max_history
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._running = 0
+        self._accepting = False
+
+    async def start(self):
+        """Arranca los trabajadores (llamar desde el event loop de la aplicación)"""
+        if self._accepting:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.slots)]
+        self._accepting = True
+        logger.info(f"Planificador iniciado: {self.slots} slots, cola máxima {self.max_queue}")
+
+    async def stop(self):
+        """Deja de aceptar trabajos y cancela los trabajadores"""
+        self._accepting = False
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, func: Callable[[], Awaitable[Any]], metadata: Optional[dict] = None) -> Job:
+        """
+        Encola un trabajo. `func` es una función sin argumentos que devuelve la corrutina a ejecutar.
+
+        Raises:
+            SchedulerUnavailableError: si el planificador no está aceptando trabajos
+            QueueFullError: si la cola de espera está llena
+        """
+        if not self._accepting:
+            raise SchedulerUnavailableError("El planificador de trabajos no está disponible")
+
+        job = Job(func, metadata)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Cola de trabajos llena ({self.max_queue} en espera)")
+
+        self._jobs[job.id] = job
+        self._trim_history()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def stats(self) -> dict:
+        return {
+            "slots": self.slots,
+            "running": self._running,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "accepting": self._accepting,
+        }
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            job.status = JOB_RUNNING
+            job.started_at = datetime.now()
+            self._running += 1
+            token = _current_job.set(job)
+            try:
+                job.result = await job.func()
+                job.status = JOB_COMPLETED
+                job.future.set_result(job.result)
+            except asyncio.CancelledError:
+                job.status = JOB_FAILED
+                job.error = "Trabajo cancelado"
+                job.future.cancel()
+                raise
+            except Exception as e:
+                job.status = JOB_FAILED
+                job.error = getattr(e, "detail", None) or str(e)
+                job.future.set_exception(e)
+                # Evitar avisos de "exception was never retrieved" si nadie espera el trabajo
+                job.future.exception()
+                logger.error(f"Trabajo {job.id} falló: {job.error}")
+            finally:
+                _current_job.reset(token)
+                job.finished_at = datetime.now()
+                self._running -= 1
+                job.func = None
+                job._close_events()
+                self._queue.task_done()
+
+    def _trim_history(self):
+        # Descartar los trabajos terminados más antiguos
+        if len(self._jobs) <= self.max_history:
+            return
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_history:
+                break
+            if self._jobs[job_id].done:
+                del self._jobs[job_id]
+
+
+class _Flight:
+    """Una ejecución en curso y el trabajo que la lanzó"""
+
+    def __init__(self, task: asyncio.Task, job: Optional[Job]):
+        self.task = task
+        self.job = job
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Agrupa las ejecuciones idénticas que coinciden en el tiempo.
+
+    La primera llamada a run() con una clave ejecuta `func`; las que llegan con la
+    misma clave mientras tanto esperan ese mismo resultado (o error) en lugar de
+    repetir el trabajo, y sus trabajos reciben los eventos de progreso del trabajo
+    que lo está ejecutando. La ejecución es una tarea aparte: si se cancela uno de
+    los que esperan, los demás siguen recibiendo el resultado.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._stats = {"executions": 0, "coalesced": 0}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Ejecuta `func` o, si ya hay una ejecución con esa clave, espera su resultado"""
+        flight = self._flights.get(key)
+        if flight is None:
+            # La tarea hereda el contexto: current_job() sigue siendo el trabajo que la lanzó
+            task = asyncio.ensure_future(func())
+            flight = _Flight(task, current_job())
+            self._flights[key] = flight
+            task.add_done_callback(lambda done: self._finish(key, flight, done))
+            self._stats["executions"] += 1
+            return await asyncio.shield(task)
+
+        flight.followers += 1
+        self._stats["coalesced"] += 1
+        job = current_job()
+        forwarder = None
+        if job is not None and flight.job is not None and flight.job is not job:
+            forwarder = asyncio.ensure_future(self._forward_events(flight.job, job))
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.followers -= 1
+            if forwarder is not None:
+                forwarder.cancel()
+
+    @staticmethod
+    async def _forward_events(source: Job, target: Job):
+        async for event in source.subscribe():
+            target.publish(event)
+
+    def _finish(self, key: Hashable, flight: _Flight, task: asyncio.Task):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Evitar avisos de "exception was never retrieved" si todos los que esperaban se cancelaron
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "in_flight": len(self._flights),
+            "waiting": sum(flight.followers for flight in self._flights.values()),
+        }
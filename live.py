@@ -0,0 +1,205 @@
+"""
+Transcripción en directo
+Búfer de audio con ventana deslizante: cada paso transcribe el audio aún no
+confirmado, confirma los segmentos estables y devuelve el resto como provisional.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from inference import transcribe_array
+from model_registry import ModelRegistry
+from vad import SAMPLE_RATE
+
+# Formatos de muestra aceptados en los mensajes binarios (little endian, mono, 16 kHz)
+SAMPLE_FORMATS = {
+    "pcm_s16le": np.dtype("<i2"),
+    "pcm_f32le": np.dtype("<f4"),
+}
+
+# Audio mínimo para que merezca la pena llamar al modelo
+MIN_DECODE_SECONDS = 0.3
+# Texto confirmado que se pasa como contexto a la siguiente ventana
+PROMPT_CHARS = 200
+
+
+class LiveTranscriber:
+    """
+    Estado de una sesión de transcripción en directo.
+
+    feed() añade audio desde el event loop y step() lo transcribe desde un hilo del
+    executor. Cada paso decodifica el búfer pendiente (como mucho unos
+    max_window_seconds); todos los segmentos menos el último se dan por definitivos
+    y el búfer avanza hasta el final del último confirmado. El último segmento puede
+    estar cortado a mitad de palabra, así que se devuelve como provisional y se
+    vuelve a decodificar en el paso siguiente con más audio.
+    """
+
+    def __init__(
+        self,
+        sample_format: str = "pcm_s16le",
+        max_window_seconds: float = 15.0,
+        min_step_seconds: float = 1.0,
+        sample_rate: int = SAMPLE_RATE
+    ):
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(
+                f"Formato de audio no soportado: {sample_format}. Formatos: {', '.join(SAMPLE_FORMATS)}"
+            )
+        self.dtype = SAMPLE_FORMATS[sample_format]
+        self.sample_rate = sample_rate
+        self.max_window = int(max_window_seconds * sample_rate)
+        self.min_step = int(min_step_seconds * sample_rate)
+
+        self._lock = threading.Lock()
+        self._partial = b""  # Bytes de una muestra incompleta al final del último mensaje
+        self._buffer = np.zeros(0, dtype=np.float32)  # Audio aún no confirmado
+        self._buffer_start = 0  # Posición (en muestras) de _buffer[0] en la sesión
+        self._decoded_until = 0  # Muestras recibidas en el último paso
+
+        self.language: Optional[str] = None
+        self.segments: List[dict] = []  # Segmentos confirmados
+
+    @property
+    def total_samples(self) -> int:
+        return self._buffer_start + len(self._buffer)
+
+    @property
+    def duration(self) -> float:
+        return self.total_samples / self.sample_rate
+
+    @property
+    def ready(self) -> bool:
+        """Hay audio nuevo suficiente para un paso"""
+        return self.total_samples - self._decoded_until >= self.min_step
+
+    def feed(self, data: bytes):
+        """Añade un mensaje binario de audio"""
+        data = self._partial + data
+        usable = len(data) - len(data) % self.dtype.itemsize
+        self._partial = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype=self.dtype)
+        if self.dtype.kind == "i":
+            samples = samples.astype(np.float32) / 32768.0
+        with self._lock:
+            self._buffer = np.concatenate((self._buffer, samples.astype(np.float32, copy=False)))
+
+    def step(self, model, transcribe_options: dict, final: bool = False) -> Tuple[List[dict], List[dict]]:
+        """
+        Transcribe el búfer pendiente. Bloqueante: llamar desde un hilo del executor.
+
+        Devuelve (segmentos confirmados en este paso, segmentos provisionales). Con
+        final=True se confirma todo el audio pendiente.
+        """
+        with self._lock:
+            audio = self._buffer
+            start = self._buffer_start
+        self._decoded_until = start + len(audio)
+        if len(audio) < MIN_DECODE_SECONDS * self.sample_rate:
+            return [], []
+
+        options = {**transcribe_options, "condition_on_previous_text": False, "temperature": 0.0}
+        if self.language and not options.get("language"):
+            options["language"] = self.language
+        prompt = "".join(seg["text"] for seg in self.segments)[-PROMPT_CHARS:]
+        if prompt:
+            options["initial_prompt"] = prompt
+
+        result = transcribe_array(model, audio, options)
+        self.language = self.language or result.get("language")
+
+        offset = start / self.sample_rate
+        limit = (start + len(audio)) / self.sample_rate
+        decoded = [
+            {"start": min(seg["start"] + offset, limit), "end": min(seg["end"] + offset, limit), "text": seg["text"]}
+            for seg in result["segments"]
+            if seg["text"].strip()
+        ]
+
+        if final:
+            stable, provisional = decoded, []
+        elif len(audio) >= self.max_window and len(decoded) == 1:
+            # Una sola frase larga que llena la ventana: confirmarla para no crecer sin límite
+            stable, provisional = decoded, []
+        else:
+            stable, provisional = decoded[:-1], decoded[-1:]
+
+        committed = []
+        for seg in stable:
+            seg = {"id": len(self.segments), **seg}
+            self.segments.append(seg)
+            committed.append(seg)
+
+        # Avanzar el búfer hasta el final de lo confirmado; sin voz, conservar solo la última ventana
+        if final:
+            cut = start + len(audio)
+        elif committed:
+            cut = int(committed[-1]["end"] * self.sample_rate)
+        elif not decoded:
+            cut = start + len(audio) - self.max_window // 2
+        else:
+            cut = start
+        with self._lock:
+            cut = min(max(cut, self._buffer_start), self._buffer_start + len(self._buffer))
+            self._buffer = self._buffer[cut - self._buffer_start:]
+            self._buffer_start = cut
+
+        next_id = len(self.segments)
+        provisional = [{"id": next_id + i, **seg} for i, seg in enumerate(provisional)]
+        return committed, provisional
+
+    def result(self) -> dict:
+        """Transcripción confirmada de la sesión"""
+        return {
+            "text": "".join(seg["text"] for seg in self.segments).strip(),
+            "language": self.language or "unknown",
+            "segments": [{**seg, "text": seg["text"].strip()} for seg in self.segments],
+            "duration": self.duration,
+        }
+
+
+class LiveInference:
+    """
+    Inferencia de las sesiones en directo, separada de la de los trabajos de archivos.
+
+    Tiene sus propios hilos y su propio registro de modelos (otra instancia de cada
+    modelo, con su propio lock): un paso de una sesión solo espera a los pasos de
+    otras sesiones, que duran como mucho una ventana, y nunca a un archivo completo
+    que ocupa el modelo de los trabajos.
+    """
+
+    def __init__(self, registry: ModelRegistry, max_workers: int):
+        self.registry = registry
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="live")
+
+    async def load(self, model_name: str):
+        """Carga el modelo de las sesiones en directo si aún no lo está"""
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._load, model_name)
+
+    async def step(
+        self,
+        transcriber: LiveTranscriber,
+        model_name: str,
+        transcribe_options: dict,
+        final: bool = False
+    ) -> Tuple[List[dict], List[dict]]:
+        """Ejecuta un paso de la sesión (ver LiveTranscriber.step) en los hilos propios"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, self._step, transcriber, model_name, transcribe_options, final
+        )
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _load(self, model_name: str):
+        with self.registry.acquire(model_name):
+            pass
+
+    def _step(self, transcriber: LiveTranscriber, model_name: str, transcribe_options: dict, final: bool):
+        with self.registry.acquire(model_name) as loaded:
+            with loaded.lock:
+                return transcriber.step(loaded.model, transcribe_options, final)
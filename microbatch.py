@@ -0,0 +1,89 @@
+"""
+Micro-lotes de inferencia
+Agrupa los audios cortos de trabajos distintos que llegan casi a la vez para
+transcribirlos en una sola pasada del modelo, y devuelve a cada trabajo su resultado.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Ejecuta un lote: recibe la clave del grupo y los elementos, devuelve un resultado por elemento
+BatchFunction = Callable[[Hashable, List[Any]], Awaitable[List[Any]]]
+
+
+class MicroBatcher:
+    """
+    Reúne elementos con la misma clave en lotes de hasta `max_batch`.
+
+    Un lote se lanza en cuanto se llena o cuando han pasado `max_wait` segundos
+    desde que llegó su primer elemento, de modo que un audio solo nunca espera más
+    que eso. Como mucho se ejecutan `max_concurrent` lotes a la vez; si falla el
+    lote, todos sus elementos reciben la excepción.
+    """
+
+    def __init__(self, run_batch: BatchFunction, max_batch: int, max_wait: float, max_concurrent: int = 1):
+        self.run_batch = run_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait)
+        self._slots = asyncio.Semaphore(max(1, max_concurrent))
+        self._pending: Dict[Hashable, List[Tuple[Any, asyncio.Future]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._stats = {"batches": 0, "items": 0, "max_size": 0}
+
+    async def submit(self, key: Hashable, item: Any) -> Any:
+        """Añade un elemento al lote de su clave y espera su resultado"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(key, [])
+        pending.append((item, future))
+        if len(pending) >= self.max_batch:
+            self._flush(key)
+        elif len(pending) == 1:
+            self._timers[key] = loop.call_later(self.max_wait, self._flush, key)
+        return await future
+
+    def _flush(self, key: Hashable):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        entries = self._pending.pop(key, [])
+        if not entries:
+            return
+        task = asyncio.ensure_future(self._run(key, entries))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: Hashable, entries: List[Tuple[Any, asyncio.Future]]):
+        async with self._slots:
+            # Los trabajos cancelados mientras esperaban no ocupan sitio en el lote
+            entries = [(item, future) for item, future in entries if not future.done()]
+            if not entries:
+                return
+            self._stats["batches"] += 1
+            self._stats["items"] += len(entries)
+            self._stats["max_size"] = max(self._stats["max_size"], len(entries))
+            logger.info(f"Micro-lote de {len(entries)} audios")
+            try:
+                results = await self.run_batch(key, [item for item, _ in entries])
+            except Exception as e:
+                for _, future in entries:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            for (_, future), result in zip(entries, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> dict:
+        batches = self._stats["batches"]
+        return {
+            **self._stats,
+            "max_batch": self.max_batch,
+            "max_wait_ms": int(self.max_wait * 1000),
+            "pending": sum(len(entries) for entries in self._pending.values()),
+            "avg_size": round(self._stats["items"] / batches, 2) if batches else 0,
+        }
@@ -0,0 +1,173 @@
+"""
+Registro de modelos Whisper
+Carga los modelos bajo demanda, los mantiene en un LRU acotado por memoria y
+descarga los que llevan tiempo sin usarse.
+"""
+
+import gc
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_model_bytes(model) -> int:
+    """Memoria aproximada que ocupan los parámetros y buffers de un modelo torch"""
+    total = 0
+    for tensor in list(model.parameters()) + list(getattr(model, "buffers", lambda: [])()):
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class _LoadedModel:
+    """Un modelo cargado y su estado en el registro"""
+
+    def __init__(self, name: str, model: Any, size_bytes: int):
+        self.name = name
+        self.model = model
+        self.size_bytes = size_bytes
+        self.last_used = time.time()
+        self.in_use = 0
+        # model.transcribe instala hooks de kv-cache sobre el propio modelo, así que
+        # las transcripciones sobre una misma instancia deben serializarse
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    Modelos cargados por nombre con expulsión LRU.
+
+    Los modelos se cargan con `loader(name)` la primera vez que se piden y su tamaño
+    se mide con `size_of(model)`. Cuando la memoria total supera max_bytes se
+    descargan los menos usados recientemente, y unload_idle() descarga los que no
+    se usan desde hace idle_seconds. Los modelos
+    en uso y los fijados con `pinned` nunca se descargan.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], Any],
+        max_bytes: int = 4 * 1024 * 1024 * 1024,
+        idle_seconds: float = 900,
+        pinned: Optional[Set[str]] = None,
+        size_of: Callable[[Any], int] = estimate_model_bytes
+    ):
+        self.loader = loader
+        self.size_of = size_of
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.pinned = set(pinned or ())
+
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._models: "OrderedDict[str, _LoadedModel]" = OrderedDict()
+        self._stats = {"loads": 0, "hits": 0, "evictions": 0, "idle_unloads": 0}
+
+    def add(self, name: str, model: Any):
+        """Registra un modelo ya cargado"""
+        with self._lock:
+            self._models[name] = _LoadedModel(name, model, self.size_of(model))
+            self._models.move_to_end(name)
+            self._evict_if_needed()
+
+    def is_loaded(self, name: str) -> bool:
+        with self._lock:
+            return name in self._models
+
+    @contextmanager
+    def acquire(self, name: str) -> Iterator[_LoadedModel]:
+        """
+        Obtiene un modelo (cargándolo si hace falta) y lo marca en uso mientras dure el bloque.
+
+        Bloqueante: la carga puede tardar, llamar desde un hilo del executor.
+        """
+        entry = self._get_or_load(name)
+        try:
+            yield entry
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.time()
+                self._evict_if_needed()
+
+    def unload_idle(self) -> int:
+        """Descarga los modelos sin uso desde hace idle_seconds; devuelve cuántos se descargaron"""
+        if not self.idle_seconds:
+            return 0
+        now = time.time()
+        with self._lock:
+            idle = [
+                name for name, entry in self._models.items()
+                if entry.in_use == 0 and name not in self.pinned and now - entry.last_used > self.idle_seconds
+            ]
+            for name in idle:
+                self._unload(name)
+                self._stats["idle_unloads"] += 1
+        if idle:
+            gc.collect()
+        return len(idle)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "loaded": {
+                    name: {"bytes": entry.size_bytes, "in_use": entry.in_use, "last_used": entry.last_used}
+                    for name, entry in self._models.items()
+                },
+                "bytes": sum(entry.size_bytes for entry in self._models.values()),
+                "max_bytes": self.max_bytes,
+            }
+
+    def _get_or_load(self, name: str) -> _LoadedModel:
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is not None:
+                entry.in_use += 1
+                self._models.move_to_end(name)
+                self._stats["hits"] += 1
+                return entry
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # Un solo hilo carga cada modelo; los demás esperan y lo reutilizan
+        with load_lock:
+            with self._lock:
+                entry = self._models.get(name)
+                if entry is not None:
+                    entry.in_use += 1
+                    self._models.move_to_end(name)
+                    self._stats["hits"] += 1
+                    return entry
+
+            logger.info(f"Cargando modelo Whisper: {name}...")
+            model = self.loader(name)
+            entry = _LoadedModel(name, model, self.size_of(model))
+            logger.info(f"Modelo '{name}' cargado ({entry.size_bytes / (1024 * 1024):.0f}MB)")
+
+            with self._lock:
+                entry.in_use += 1
+                self._models[name] = entry
+                self._stats["loads"] += 1
+                self._evict_if_needed()
+            return entry
+
+    # Internos (llamar con el lock tomado)
+    def _unload(self, name: str):
+        self._models.pop(name, None)
+        logger.info(f"Modelo '{name}' descargado")
+
+    def _evict_if_needed(self):
+        total = sum(entry.size_bytes for entry in self._models.values())
+        for name in list(self._models):
+            if total <= self.max_bytes:
+                break
+            entry = self._models[name]
+            if entry.in_use or name in self.pinned:
+                continue
+            total -= entry.size_bytes
+            self._unload(name)
+            self._stats["evictions"] += 1
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Float, Text
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, String, DateTime, Float, Text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -19,13 +19,23 @@ class Transcript(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, index=True)
-    text = Column(Text)
+    # Solo en registros antiguos: el texto y los segmentos ahora se guardan en el almacén de blobs
+    text = Column(Text, nullable=True)
+    # Referencia de la transcripción en el almacén de blobs (ver blob_store.TranscriptBlobs)
+    blob_ref = Column(String(64), nullable=True)
+    segment_count = Column(Integer, nullable=True)
     language = Column(String)
     duration = Column(Float)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # El listado pagina por (created_at, id): no puede quedar vacía (ver fill_nulls al arrancar)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"))
     
     # Guardamos la ruta del archivo físico por si acaso, aunque idealmente estaría en S3/Blob Storage
     file_path = Column(String) 
 
     owner = relationship("User", back_populates="transcripts")
+
+    # Listado paginado por usuario en orden (created_at, id) sin recorrer toda la tabla
+    __table_args__ = (
+        Index("ix_transcripts_user_created", "user_id", "created_at", "id"),
+    )
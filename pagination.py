@@ -0,0 +1,29 @@
+"""
+Paginación por clave (keyset) de los listados
+El cursor es opaco para el cliente: codifica la posición (created_at, id) del último
+registro de una página, y la página siguiente empieza justo después en ese orden.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Tuple
+
+
+class InvalidCursorError(Exception):
+    """El cursor no lo generó encode_cursor o está dañado"""
+
+
+def encode_cursor(created_at: datetime, record_id: int) -> str:
+    """Cursor opaco con la posición (created_at, id) del último registro de una página"""
+    data = json.dumps([created_at.isoformat(), record_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Posición (created_at, id) codificada en un cursor"""
+    try:
+        created_at, record_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(created_at), int(record_id)
+    except (ValueError, TypeError):
+        raise InvalidCursorError("Cursor no válido")
@@ -0,0 +1,145 @@
+"""
+Almacén de audio decodificado
+Guarda el PCM 16 kHz mono (float32) de cada archivo como .npy con su SHA256 como
+nombre, para que reintentos, traducciones o cambios de modelo no vuelvan a lanzar
+ffmpeg. Los .npy se abren con mmap: el modelo lee las muestras directamente de la
+caché de páginas del sistema, sin copiarlas a memoria del proceso.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class PcmStore:
+    """
+    Artefactos PCM por hash de contenido, con un presupuesto de disco.
+
+    Al superar max_bytes se borran los artefactos usados hace más tiempo (la
+    fecha de modificación se actualiza en cada uso). max_bytes=0 desactiva el
+    almacén: put() no guarda nada.
+
+    lookup() y put() devuelven el artefacto fijado: no se expulsa hasta que se llama
+    a release(), porque los procesos de inferencia lo abren por su ruta en cada
+    ventana mientras dura el trabajo.
+    """
+
+    SUFFIX = ".npy"
+
+    def __init__(self, directory: Path, max_bytes: int = 2 * 1024 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+        # Trabajos en curso que usan cada artefacto
+        self._pins: Dict[Path, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def path_for(self, file_hash: str) -> Path:
+        return self.directory / f"{file_hash}{self.SUFFIX}"
+
+    def lookup(self, file_hash: str) -> Optional[Path]:
+        """Ruta del artefacto fijado si existe (y lo marca como usado), o None"""
+        path = self.path_for(file_hash)
+        # Bajo el lock: una expulsión no puede borrarlo entre la comprobación y el fijado
+        with self._lock:
+            try:
+                os.utime(path)
+            except OSError:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            self._pin(path)
+        return path
+
+    def release(self, path: Path):
+        """Libera un artefacto devuelto por lookup() o put()"""
+        with self._lock:
+            count = self._pins.get(path, 0) - 1
+            if count > 0:
+                self._pins[path] = count
+            else:
+                self._pins.pop(path, None)
+
+    def _pin(self, path: Path):
+        self._pins[path] = self._pins.get(path, 0) + 1
+
+    def put(self, file_hash: str, audio: np.ndarray) -> Optional[Path]:
+        """Guarda el PCM decodificado y devuelve su ruta fijada (None si el almacén está desactivado)"""
+        if not self.enabled:
+            return None
+        path = self.path_for(file_hash)
+        # Escribir en un temporal y renombrar: un lector nunca ve un .npy a medias
+        tmp_path = self.directory / f".{file_hash}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.asarray(audio, dtype=np.float32))
+        with self._lock:
+            os.replace(tmp_path, path)
+            self._pin(path)
+        self._evict_if_needed()
+        return path
+
+    @staticmethod
+    def load(path: Path) -> np.ndarray:
+        """Abre un artefacto como array de solo lectura mapeado en memoria"""
+        return np.load(path, mmap_mode="r")
+
+    def stats(self) -> dict:
+        files = list(self.directory.glob(f"*{self.SUFFIX}"))
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(files),
+                "bytes": sum(f.stat().st_size for f in files if f.exists()),
+                "max_bytes": self.max_bytes,
+                "pinned": len(self._pins),
+            }
+
+    def _evict_if_needed(self):
+        with self._lock:
+            entries = []
+            for path in self.directory.glob(f"*{self.SUFFIX}"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path in self._pins:
+                    continue
+                try:
+                    path.unlink()
+                except OSError:
+                    # En Windows no se puede borrar un archivo mapeado: se reintenta en la próxima expulsión
+                    continue
+                total -= size
+                self._stats["evictions"] += 1
+                logger.info(f"Audio decodificado expulsado: {path.name}")
+
+    def cleanup_temp(self, max_age_seconds: float = 3600) -> int:
+        """Borra temporales de escrituras interrumpidas"""
+        removed = 0
+        now = time.time()
+        for path in self.directory.glob(".*.tmp"):
+            try:
+                if now - path.stat().st_mtime > max_age_seconds:
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                continue
+        return removed
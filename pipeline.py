@@ -0,0 +1,63 @@
+"""
+Etapas del pipeline de transcripción
+Decodificación (ffmpeg, E/S), inferencia (CPU) y exportación (disco y base de datos)
+tienen cada una su propia concurrencia y su propia cola acotada, de modo que mientras
+un archivo ocupa la inferencia el siguiente ya se está decodificando.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+from jobs import current_job
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    """
+    Una etapa con `concurrency` ejecuciones simultáneas y hasta `max_queue` en espera.
+
+    Cuando la cola de la etapa está llena, run() no rechaza: espera antes de entrar
+    en la cola, y esa espera frena a la etapa anterior (contrapresión). Así, por
+    ejemplo, no se acumulan más audios decodificados de los que la inferencia puede
+    consumir.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue: int):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(0, max_queue)
+        self._admission = asyncio.Semaphore(self.concurrency + self.max_queue)
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._waiting = 0
+        self._running = 0
+        self._completed = 0
+
+    async def run(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Ejecuta la corrutina que devuelve `func` cuando la etapa tiene un hueco"""
+        job = current_job()
+        async with self._admission:
+            self._waiting += 1
+            try:
+                await self._slots.acquire()
+            finally:
+                self._waiting -= 1
+            self._running += 1
+            if job is not None:
+                job.metadata["stage"] = self.name
+            try:
+                return await func()
+            finally:
+                self._running -= 1
+                self._completed += 1
+                self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            "running": self._running,
+            "queued": self._waiting,
+            "completed": self._completed,
+        }
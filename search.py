@@ -0,0 +1,262 @@
+"""
+Búsqueda de texto completo en las transcripciones
+Índice invertido con una fila por segmento: cada acierto lleva el id del segmento y
+sus tiempos, para saltar directamente a ese punto del audio. El índice se actualiza
+en la misma transacción que guarda la transcripción.
+
+En SQLite es una tabla FTS5; en PostgreSQL, una tabla con un tsvector y un índice GIN.
+"""
+
+import logging
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Column, Integer, MetaData, Table, inspect, text
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = "transcript_segments_fts"
+
+# owner es un token "u<id>" indexado: el filtro por usuario se resuelve dentro del
+# índice invertido en lugar de recorrer los aciertos de todos los usuarios.
+# remove_diacritics hace que "cancion" encuentre "canción".
+SQLITE_CREATE_SEARCH_TABLE = f"""
+CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(
+    text,
+    owner,
+    transcript_id UNINDEXED,
+    segment_id UNINDEXED,
+    seg_start UNINDEXED,
+    seg_end UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+# Misma estructura en PostgreSQL; la configuración 'simple' no aplica stemming ni
+# elimina tildes (unaccent es una extensión que no siempre está disponible)
+POSTGRESQL_CREATE_SEARCH_TABLE = [
+    f"""
+    CREATE TABLE {SEARCH_TABLE} (
+        id BIGSERIAL PRIMARY KEY,
+        text TEXT NOT NULL,
+        owner VARCHAR(32) NOT NULL,
+        transcript_id INTEGER NOT NULL,
+        segment_id INTEGER,
+        seg_start DOUBLE PRECISION,
+        seg_end DOUBLE PRECISION,
+        document TSVECTOR GENERATED ALWAYS AS (to_tsvector('simple', text)) STORED
+    )
+    """,
+    f"CREATE INDEX ix_{SEARCH_TABLE}_document ON {SEARCH_TABLE} USING GIN (document)",
+    f"CREATE INDEX ix_{SEARCH_TABLE}_owner ON {SEARCH_TABLE} (owner)",
+]
+
+INSERT_SEGMENT = text(
+    f"INSERT INTO {SEARCH_TABLE} (text, owner, transcript_id, segment_id, seg_start, seg_end) "
+    "VALUES (:text, :owner, :transcript_id, :segment_id, :seg_start, :seg_end)"
+)
+
+SQLITE_SEARCH_SEGMENTS = text(f"""
+SELECT
+    {SEARCH_TABLE}.transcript_id AS transcript_id,
+    transcripts.filename AS filename,
+    {SEARCH_TABLE}.segment_id AS segment_id,
+    {SEARCH_TABLE}.seg_start AS seg_start,
+    {SEARCH_TABLE}.seg_end AS seg_end,
+    snippet({SEARCH_TABLE}, 0, '<mark>', '</mark>', '…', 16) AS snippet,
+    -bm25({SEARCH_TABLE}, 1.0, 0.0) AS score
+FROM {SEARCH_TABLE}
+JOIN transcripts ON transcripts.id = {SEARCH_TABLE}.transcript_id
+WHERE {SEARCH_TABLE} MATCH :match
+ORDER BY score DESC
+LIMIT :limit OFFSET :offset
+""")
+
+POSTGRESQL_SEARCH_SEGMENTS = text(f"""
+SELECT
+    s.transcript_id AS transcript_id,
+    transcripts.filename AS filename,
+    s.segment_id AS segment_id,
+    s.seg_start AS seg_start,
+    s.seg_end AS seg_end,
+    ts_headline('simple', s.text, query, 'StartSel=<mark>, StopSel=</mark>, MaxWords=16, MinWords=4') AS snippet,
+    ts_rank(s.document, query) AS score
+FROM {SEARCH_TABLE} s
+JOIN transcripts ON transcripts.id = s.transcript_id
+CROSS JOIN to_tsquery('simple', :match) AS query
+WHERE s.owner = :owner AND s.document @@ query
+ORDER BY score DESC
+LIMIT :limit OFFSET :offset
+""")
+
+SEARCH_DIALECTS = ("sqlite", "postgresql")
+
+# Progreso de la indexación de las transcripciones guardadas antes de crear el índice:
+# se indexan por lotes en segundo plano las de id en (last_id, until_id]. La fila se
+# borra al terminar; las transcripciones nuevas se indexan al guardarlas.
+backfill_metadata = MetaData()
+search_backfill = Table(
+    "search_backfill",
+    backfill_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("last_id", Integer, nullable=False),
+    Column("until_id", Integer, nullable=False),
+)
+
+
+class SearchUnavailableError(Exception):
+    """La base de datos no tiene índice de búsqueda"""
+
+
+def owner_token(user_id: int) -> str:
+    return f"u{user_id}"
+
+
+def dialect_name(connection) -> str:
+    """Dialecto de una Connection o una Session"""
+    if hasattr(connection, "dialect"):
+        return connection.dialect.name
+    return connection.get_bind().dialect.name
+
+
+def ensure_search_index(engine) -> bool:
+    """
+    Crea la tabla del índice si no existe. Devuelve True si la acaba de crear; en ese
+    caso las transcripciones ya guardadas quedan pendientes de indexar (ver
+    backfill_progress), sin leerlas aquí.
+    """
+    if engine.dialect.name not in SEARCH_DIALECTS:
+        logger.warning(f"Búsqueda de texto completo no disponible con {engine.dialect.name}")
+        return False
+    backfill_metadata.create_all(bind=engine)
+    if SEARCH_TABLE in inspect(engine).get_table_names():
+        return False
+    with engine.begin() as connection:
+        if engine.dialect.name == "sqlite":
+            connection.exec_driver_sql(SQLITE_CREATE_SEARCH_TABLE)
+        else:
+            for statement in POSTGRESQL_CREATE_SEARCH_TABLE:
+                connection.exec_driver_sql(statement)
+        # Las transcripciones a partir de aquí se indexan al guardarse
+        until_id = connection.execute(text("SELECT MAX(id) FROM transcripts")).scalar() or 0
+        if until_id:
+            connection.execute(search_backfill.insert().values(id=1, last_id=0, until_id=until_id))
+    logger.info(f"Índice de búsqueda creado: {SEARCH_TABLE}")
+    return True
+
+
+def backfill_progress(connection) -> Optional[Tuple[int, int]]:
+    """(last_id, until_id) de la indexación pendiente, o None si no queda nada"""
+    if dialect_name(connection) not in SEARCH_DIALECTS:
+        return None
+    row = connection.execute(
+        search_backfill.select().where(search_backfill.c.id == 1)
+    ).first()
+    return (row.last_id, row.until_id) if row is not None else None
+
+
+def advance_backfill(connection, last_id: int, new_last_id: Optional[int]) -> bool:
+    """
+    Marca como indexadas las transcripciones hasta new_last_id (None: no queda
+    ninguna). Solo avanza si nadie lo hizo antes desde last_id; devuelve False si
+    otro proceso ya indexó ese lote, y entonces hay que deshacer la transacción.
+    """
+    condition = (search_backfill.c.id == 1) & (search_backfill.c.last_id == last_id)
+    if new_last_id is None:
+        result = connection.execute(search_backfill.delete().where(condition))
+    else:
+        result = connection.execute(search_backfill.update().where(condition).values(last_id=new_last_id))
+    return result.rowcount == 1
+
+
+def index_transcript(connection, transcript_id: int, user_id: int, text: str, segments: List[dict], duration: Optional[float]):
+    """
+    Añade una transcripción al índice, un registro por segmento. Las transcripciones
+    sin segmentos (registros antiguos) se indexan como un único tramo que cubre todo
+    el audio.
+    """
+    if dialect_name(connection) not in SEARCH_DIALECTS:
+        return
+    owner = owner_token(user_id)
+    if segments:
+        rows = [
+            {
+                "text": seg["text"],
+                "owner": owner,
+                "transcript_id": transcript_id,
+                "segment_id": seg["id"],
+                "seg_start": seg["start"],
+                "seg_end": seg["end"],
+            }
+            for seg in segments
+        ]
+    elif text:
+        rows = [{
+            "text": text,
+            "owner": owner,
+            "transcript_id": transcript_id,
+            "segment_id": None,
+            "seg_start": 0.0,
+            "seg_end": duration,
+        }]
+    else:
+        return
+    connection.execute(INSERT_SEGMENT, rows)
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """
+    Convierte lo que escribe el usuario en una consulta FTS5: todas las palabras
+    tienen que aparecer en el segmento y un * final busca por prefijo ("transcri*").
+    Cada palabra va entre comillas, así que la sintaxis de FTS5 no se interpreta.
+    """
+    terms = []
+    for term in query.split():
+        prefix = term.endswith("*")
+        term = term.rstrip("*").replace('"', '""')
+        if term:
+            terms.append(f'"{term}"' + ("*" if prefix else ""))
+    return " ".join(terms) or None
+
+
+def build_tsquery(query: str) -> Optional[str]:
+    """La misma consulta para to_tsquery de PostgreSQL: "hola mund*" -> "hola & mund:*" """
+    terms = []
+    for term in query.split():
+        # Solo las letras y números: el resto de caracteres es sintaxis de tsquery
+        words = re.findall(r"\w+", term)
+        if words:
+            terms.append(" <-> ".join(words) + (":*" if term.endswith("*") else ""))
+    return " & ".join(terms) or None
+
+
+def search_segments(connection, user_id: int, query: str, limit: int = 20, offset: int = 0) -> List[dict]:
+    """Segmentos del usuario que contienen las palabras buscadas, de más a menos relevante"""
+    dialect = dialect_name(connection)
+    if dialect == "sqlite":
+        terms = build_match_query(query)
+        if terms is None:
+            return []
+        match = f'owner : "{owner_token(user_id)}" AND text : ({terms})'
+        rows = connection.execute(SQLITE_SEARCH_SEGMENTS, {"match": match, "limit": limit, "offset": offset})
+    elif dialect == "postgresql":
+        match = build_tsquery(query)
+        if match is None:
+            return []
+        rows = connection.execute(POSTGRESQL_SEARCH_SEGMENTS, {
+            "match": match, "owner": owner_token(user_id), "limit": limit, "offset": offset
+        })
+    else:
+        raise SearchUnavailableError(f"Búsqueda de texto completo no disponible con {dialect}")
+    return [
+        {
+            "transcript_id": row.transcript_id,
+            "filename": row.filename,
+            "segment_id": row.segment_id,
+            "start": row.seg_start,
+            "end": row.seg_end,
+            "snippet": row.snippet,
+            "score": row.score,
+        }
+        for row in rows
+    ]
@@ -38,7 +38,10 @@ let batchFiles = [];
 let isBatchMode = false;
 let websocket = null;
 let reconnectAttempts = 0;
+let pendingJob = null;  // Trabajo seguido por WebSocket: { id, resolve, reject }
+let liveSegments = 0;   // Segmentos parciales ya mostrados
 const MAX_RECONNECT_ATTEMPTS = 5;
+const JOB_POLL_INTERVAL_MS = 2000;
 
 // Event listeners
 uploadArea.addEventListener('click', () => fileInput.click());
@@ -155,9 +158,13 @@ async function handleTranscribe() {
     transcribeBtn.disabled = true;
     transcribeBtn.textContent = 'Procesando...';
     
+    // Con el WebSocket conectado el progreso y el texto llegan en tiempo real
+    const streaming = websocket && websocket.readyState === WebSocket.OPEN;
+    liveSegments = 0;
+
     try {
-        // Simular progreso
-        simulateProgress();
+        // Simular progreso si no hay WebSocket
+        if (!streaming) simulateProgress();
         
         // Preparar FormData
         const formData = new FormData();
@@ -173,6 +180,10 @@ async function handleTranscribe() {
         if (language) params.append('language', language);
         if (task) params.append('task', task);
         outputFormats.forEach(fmt => params.append('output_formats', fmt));
+        if (streaming) {
+            params.append('wait', 'false');
+            params.append('stream', 'true');
+        }
         if (params.toString()) url += '?' + params.toString();
         
         // Enviar request
@@ -186,7 +197,11 @@ async function handleTranscribe() {
             throw new Error(error.detail || 'Error al transcribir el audio');
         }
         
-        const result = await response.json();
+        let result = await response.json();
+        // 202: trabajo encolado, el resultado llega por el WebSocket
+        if (response.status === 202) {
+            result = await followJob(result.job_id);
+        }
         currentTranscription = result;
         
         // Mostrar resultados
@@ -196,6 +211,7 @@ async function handleTranscribe() {
         console.error('Error:', error);
         showError(error.message || 'Ocurrió un error al transcribir el audio. Por favor, intenta de nuevo.');
     } finally {
+        pendingJob = null;
         // Ocultar progreso
         progressSection.style.display = 'none';
         progressFill.style.width = '0%';
@@ -244,18 +260,7 @@ function displayResults(result) {
     // Segmentos con timestamps
     if (result.segments && result.segments.length > 0) {
         segments.innerHTML = '<h3 style="margin-bottom: 15px; color: var(--text-secondary);">Segmentos:</h3>';
-        result.segments.forEach(segment => {
-            const segmentDiv = document.createElement('div');
-            segmentDiv.className = 'segment';
-            segmentDiv.innerHTML = `
-                <div class="segment-header">
-                    <span>ID: ${segment.id}</span>
-                    <span>${formatTime(segment.start)} → ${formatTime(segment.end)}</span>
-                </div>
-                <div class="segment-text">${segment.text}</div>
-            `;
-            segments.appendChild(segmentDiv);
-        });
+        result.segments.forEach(segment => segments.appendChild(createSegmentElement(segment)));
     } else {
         segments.innerHTML = '';
     }
@@ -269,6 +274,83 @@ function displayResults(result) {
     resultsSection.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
 }
 
+function createSegmentElement(segment) {
+    const segmentDiv = document.createElement('div');
+    segmentDiv.className = 'segment';
+    segmentDiv.innerHTML = `
+        <div class="segment-header">
+            <span>ID: ${segment.id}</span>
+            <span>${formatTime(segment.start)} → ${formatTime(segment.end)}</span>
+        </div>
+        <div class="segment-text">${segment.text}</div>
+    `;
+    return segmentDiv;
+}
+
+function appendSegments(newSegments) {
+    // Primeros segmentos parciales: preparar la sección de resultados
+    if (liveSegments === 0) {
+        transcriptionText.textContent = '';
+        languageBadge.textContent = '';
+        durationBadge.textContent = '';
+        segments.innerHTML = '<h3 style="margin-bottom: 15px; color: var(--text-secondary);">Segmentos:</h3>';
+        resultsSection.style.display = 'block';
+    }
+    newSegments.forEach(segment => {
+        transcriptionText.textContent += (transcriptionText.textContent ? ' ' : '') + segment.text;
+        segments.appendChild(createSegmentElement(segment));
+    });
+    liveSegments += newSegments.length;
+}
+
+function followJob(jobId) {
+    // Resultado del trabajo: por WebSocket y, si la conexión se pierde antes del final, consultando GET /jobs/{id}
+    return followJobOverWebSocket(jobId).catch(error => {
+        if (!error.connectionLost) throw error;
+        return pollJob(jobId);
+    });
+}
+
+function followJobOverWebSocket(jobId) {
+    // Resuelve cuando el WebSocket recibe "completed" para este trabajo
+    return new Promise((resolve, reject) => {
+        if (!websocket || websocket.readyState !== WebSocket.OPEN) {
+            reject(connectionLostError());
+            return;
+        }
+        pendingJob = { id: jobId, resolve, reject };
+        websocket.send(JSON.stringify({ job_id: jobId }));
+    });
+}
+
+function connectionLostError() {
+    return Object.assign(new Error('Conexión perdida'), { connectionLost: true });
+}
+
+function abandonPendingJob() {
+    // El WebSocket se cerró sin el evento final: el trabajo sigue en el servidor
+    if (pendingJob) {
+        const { reject } = pendingJob;
+        pendingJob = null;
+        reject(connectionLostError());
+    }
+}
+
+async function pollJob(jobId) {
+    while (true) {
+        const response = await fetch(`/jobs/${jobId}`);
+        if (!response.ok) {
+            const error = await response.json().catch(() => ({}));
+            throw new Error(error.detail || 'No se pudo consultar el trabajo');
+        }
+        const job = await response.json();
+        if (job.status === 'completed') return job.result;
+        if (job.status === 'failed') throw new Error(job.error || 'Error al transcribir el audio');
+        progressText.textContent = job.status === 'queued' ? 'En cola...' : 'Procesando...';
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    }
+}
+
 function formatTime(seconds) {
     const mins = Math.floor(seconds / 60);
     const secs = Math.floor(seconds % 60);
@@ -377,12 +459,14 @@ function initializeWebSocket() {
 
     websocket.onclose = () => {
         updateWebSocketStatus('disconnected', 'Desconectado');
+        abandonPendingJob();
         attemptReconnect();
     };
 
     websocket.onerror = (error) => {
         console.error('WebSocket error:', error);
         updateWebSocketStatus('disconnected', 'Error de conexión');
+        abandonPendingJob();
     };
 }
 
@@ -409,36 +493,140 @@ function handleWebSocketMessage(data) {
             progressFill.style.width = data.progress + '%';
             progressText.textContent = data.message;
             break;
+        case 'segments':
+            progressSection.style.display = 'block';
+            progressFill.style.width = data.progress + '%';
+            progressText.textContent = data.message;
+            appendSegments(data.segments);
+            break;
         case 'completed':
-            displayResults(data.result);
+            if (pendingJob && data.job_id === pendingJob.id) {
+                pendingJob.resolve(data.result);
+            } else {
+                displayResults(data.result);
+            }
             break;
         case 'error':
-            showError(data.message);
+            if (pendingJob && (!data.job_id || data.job_id === pendingJob.id)) {
+                pendingJob.reject(new Error(data.message));
+            } else {
+                showError(data.message);
+            }
             break;
     }
 }
 
+const UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024;    // Bloques de 8MB por petición
+const UPLOAD_MAX_RETRIES = 5;
+const UPLOAD_HASH_MAX_SIZE = 256 * 1024 * 1024; // Por encima no se calcula el hash en el navegador
+
+async function sha256Hex(file) {
+    // Con el hash el servidor reconoce al instante un archivo ya subido
+    if (!window.crypto || !crypto.subtle || file.size > UPLOAD_HASH_MAX_SIZE) return null;
+    const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function uploadErrorMessage(response) {
+    try {
+        return (await response.json()).detail;
+    } catch (error) {
+        return `HTTP ${response.status}`;
+    }
+}
+
+async function uploadResumable(file, onProgress) {
+    // Subida por partes: tras un corte (o al recargar la página) continúa desde el offset del servidor
+    const storageKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+    let uploadId = localStorage.getItem(storageKey);
+    let offset = 0;
+
+    if (uploadId) {
+        const response = await fetch(`/uploads/${uploadId}`);
+        if (response.ok) {
+            offset = (await response.json()).offset;
+        } else {
+            uploadId = null;
+        }
+    }
+
+    if (!uploadId) {
+        const response = await fetch('/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size, sha256: await sha256Hex(file) })
+        });
+        if (!response.ok) throw new Error(await uploadErrorMessage(response));
+        const created = await response.json();
+        if (created.complete) {
+            onProgress(1);
+            return created.file_id;
+        }
+        uploadId = created.upload_id;
+        localStorage.setItem(storageKey, uploadId);
+    }
+
+    let retries = 0;
+    while (true) {
+        let response;
+        try {
+            response = await fetch(`/uploads/${uploadId}`, {
+                method: 'PATCH',
+                headers: {
+                    'Upload-Offset': String(offset),
+                    'Content-Type': 'application/offset+octet-stream'
+                },
+                body: file.slice(offset, offset + UPLOAD_CHUNK_SIZE)
+            });
+        } catch (error) {
+            // Error de red: esperar y preguntar al servidor cuánto llegó
+            if (++retries > UPLOAD_MAX_RETRIES) throw error;
+            await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+            const status = await fetch(`/uploads/${uploadId}`).catch(() => null);
+            if (status && status.ok) offset = (await status.json()).offset;
+            continue;
+        }
+
+        if (response.status === 409) {
+            offset = Number(response.headers.get('Upload-Offset'));
+            continue;
+        }
+        if (!response.ok) {
+            localStorage.removeItem(storageKey);
+            throw new Error(await uploadErrorMessage(response));
+        }
+
+        const state = await response.json();
+        retries = 0;
+        offset = state.offset;
+        onProgress(file.size ? offset / file.size : 1);
+        if (state.complete) {
+            localStorage.removeItem(storageKey);
+            return state.file_id;
+        }
+    }
+}
+
 async function handleBatchTranscribe() {
     if (batchFiles.length === 0) return;
 
     // Preparar archivos para el lote
     const fileIds = [];
-    for (const file of batchFiles) {
-        const formData = new FormData();
-        formData.append('file', file);
-
+    progressSection.style.display = 'block';
+    for (const [index, file] of batchFiles.entries()) {
         try {
-            const response = await fetch('/upload', {
-                method: 'POST',
-                body: formData
+            const fileId = await uploadResumable(file, (fraction) => {
+                progressFill.style.width = Math.round(fraction * 100) + '%';
+                progressText.textContent = `Subiendo ${file.name} (${index + 1}/${batchFiles.length})... ${Math.round(fraction * 100)}%`;
             });
-            const result = await response.json();
-            fileIds.push(result.file_id);
+            fileIds.push(fileId);
         } catch (error) {
+            progressSection.style.display = 'none';
             showError(`Error al subir ${file.name}: ${error.message}`);
             return;
         }
     }
+    progressText.textContent = 'Transcribiendo lote...';
 
     // Enviar lote para transcripción
     const batchRequest = {
@@ -462,6 +650,8 @@ async function handleBatchTranscribe() {
 
     } catch (error) {
         showError(`Error en procesamiento por lotes: ${error.message}`);
+    } finally {
+        progressSection.style.display = 'none';
     }
 }
 
@@ -0,0 +1,63 @@
+"""
+Prueba de carga de la autenticación: más peticiones simultáneas que conexiones en el pool
+"""
+import asyncio
+import time
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import auth
+import models
+
+POOL_SIZE = 2
+REQUESTS = 20
+
+
+def test_burst_larger_than_pool(tmp_path, monkeypatch):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'burst.db'}",
+        connect_args={"check_same_thread": False},
+        pool_size=POOL_SIZE,
+        max_overflow=0,
+        pool_timeout=5,
+    )
+    models.Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with session_factory() as db:
+        db.add(models.User(email="burst@example.com", hashed_password="x"))
+        db.commit()
+    monkeypatch.setattr(auth, "SessionLocal", session_factory)
+
+    app = FastAPI()
+    all_arrived = asyncio.Event()
+    arrived = 0
+
+    @app.post("/upload")
+    async def upload(current_user: models.User = Depends(auth.get_current_user)):
+        # Como una subida que se recibe por bloques: la petición sigue viva en el event
+        # loop mientras llegan las demás, sin retener una conexión de la base de datos
+        nonlocal arrived
+        arrived += 1
+        if arrived == REQUESTS:
+            all_arrived.set()
+        await asyncio.wait_for(all_arrived.wait(), timeout=10)
+        return {"user_id": current_user.id}
+
+    token = auth.create_access_token({"sub": "burst@example.com"})
+
+    async def burst():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*[
+                client.post("/upload", headers={"Authorization": f"Bearer {token}"})
+                for _ in range(REQUESTS)
+            ])
+
+    started = time.monotonic()
+    responses = asyncio.run(burst())
+    assert [response.status_code for response in responses] == [200] * REQUESTS
+    assert time.monotonic() - started < 10
+    engine.dispose()
@@ -0,0 +1,157 @@
+"""
+Pruebas del formato binario del cache (.wtc) y de ResultCache
+"""
+import pytest
+
+from cache import PrekeyIndex, ResultCache, decode_result, encode_result, read_segments
+
+
+def make_result(n_segments=3, text_size=10):
+    segments = [
+        {"id": i, "start": float(i), "end": i + 1.0, "text": f"segmento {i} ñandú " + "x" * text_size}
+        for i in range(n_segments)
+    ]
+    return {
+        "text": " ".join(seg["text"] for seg in segments),
+        "segments": segments,
+        "language": "es",
+        "duration": float(n_segments),
+    }
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_round_trip(compress):
+    result = make_result()
+    assert decode_result(encode_result(result, compress=compress)) == result
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_round_trip_without_segments(compress):
+    result = {"text": "", "segments": [], "language": "en"}
+    assert decode_result(encode_result(result, compress=compress)) == result
+
+
+def test_compressed_is_smaller():
+    result = make_result(n_segments=50, text_size=200)
+    assert len(encode_result(result, compress=True)) < len(encode_result(result, compress=False))
+
+
+def test_rejects_unknown_data():
+    with pytest.raises(ValueError):
+        decode_result(b"no es una entrada de cache")
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_overlapping_segments(compress):
+    result = make_result(n_segments=10)
+    table = read_segments(encode_result(result, compress=compress))
+
+    assert len(table) == 10
+    assert table[4] == result["segments"][4]
+    assert table.overlapping(None, None) == result["segments"]
+    # Solo los segmentos que se solapan con [2.5, 4.0]
+    assert [seg["id"] for seg in table.overlapping(2.5, 4.0)] == [2, 3, 4]
+    assert [seg["id"] for seg in table.overlapping(8.0, None)] == [8, 9]
+    assert [seg["id"] for seg in table.overlapping(None, 1.0)] == [0, 1]
+    assert table.overlapping(20.0, 30.0) == []
+
+
+def test_get_returns_copy(tmp_path):
+    cache = ResultCache(tmp_path)
+    cache.put("a", make_result())
+    first = cache.get("a")
+    first["extra"] = True
+    assert "extra" not in cache.get("a")
+
+
+def test_reloads_from_disk(tmp_path):
+    ResultCache(tmp_path, hot_entries=0).put("a", make_result())
+    assert ResultCache(tmp_path).get("a") == make_result()
+
+
+def test_evicts_over_budget(tmp_path):
+    size = len(encode_result(make_result(text_size=1000), compress=False))
+    cache = ResultCache(tmp_path, max_bytes=int(size * 2.5), compress=False)
+    for key in ("a", "b", "c"):
+        cache.put(key, make_result(text_size=1000))
+    assert "a" not in cache
+    assert "b" in cache and "c" in cache
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_evicts_least_recently_used(tmp_path):
+    size = len(encode_result(make_result(text_size=1000), compress=False))
+    cache = ResultCache(tmp_path, max_bytes=int(size * 2.5), compress=False, hot_entries=0)
+    cache.put("a", make_result(text_size=1000))
+    cache.put("b", make_result(text_size=1000))
+    cache.get("a")
+    cache.put("c", make_result(text_size=1000))
+    assert "a" in cache and "c" in cache and "b" not in cache
+
+
+def test_lfu_evicts_least_used(tmp_path):
+    size = len(encode_result(make_result(text_size=1000), compress=False))
+    cache = ResultCache(tmp_path, policy="lfu", max_bytes=int(size * 3.5), compress=False)
+    for key in ("a", "b", "c"):
+        cache.put(key, make_result(text_size=1000))
+    # Muchos aciertos: el heap se rehace sin perder el orden
+    for _ in range(200):
+        cache.get("a")
+    cache.get("c")
+    cache.put("d", make_result(text_size=1000))
+    assert "b" not in cache
+    cache.put("e", make_result(text_size=1000))
+    assert "d" not in cache
+    assert all(key in cache for key in ("a", "c", "e"))
+
+
+def test_legacy_cleanup_runs_once_on_old_entries(tmp_path):
+    legacy = tmp_path / f"{'ab' * 32}.json"
+    other = tmp_path / "notas.json"
+    legacy.write_text("{}")
+    other.write_text("{}")
+    ResultCache(tmp_path)
+    assert not legacy.exists() and other.exists()
+
+    # Con la limpieza hecha, un arranque posterior no vuelve a borrar
+    legacy.write_text("{}")
+    ResultCache(tmp_path)
+    assert legacy.exists()
+
+
+def test_lfu_hits_survive_restart(tmp_path):
+    size = len(encode_result(make_result(text_size=1000), compress=False))
+    cache = ResultCache(tmp_path, policy="lfu", compress=False)
+    cache.put("a", make_result(text_size=1000))
+    cache.put("b", make_result(text_size=1000))
+    cache.get("a")
+    cache.save_hits()
+
+    # Tras reiniciar con un presupuesto para una sola entrada se conserva la más usada
+    cache = ResultCache(tmp_path, policy="lfu", max_bytes=size, compress=False)
+    assert "a" in cache and "b" not in cache
+
+
+def test_hot_tier_bounded_by_bytes(tmp_path):
+    size = len(encode_result(make_result(text_size=1000), compress=False))
+    cache = ResultCache(tmp_path, hot_entries=10, hot_max_bytes=size * 2, compress=False)
+    for key in ("a", "b", "c"):
+        cache.put(key, make_result(text_size=1000))
+    stats = cache.stats()
+    assert stats["hot_entries"] == 2
+    assert stats["hot_bytes"] <= size * 2
+
+
+def test_evicted_entries_leave_prekey_index(tmp_path):
+    prekeys = PrekeyIndex(tmp_path / "prekeys.idx")
+    cache = ResultCache(tmp_path, on_remove=prekeys.discard)
+    prekeys.add("rapida", "sha", "a")
+    cache.put("a", make_result())
+    assert prekeys.get("rapida") == "sha"
+
+    cache.clear()
+    assert prekeys.get("rapida") is None
+    # Al arrancar, prune() descarta lo que quedó en el archivo de entradas ya borradas
+    reloaded = PrekeyIndex(tmp_path / "prekeys.idx")
+    reloaded.prune(lambda key: key in cache)
+    assert reloaded.get("rapida") is None
@@ -0,0 +1,82 @@
+"""
+Pruebas de la división de audios largos en ventanas y de la unión de sus resultados
+"""
+import numpy as np
+
+from inference import SAMPLE_RATE, AudioWindow, SegmentStitcher, plan_windows, stitch_windows
+
+
+def speech_with_pauses(seconds, pause_every):
+    """Tono continuo con una pausa de 0.5 s cada pause_every segundos"""
+    audio = 0.3 * np.sin(2 * np.pi * 220 * np.arange(seconds * SAMPLE_RATE) / SAMPLE_RATE)
+    for pause in range(pause_every, seconds, pause_every):
+        audio[pause * SAMPLE_RATE:int((pause + 0.5) * SAMPLE_RATE)] = 0.0
+    return audio.astype(np.float32)
+
+
+def test_short_audio_is_one_window():
+    audio = np.zeros(10 * SAMPLE_RATE, dtype=np.float32)
+    [window] = plan_windows(audio, window_seconds=30)
+    assert (window.start, window.end, window.own_start, window.own_end) == (0, len(audio), 0, len(audio))
+
+
+def test_windows_cover_audio_without_gaps():
+    audio = speech_with_pauses(100, 7)
+    windows = plan_windows(audio, window_seconds=30, overlap_seconds=2)
+
+    assert windows[0].own_start == 0
+    assert windows[-1].own_end == len(audio)
+    for previous, current in zip(windows, windows[1:]):
+        assert previous.own_end == current.own_start
+    for window in windows:
+        assert window.own_end - window.own_start <= 30 * SAMPLE_RATE
+        assert window.start == max(0, window.own_start - 2 * SAMPLE_RATE)
+        assert window.end == min(len(audio), window.own_end + 2 * SAMPLE_RATE)
+
+
+def test_cuts_fall_in_silence():
+    audio = speech_with_pauses(100, 7)
+    for window in plan_windows(audio, window_seconds=30)[1:]:
+        cut_seconds = window.own_start / SAMPLE_RATE
+        # El corte cae dentro de una pausa (cada 7 s, de 0.5 s)
+        assert cut_seconds % 7 < 0.5
+
+
+def segment(start, end, text):
+    return {"id": 0, "start": start, "end": end, "text": text}
+
+
+def test_stitcher_keeps_segments_by_midpoint():
+    # Ventanas [0, 12) y [8, 20) con la frontera de responsabilidad en 10 s
+    first = AudioWindow(0, 12 * SAMPLE_RATE, 0, 10 * SAMPLE_RATE)
+    second = AudioWindow(8 * SAMPLE_RATE, 20 * SAMPLE_RATE, 10 * SAMPLE_RATE, 20 * SAMPLE_RATE)
+    first_result = {"language": "es", "segments": [
+        segment(0.0, 5.0, " uno"),
+        segment(5.0, 9.5, " dos"),
+        segment(9.5, 12.0, " tres"),   # punto medio 10.75: pertenece a la segunda ventana
+    ]}
+    # Tiempos relativos al inicio de la ventana (8 s)
+    second_result = {"language": "es", "segments": [
+        segment(0.0, 1.5, " dos"),     # punto medio 8.75: pertenece a la primera ventana
+        segment(1.5, 4.0, " tres"),
+        segment(4.0, 12.0, " cuatro"),
+    ]}
+
+    result = stitch_windows([first, second], [first_result, second_result])
+
+    assert result["text"] == " uno dos tres cuatro"
+    assert result["language"] == "es"
+    assert [seg["id"] for seg in result["segments"]] == [0, 1, 2, 3]
+    assert [(seg["start"], seg["end"]) for seg in result["segments"]] == [
+        (0.0, 5.0), (5.0, 9.5), (9.5, 12.0), (12.0, 20.0)
+    ]
+
+
+def test_stitcher_clamps_overlapping_starts():
+    first = AudioWindow(0, 12 * SAMPLE_RATE, 0, 10 * SAMPLE_RATE)
+    second = AudioWindow(8 * SAMPLE_RATE, 20 * SAMPLE_RATE, 10 * SAMPLE_RATE, 20 * SAMPLE_RATE)
+    stitcher = SegmentStitcher()
+    stitcher.add(first, {"segments": [segment(8.0, 10.5, " a")]})
+    # Empieza antes de que termine el anterior (10.5 s): se ajusta para no solaparse
+    new = stitcher.add(second, {"segments": [segment(2.0, 4.0, " b")]})
+    assert [(seg["start"], seg["end"]) for seg in new] == [(10.5, 12.0)]
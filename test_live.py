@@ -0,0 +1,62 @@
+"""
+Pruebas de la inferencia de las sesiones en directo
+"""
+import asyncio
+import threading
+
+from live import LiveInference
+from model_registry import ModelRegistry
+
+
+class FakeModel:
+    pass
+
+
+class FakeTranscriber:
+    """Paso instantáneo que recuerda con qué modelo se ejecutó"""
+
+    def __init__(self):
+        self.models = []
+
+    def step(self, model, transcribe_options, final=False):
+        self.models.append(model)
+        return [{"id": 0, "start": 0.0, "end": 1.0, "text": "hola"}], []
+
+
+def make_registry():
+    return ModelRegistry(lambda name: FakeModel(), size_of=lambda model: 1)
+
+
+def test_live_step_does_not_wait_for_file_job():
+    shared = make_registry()
+    live = LiveInference(make_registry(), max_workers=1)
+    file_job_started = threading.Event()
+    file_job_release = threading.Event()
+
+    def long_file_job():
+        # Un archivo largo ocupa el modelo de los trabajos durante toda la transcripción
+        with shared.acquire("base") as loaded:
+            with loaded.lock:
+                file_job_started.set()
+                file_job_release.wait(30)
+
+    job = threading.Thread(target=long_file_job)
+    job.start()
+    try:
+        assert file_job_started.wait(5)
+        transcriber = FakeTranscriber()
+
+        async def live_step():
+            await live.load("base")
+            return await asyncio.wait_for(live.step(transcriber, "base", {}), timeout=2)
+
+        committed, provisional = asyncio.run(live_step())
+        assert committed[0]["text"] == "hola"
+        assert job.is_alive()
+        # La sesión usó su propia instancia del modelo, no la del trabajo
+        with shared.acquire("base") as loaded:
+            assert transcriber.models[0] is not loaded.model
+    finally:
+        file_job_release.set()
+        job.join()
+        live.shutdown()
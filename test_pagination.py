@@ -0,0 +1,79 @@
+"""
+Pruebas de los cursores de la paginación por clave
+"""
+import base64
+from datetime import datetime
+
+import pytest
+from sqlalchemy import and_, create_engine, or_, select, text
+
+import database
+import models
+from pagination import InvalidCursorError, decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize("created_at", [
+    datetime(2024, 5, 1, 12, 30, 15),
+    datetime(2024, 5, 1, 12, 30, 15, 123456),
+])
+def test_round_trip(created_at):
+    cursor = encode_cursor(created_at, 42)
+    assert decode_cursor(cursor) == (created_at, 42)
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor(datetime(2024, 5, 1, 12, 30, 15, 999999), 2 ** 40)
+    assert all(c.isalnum() or c in "-_=" for c in cursor)
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "no es base64!",
+    "ñ",
+    base64.urlsafe_b64encode(b"no es json").decode(),
+    base64.urlsafe_b64encode(b"5").decode(),
+    base64.urlsafe_b64encode(b'["2024-05-01T12:30:15"]').decode(),
+    base64.urlsafe_b64encode(b'["ayer", 1]').decode(),
+    base64.urlsafe_b64encode(b'["2024-05-01T12:30:15", "x"]').decode(),
+])
+def test_rejects_invalid_cursors(cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor)
+
+
+def test_rows_without_created_at_are_backfilled_and_paginated(tmp_path, monkeypatch):
+    # Tabla creada antes de que created_at fuera obligatoria, con filas sin fecha
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE transcripts (id INTEGER PRIMARY KEY, user_id INTEGER, created_at DATETIME)"
+        ))
+        connection.execute(text(
+            # Mismo formato de fecha que escribe SQLAlchemy en SQLite
+            "INSERT INTO transcripts (id, user_id, created_at) VALUES (1, 7, NULL), "
+            "(2, 7, '2024-05-01 12:00:00.000000'), (3, 7, NULL), (4, 7, '2024-05-02 12:00:00.000000')"
+        ))
+    monkeypatch.setattr(database, "engine", engine)
+    Transcript = models.Transcript
+    database.fill_nulls(Transcript.__table__.c.created_at, datetime(2024, 6, 1))
+
+    # Mismo recorrido que GET /transcripts, de dos en dos
+    seen, cursor = [], None
+    with engine.connect() as connection:
+        while True:
+            query = select(Transcript.id, Transcript.created_at).where(Transcript.user_id == 7)
+            if cursor:
+                created_at, record_id = decode_cursor(cursor)
+                query = query.where(or_(
+                    Transcript.created_at < created_at,
+                    and_(Transcript.created_at == created_at, Transcript.id < record_id)
+                ))
+            rows = connection.execute(
+                query.order_by(Transcript.created_at.desc(), Transcript.id.desc()).limit(2)
+            ).all()
+            seen += [row.id for row in rows]
+            if len(rows) < 2:
+                break
+            cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    assert seen == [3, 1, 4, 2]
+    engine.dispose()
@@ -0,0 +1,146 @@
+"""
+Pruebas del almacén de subidas: offsets, tamaño declarado, SHA256 y file_id
+"""
+import asyncio
+import hashlib
+import os
+import time
+
+import pytest
+
+from uploads import (
+    UploadChecksumError,
+    UploadNotFoundError,
+    UploadOffsetError,
+    UploadStore,
+    UploadTooLargeError,
+)
+
+DATA = b"0123456789" * 100
+SHA256 = hashlib.sha256(DATA).hexdigest()
+
+
+async def chunks_of(*parts):
+    for part in parts:
+        yield part
+
+
+def append(store, upload_id, offset, *parts):
+    return asyncio.run(store.append(upload_id, offset, chunks_of(*parts)))
+
+
+def finish(store, upload_id):
+    return asyncio.run(store.finish(upload_id))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(tmp_path, max_size=10_000)
+
+
+def test_resumes_from_offset(store):
+    upload_id = store.create("audio.wav", len(DATA), SHA256)["upload_id"]
+    assert append(store, upload_id, 0, DATA[:300], DATA[300:400]) == 400
+    assert store.get(upload_id)["offset"] == 400
+
+    with pytest.raises(UploadOffsetError) as error:
+        append(store, upload_id, 0, DATA[:10])
+    assert error.value.expected == 400
+
+    assert append(store, upload_id, 400, DATA[400:]) == len(DATA)
+    file_id, deduplicated = finish(store, upload_id)
+    assert file_id == f"{SHA256}.wav"
+    assert not deduplicated
+    assert (store.upload_dir / file_id).read_bytes() == DATA
+
+
+def test_rejects_more_than_declared_size(store):
+    upload_id = store.create("audio.wav", 10)["upload_id"]
+    with pytest.raises(UploadTooLargeError):
+        append(store, upload_id, 0, DATA[:8], DATA[8:16])
+    # Lo escrito antes del bloque que se pasa se conserva
+    assert store.get(upload_id)["offset"] == 8
+
+
+@pytest.mark.parametrize("size", [0, -5])
+def test_rejects_empty_or_negative_size(store, size):
+    with pytest.raises(ValueError):
+        store.create("audio.wav", size)
+
+
+def test_rejects_more_than_max_size(store):
+    with pytest.raises(UploadTooLargeError):
+        store.create("audio.wav", 10_001)
+
+
+def test_checksum_mismatch_aborts(store):
+    upload_id = store.create("audio.wav", len(DATA), "0" * 64)["upload_id"]
+    append(store, upload_id, 0, DATA)
+    with pytest.raises(UploadChecksumError):
+        finish(store, upload_id)
+    with pytest.raises(UploadNotFoundError):
+        store.get(upload_id)
+    assert store.path_of(f"{SHA256}.wav") is None
+
+
+def test_same_content_is_deduplicated(store):
+    for expected in (False, True):
+        upload_id = store.create("audio.WAV", len(DATA))["upload_id"]
+        append(store, upload_id, 0, DATA)
+        file_id, deduplicated = finish(store, upload_id)
+        assert file_id == f"{SHA256}.wav"
+        assert deduplicated == expected
+    assert list(store.partial_dir.iterdir()) == []
+
+
+def test_concurrent_finish_commits_once(store):
+    upload_id = store.create("audio.wav", len(DATA))["upload_id"]
+    append(store, upload_id, 0, DATA)
+
+    async def finish_twice():
+        return await asyncio.gather(
+            store.finish(upload_id), store.finish(upload_id), return_exceptions=True
+        )
+
+    first, second = asyncio.run(finish_twice())
+    assert first == (f"{SHA256}.wav", False)
+    assert isinstance(second, UploadNotFoundError)
+    assert store.path_of(f"{SHA256}.wav") is not None
+
+
+def test_cleanup_removes_stale_direct_uploads(tmp_path):
+    store = UploadStore(tmp_path, max_size=10_000, expire_seconds=60)
+    stale = store.partial_dir / "direct_abc.wav"
+    fresh = store.partial_dir / "direct_def.wav"
+    stale.write_bytes(DATA)
+    fresh.write_bytes(DATA)
+    os.utime(stale, (time.time() - 120, time.time() - 120))
+
+    assert store.cleanup_expired() == 1
+    assert not stale.exists() and fresh.exists()
+
+
+def test_abort_removes_upload(store):
+    upload_id = store.create("audio.wav", len(DATA))["upload_id"]
+    store.abort(upload_id)
+    with pytest.raises(UploadNotFoundError):
+        store.get(upload_id)
+
+
+@pytest.mark.parametrize("upload_id", ["../audio", "a/b", ""])
+def test_rejects_invalid_upload_ids(store, upload_id):
+    with pytest.raises(UploadNotFoundError):
+        store.get(upload_id)
+
+
+def test_path_of_validates_file_id(store):
+    file_id = f"{SHA256}.wav"
+    (store.upload_dir / file_id).write_bytes(DATA)
+    assert store.path_of(file_id) == store.upload_dir / file_id
+    assert store.sha256_of(file_id) == SHA256
+
+    for invalid in (f"../{file_id}", f"{SHA256.upper()}.wav", f"{SHA256}", "audio.wav", f"{SHA256}.wav/..", f"{file_id}\n"):
+        assert store.path_of(invalid) is None
+        assert store.sha256_of(invalid) is None
+    # Válido pero inexistente
+    assert store.path_of(f"{'0' * 64}.wav") is None
@@ -0,0 +1,91 @@
+"""
+Pruebas de la detección de voz y de la traducción de tiempos al audio original
+"""
+import numpy as np
+import pytest
+
+from vad import SAMPLE_RATE, concat_spans, detect_speech, remap_segments, to_original_time
+
+
+def make_audio(layout):
+    """Audio de prueba a partir de [(segundos, hay_voz), ...]: tono para la voz, ruido débil para el silencio"""
+    rng = np.random.default_rng(0)
+    parts = []
+    for seconds, speech in layout:
+        n = int(seconds * SAMPLE_RATE)
+        if speech:
+            parts.append(0.3 * np.sin(2 * np.pi * 220 * np.arange(n) / SAMPLE_RATE))
+        else:
+            parts.append(0.0005 * rng.standard_normal(n))
+    return np.concatenate(parts).astype(np.float32)
+
+
+def test_detects_speech_spans():
+    audio = make_audio([(2, False), (1, True), (3, False), (2, True), (1, False)])
+    spans = detect_speech(audio, pad_ms=0)
+    assert len(spans) == 2
+    (start1, end1), (start2, end2) = spans
+    # Los bordes caen en la trama (30 ms) donde empieza o termina la voz
+    assert abs(start1 - 2 * SAMPLE_RATE) <= 0.03 * SAMPLE_RATE
+    assert abs(end1 - 3 * SAMPLE_RATE) <= 0.03 * SAMPLE_RATE
+    assert abs(start2 - 6 * SAMPLE_RATE) <= 0.03 * SAMPLE_RATE
+    assert abs(end2 - 8 * SAMPLE_RATE) <= 0.03 * SAMPLE_RATE
+
+
+def test_short_gaps_are_merged():
+    audio = make_audio([(1, False), (1, True), (0.3, False), (1, True), (1, False)])
+    assert len(detect_speech(audio, min_silence_ms=600)) == 1
+
+
+def test_padding_stays_inside_audio():
+    audio = make_audio([(1, True), (1, False)])
+    spans = detect_speech(audio, pad_ms=500)
+    assert spans[0][0] == 0
+    assert spans[-1][1] <= len(audio)
+
+
+@pytest.mark.parametrize("audio", [
+    np.zeros(0, dtype=np.float32),
+    np.zeros(SAMPLE_RATE * 2, dtype=np.float32),
+    make_audio([(3, False)]),
+])
+def test_no_speech(audio):
+    assert detect_speech(audio) == []
+
+
+def test_concat_spans_timeline():
+    audio = np.arange(10 * SAMPLE_RATE, dtype=np.float32)
+    speech, timeline = concat_spans(audio, [(SAMPLE_RATE, 3 * SAMPLE_RATE), (6 * SAMPLE_RATE, 7 * SAMPLE_RATE)])
+    assert len(speech) == 3 * SAMPLE_RATE
+    assert speech[2 * SAMPLE_RATE] == audio[6 * SAMPLE_RATE]
+    assert timeline == [(0.0, 1.0, 2.0), (2.0, 6.0, 1.0)]
+
+
+TIMELINE = [(0.0, 1.0, 2.0), (2.0, 6.0, 1.0), (3.0, 10.0, 4.0)]
+
+
+@pytest.mark.parametrize("t, is_end, expected", [
+    (0.0, False, 1.0),
+    (1.5, False, 2.5),
+    (2.5, False, 6.5),
+    (6.0, False, 13.0),
+    # En la unión de dos tramos, un inicio pertenece al siguiente y un final al anterior
+    (2.0, False, 6.0),
+    (2.0, True, 3.0),
+    # Más allá del final se recorta al último tramo
+    (9.0, True, 14.0),
+])
+def test_to_original_time(t, is_end, expected):
+    assert to_original_time(t, TIMELINE, is_end=is_end) == pytest.approx(expected)
+
+
+def test_remap_segments():
+    segments = [
+        {"id": 0, "start": 0.5, "end": 2.0, "text": "hola"},
+        {"id": 1, "start": 2.0, "end": 3.5, "text": "mundo"},
+    ]
+    remapped = remap_segments(segments, TIMELINE)
+    assert [(seg["start"], seg["end"]) for seg in remapped] == [(1.5, 3.0), (6.0, 10.5)]
+    assert [seg["text"] for seg in remapped] == ["hola", "mundo"]
+    # Los segmentos originales no se modifican
+    assert segments[0]["start"] == 0.5
@@ -0,0 +1,238 @@
+"""
+Almacén de archivos subidos
+Los archivos se guardan en UPLOAD_DIR con su hash SHA256 como nombre, de modo que
+subir dos veces la misma grabación no ocupa espacio extra. Las subidas por partes
+(estilo tus: se crea la subida y se envían bloques indicando su offset) se pueden
+retomar tras un corte desde el último byte recibido.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import aiofiles
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# file_id de un archivo subido: el SHA256 de su contenido y la extensión
+FILE_ID_PATTERN = re.compile(r"^([0-9a-f]{64})\.\w+$")
+
+
+class UploadNotFoundError(Exception):
+    """La subida no existe o ya caducó"""
+
+
+class UploadOffsetError(Exception):
+    """El bloque no empieza en el offset actual de la subida"""
+
+    def __init__(self, expected: int):
+        super().__init__(f"Offset incorrecto, se esperaba {expected}")
+        self.expected = expected
+
+
+class UploadTooLargeError(Exception):
+    """La subida supera el tamaño declarado o el máximo permitido"""
+
+
+class UploadChecksumError(Exception):
+    """El contenido recibido no coincide con el SHA256 declarado"""
+
+
+def file_sha256(path: Path) -> str:
+    hash_sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            hash_sha256.update(chunk)
+    return hash_sha256.hexdigest()
+
+
+class UploadStore:
+    """
+    Archivos subidos direccionados por contenido y subidas por partes en curso.
+
+    Cada subida en curso son dos archivos en upload_dir/.partial: los datos
+    recibidos (su tamaño es el offset actual) y un JSON con el nombre, el tamaño
+    total y, opcionalmente, el SHA256 esperado. Así las subidas sobreviven a un
+    reinicio del servidor. Las que no reciben datos en expire_seconds se borran.
+    """
+
+    def __init__(self, upload_dir: Path, max_size: int, expire_seconds: float = 24 * 3600):
+        self.upload_dir = Path(upload_dir)
+        self.partial_dir = self.upload_dir / ".partial"
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.expire_seconds = expire_seconds
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    # Archivos completos
+    def file_id_for(self, sha256: str, suffix: str) -> str:
+        return f"{sha256}{suffix.lower()}"
+
+    @staticmethod
+    def sha256_of(file_id: str) -> Optional[str]:
+        """SHA256 del contenido de un archivo subido, que forma parte de su file_id"""
+        match = FILE_ID_PATTERN.fullmatch(file_id)
+        return match.group(1) if match else None
+
+    def find(self, sha256: str, suffix: str) -> Optional[str]:
+        """file_id de un archivo ya subido con ese contenido, o None"""
+        file_id = self.file_id_for(sha256, suffix)
+        return file_id if (self.upload_dir / file_id).exists() else None
+
+    def path_of(self, file_id: str) -> Optional[Path]:
+        """Ruta de un archivo subido, o None si el file_id no es válido o no existe"""
+        # El file_id llega del cliente: nada que no sea "<sha256>.<ext>" se une a upload_dir
+        if self.sha256_of(file_id) is None:
+            return None
+        path = self.upload_dir / file_id
+        return path if path.exists() else None
+
+    def commit(self, path: Path, sha256: str, suffix: str) -> Tuple[str, bool]:
+        """
+        Mueve un archivo recibido a su nombre definitivo.
+
+        Returns:
+            Tupla (file_id, si ya existía y se descartó la copia nueva)
+        """
+        file_id = self.file_id_for(sha256, suffix)
+        dest = self.upload_dir / file_id
+        if dest.exists():
+            path.unlink()
+            return file_id, True
+        os.replace(path, dest)
+        return file_id, False
+
+    # Subidas por partes
+    def create(self, filename: str, size: int, sha256: Optional[str] = None) -> dict:
+        """Registra una subida nueva y devuelve su estado"""
+        if size <= 0:
+            raise ValueError("El tamaño de la subida debe ser mayor que 0")
+        if size > self.max_size:
+            raise UploadTooLargeError(f"Archivo demasiado grande. Máximo permitido: {self.max_size} bytes")
+        upload_id = uuid.uuid4().hex
+        meta = {
+            "upload_id": upload_id,
+            "filename": filename,
+            "suffix": Path(filename).suffix.lower(),
+            "size": size,
+            "sha256": sha256.lower() if sha256 else None,
+            "created_at": time.time(),
+        }
+        self._data_path(upload_id).touch()
+        self._meta_path(upload_id).write_text(json.dumps(meta), encoding="utf-8")
+        return {**meta, "offset": 0}
+
+    def get(self, upload_id: str) -> dict:
+        """Estado de una subida: metadatos y offset (bytes recibidos)"""
+        meta_path = self._meta_path(upload_id)
+        data_path = self._data_path(upload_id)
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            offset = data_path.stat().st_size
+        except (OSError, ValueError):
+            raise UploadNotFoundError(f"Subida no encontrada: {upload_id}")
+        return {**meta, "offset": offset}
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> int:
+        """
+        Añade al final de la subida los bytes recibidos, que deben empezar en `offset`.
+
+        Si la conexión se corta a mitad, lo ya escrito se conserva y el cliente
+        continúa desde el nuevo offset. Devuelve el offset tras escribir.
+        """
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            state = self.get(upload_id)
+            if offset != state["offset"]:
+                raise UploadOffsetError(state["offset"])
+
+            position = offset
+            async with aiofiles.open(self._data_path(upload_id), "ab") as out_file:
+                async for chunk in chunks:
+                    if position + len(chunk) > state["size"]:
+                        raise UploadTooLargeError("Los datos superan el tamaño declarado de la subida")
+                    await out_file.write(chunk)
+                    position += len(chunk)
+            return position
+
+    async def finish(self, upload_id: str) -> Tuple[str, bool]:
+        """
+        Verifica una subida completa y la mueve a su nombre definitivo.
+
+        Toma el mismo lock que append(): dos peticiones que entregan el último bloque
+        no verifican ni mueven el archivo a la vez (la segunda no encuentra la subida).
+
+        Returns:
+            Tupla (file_id, si el contenido ya existía)
+        """
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            # El SHA256 del archivo completo se calcula fuera del event loop
+            result = await asyncio.get_running_loop().run_in_executor(None, self._finish, upload_id)
+        self._locks.pop(upload_id, None)
+        return result
+
+    def _finish(self, upload_id: str) -> Tuple[str, bool]:
+        state = self.get(upload_id)
+        data_path = self._data_path(upload_id)
+        sha256 = file_sha256(data_path)
+        if state["sha256"] and state["sha256"] != sha256:
+            self.abort(upload_id)
+            raise UploadChecksumError("El SHA256 del archivo recibido no coincide con el declarado")
+
+        result = self.commit(data_path, sha256, state["suffix"])
+        self._meta_path(upload_id).unlink(missing_ok=True)
+        return result
+
+    def abort(self, upload_id: str):
+        """Cancela una subida y borra lo recibido"""
+        self._data_path(upload_id).unlink(missing_ok=True)
+        self._meta_path(upload_id).unlink(missing_ok=True)
+        self._locks.pop(upload_id, None)
+
+    def cleanup_expired(self) -> int:
+        """
+        Borra las subidas sin actividad desde hace expire_seconds, y los temporales de
+        subidas directas (direct_*) que quedaron de una petición cortada; devuelve cuántas
+        """
+        if not self.expire_seconds:
+            return 0
+        now = time.time()
+        removed = 0
+        for meta_path in self.partial_dir.glob("*.json"):
+            upload_id = meta_path.stem
+            data_path = self._data_path(upload_id)
+            try:
+                last_activity = max(meta_path.stat().st_mtime, data_path.stat().st_mtime)
+            except OSError:
+                last_activity = 0
+            if now - last_activity > self.expire_seconds:
+                self.abort(upload_id)
+                removed += 1
+        for temp_path in self.partial_dir.glob("direct_*"):
+            try:
+                if now - temp_path.stat().st_mtime > self.expire_seconds:
+                    temp_path.unlink()
+                    removed += 1
+            except OSError:
+                pass
+        if removed:
+            logger.info(f"Subidas caducadas eliminadas: {removed}")
+        return removed
+
+    def _data_path(self, upload_id: str) -> Path:
+        # El id lo genera el servidor: rechazar cualquier cosa que no sea hexadecimal
+        if not upload_id.isalnum():
+            raise UploadNotFoundError(f"Subida no encontrada: {upload_id}")
+        return self.partial_dir / f"{upload_id}.part"
+
+    def _meta_path(self, upload_id: str) -> Path:
+        return self._data_path(upload_id).with_suffix(".json")
@@ -0,0 +1,135 @@
+"""
+Detección de actividad de voz (VAD) por energía
+Localiza los tramos con voz de un audio PCM mono para no enviar silencio a Whisper,
+y permite traducir los tiempos del audio recortado a la línea de tiempo original.
+"""
+
+from bisect import bisect_right
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+# Un tramo del audio recortado: (inicio en el audio recortado, inicio en el original, duración), en segundos
+TimelineSpan = Tuple[float, float, float]
+
+
+def frame_energy_db(audio: np.ndarray, frame_samples: int) -> np.ndarray:
+    """Energía RMS en dB de cada trama (sin solapamiento) del audio"""
+    n_frames = len(audio) // frame_samples
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[:n_frames * frame_samples].reshape(n_frames, frame_samples)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+    return 20 * np.log10(rms + 1e-10)
+
+
+def detect_speech(
+    audio: np.ndarray,
+    sample_rate: int = SAMPLE_RATE,
+    frame_ms: int = 30,
+    threshold_db: float = -45.0,
+    margin_db: float = 12.0,
+    min_speech_ms: int = 250,
+    min_silence_ms: int = 600,
+    pad_ms: int = 200
+) -> List[Tuple[int, int]]:
+    """
+    Devuelve los tramos con voz como lista de (muestra_inicio, muestra_fin).
+
+    Una trama es voz si su energía supera tanto threshold_db como el ruido de fondo
+    estimado (percentil 10) más margin_db. Los huecos menores que min_silence_ms
+    se unen, los tramos menores que min_speech_ms se descartan y cada tramo se
+    amplía pad_ms por ambos lados para no cortar el inicio o el final de las palabras.
+    """
+    frame_samples = int(sample_rate * frame_ms / 1000)
+    energy = frame_energy_db(audio, frame_samples)
+    if len(energy) == 0:
+        return []
+
+    noise_floor = float(np.percentile(energy, 10))
+    is_speech = energy > max(threshold_db, noise_floor + margin_db)
+    if not is_speech.any():
+        return []
+
+    # Bordes de las rachas de tramas con voz
+    padded = np.concatenate(([False], is_speech, [False]))
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    runs = list(zip(changes[::2], changes[1::2]))
+
+    min_silence_frames = max(1, min_silence_ms // frame_ms)
+    merged = [list(runs[0])]
+    for start, end in runs[1:]:
+        if start - merged[-1][1] < min_silence_frames:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+
+    min_speech_frames = max(1, min_speech_ms // frame_ms)
+    pad = int(sample_rate * pad_ms / 1000)
+    spans = []
+    for start, end in merged:
+        if end - start < min_speech_frames:
+            continue
+        span_start = max(0, start * frame_samples - pad)
+        span_end = min(len(audio), end * frame_samples + pad)
+        if spans and span_start <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], span_end)
+        else:
+            spans.append((span_start, span_end))
+    return spans
+
+
+def concat_spans(
+    audio: np.ndarray,
+    spans: List[Tuple[int, int]],
+    sample_rate: int = SAMPLE_RATE
+) -> Tuple[np.ndarray, List[TimelineSpan]]:
+    """Une los tramos con voz en un único array y devuelve la correspondencia de tiempos"""
+    timeline = []
+    position = 0
+    for start, end in spans:
+        timeline.append((position / sample_rate, start / sample_rate, (end - start) / sample_rate))
+        position += end - start
+    speech = np.concatenate([audio[start:end] for start, end in spans])
+    return speech, timeline
+
+
+def timeline_starts(timeline: List[TimelineSpan]) -> List[float]:
+    """Inicios de cada tramo en el audio recortado, para buscarlos con bisect"""
+    return [span[0] for span in timeline]
+
+
+def to_original_time(
+    t: float,
+    timeline: List[TimelineSpan],
+    is_end: bool = False,
+    starts: Optional[List[float]] = None
+) -> float:
+    """
+    Traduce un tiempo del audio recortado a la línea de tiempo original. Para
+    traducir muchos tiempos, pasar starts = timeline_starts(timeline) calculado una vez.
+    """
+    if starts is None:
+        starts = timeline_starts(timeline)
+    index = bisect_right(starts, t) - 1
+    # Un final que cae justo en la unión de dos tramos pertenece al tramo anterior
+    if is_end and index > 0 and t == starts[index]:
+        index -= 1
+    index = max(0, index)
+    cut_start, original_start, length = timeline[index]
+    return original_start + min(max(t - cut_start, 0.0), length)
+
+
+def remap_segments(segments: List[dict], timeline: List[TimelineSpan]) -> List[dict]:
+    """Devuelve los segmentos con start/end en la línea de tiempo original"""
+    starts = timeline_starts(timeline)
+    return [
+        {
+            **seg,
+            "start": to_original_time(seg["start"], timeline, starts=starts),
+            "end": to_original_time(seg["end"], timeline, is_end=True, starts=starts),
+        }
+        for seg in segments
+    ]
@@ -0,0 +1,182 @@
+"""
+Pool de procesos de inferencia
+Cada proceso ejecuta model.transcribe con un número fijo de hilos de torch, evitando
+el GIL y la contención de hilos de un único proceso. Los pesos del modelo por defecto
+se cargan una vez en el proceso principal y se comparten con los trabajadores si el
+motor de inferencia lo permite (torch float32); con torch-int8 y ctranslate2 cada
+trabajador carga el suyo.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+
+from inference import SAMPLE_RATE, detect_language, transcribe_array, transcribe_batch
+
+logger = logging.getLogger(__name__)
+
+# Estado de cada proceso trabajador
+_worker_registry = None
+
+
+def _init_worker(
+    model,
+    model_name: str,
+    backend_name: str,
+    torch_threads: int,
+    model_memory_budget: int,
+    model_idle_seconds: float
+):
+    """Inicializador de cada proceso: fija los hilos de torch y registra el modelo compartido"""
+    global _worker_registry
+    import torch
+    from backends import set_backend
+    from model_registry import ModelRegistry
+
+    torch.set_num_threads(torch_threads)
+    # Un solo hilo inter-op: el paralelismo viene de tener varios procesos
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    backend = set_backend(backend_name, torch_threads)
+    # El modelo por defecto es el compartido; otros modelos se cargan en el proceso bajo demanda
+    _worker_registry = ModelRegistry(
+        backend.load,
+        max_bytes=model_memory_budget,
+        idle_seconds=model_idle_seconds,
+        pinned={model_name},
+        size_of=backend.model_bytes
+    )
+    if model is not None:
+        _worker_registry.add(model_name, model)
+    else:
+        # Motor sin memoria compartida: cargar el modelo ya, no en la primera petición
+        with _worker_registry.acquire(model_name):
+            pass
+    warnings.filterwarnings("ignore", message="FP16 is not supported on CPU")
+
+
+def _warmup(_=None) -> int:
+    return os.getpid()
+
+
+def _load_pcm_slice(pcm_path: str, start: int, end: int) -> np.ndarray:
+    # El PCM se mapea en memoria: solo se leen las muestras de la ventana
+    return np.ascontiguousarray(np.load(pcm_path, mmap_mode="r")[start:end])
+
+
+def transcribe_window_in_worker(
+    pcm_path: str,
+    start: int,
+    end: int,
+    model_name: str,
+    transcribe_options: dict
+) -> dict:
+    """Transcribe las muestras [start, end) de un archivo PCM .npy en el proceso trabajador"""
+    audio = _load_pcm_slice(pcm_path, start, end)
+    with _worker_registry.acquire(model_name) as loaded:
+        result = transcribe_array(loaded.model, audio, transcribe_options)
+    _worker_registry.unload_idle()
+    return result
+
+
+def transcribe_batch_in_worker(audios: List[np.ndarray], model_name: str, transcribe_options: dict) -> List[dict]:
+    """Transcribe un micro-lote de audios cortos en una sola pasada en el proceso trabajador"""
+    with _worker_registry.acquire(model_name) as loaded:
+        results = transcribe_batch(loaded.model, audios, transcribe_options)
+    _worker_registry.unload_idle()
+    return results
+
+
+def detect_language_in_worker(pcm_path: str, model_name: str) -> str:
+    """Detecta el idioma del inicio de un archivo PCM .npy en el proceso trabajador"""
+    audio = _load_pcm_slice(pcm_path, 0, 30 * SAMPLE_RATE)
+    with _worker_registry.acquire(model_name) as loaded:
+        return detect_language(loaded.model, audio)
+
+
+class InferencePool:
+    """
+    Pool de N procesos de inferencia que comparten los pesos de un modelo Whisper.
+
+    Los tensores del modelo se mueven a memoria compartida antes de crear los
+    procesos y los trabajadores reciben manejadores de esa misma memoria, de modo que
+    N trabajadores no cuestan N veces la RAM del modelo. Con motores cuyos modelos no
+    se pueden compartir, cada trabajador carga el modelo al arrancar.
+
+    El pool se arranca desde un hilo del servidor, que ya tiene otros hilos en marcha:
+    un fork copiaría los locks que esos hilos tengan tomados y el proceso hijo podría
+    bloquearse. Por eso por defecto se usa "forkserver" (los procesos se crean a partir
+    de un proceso limpio) o "spawn" donde no existe.
+    """
+
+    def __init__(
+        self,
+        model,
+        model_name: str,
+        backend,
+        processes: int,
+        torch_threads: int,
+        model_memory_budget: int,
+        model_idle_seconds: float,
+        start_method: Optional[str] = None
+    ):
+        self.model = model
+        self.model_name = model_name
+        self.backend = backend
+        self.model_memory_budget = model_memory_budget
+        self.model_idle_seconds = model_idle_seconds
+        self.processes = max(1, processes)
+        self.torch_threads = max(1, torch_threads)
+        self.start_method = start_method or (
+            "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        )
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        """Crea los procesos trabajadores (llamar antes de que el servidor reciba carga)"""
+        if self.executor is not None:
+            return
+        import torch.multiprocessing as torch_mp
+
+        if self.start_method == "fork" and threading.active_count() > 1:
+            logger.warning(
+                "Pool de inferencia con fork desde un proceso con varios hilos: "
+                "un trabajador puede quedar bloqueado (usa forkserver o spawn)"
+            )
+        shared_model = None
+        if self.backend.shares_memory:
+            self.backend.share_memory(self.model)
+            shared_model = self.model
+        context = torch_mp.get_context(self.start_method)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(
+                shared_model,
+                self.model_name,
+                self.backend.name,
+                self.torch_threads,
+                self.model_memory_budget,
+                self.model_idle_seconds
+            )
+        )
+        # Forzar la creación de todos los procesos ahora y no en la primera petición
+        list(self.executor.map(_warmup, range(self.processes)))
+        logger.info(
+            f"Pool de inferencia iniciado: {self.processes} procesos ({self.start_method}), "
+            f"{self.torch_threads} hilos de torch cada uno"
+        )
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None